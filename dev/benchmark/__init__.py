@@ -0,0 +1,10 @@
+"""
+The functions in this module are for benchmarking dnppy, timing a fixed set
+of its most computationally intensive functions on synthetic data, so that
+performance regressions are caught before a new version is released.
+"""
+
+__author__ = 'jwely'
+
+from build_bench_env import *
+from run_benchmarks import *
@@ -0,0 +1,176 @@
+__author__ = 'jwely'
+
+import os
+import json
+import numpy
+from datetime import datetime, timedelta
+
+
+# parameters of the default set of synthetic fixtures
+FIXTURE_PARAMS = {"raster_size":    512,            # rows and columns of each GeoTIFF
+                  "raster_count":   12,             # number of GeoTIFFs in the daily stack
+                  "csv_hours":      3 * 365 * 24,   # rows in the hourly time series csv
+                  "hdf_shape":      [3600, 1800],   # shape of each layer in the GPM like HDF5
+                  "nongrid_points": 200,            # points along each side of the swath
+                  "seed":           0}
+
+NoData_Value = -9999
+
+
+def build_bench_env(bench_dir, **params):
+    """
+    Builds a set of synthetic fixtures for benchmarking dnppy, so timings
+    do not depend on downloads or on data that changes over time. Fixtures
+    are only rebuilt if they are missing or were built with other parameters.
+
+    :param bench_dir:   directory in which to build the "fixtures" folder
+    :param params:      any of the keys in FIXTURE_PARAMS to override defaults
+
+    :return fixtures:   dict of fixture filepaths and the parameters used to build them
+    """
+
+    fixture_params = dict(FIXTURE_PARAMS)
+    fixture_params.update(params)
+
+    fixture_dir = os.path.join(bench_dir, "fixtures")
+    manifest    = os.path.join(fixture_dir, "fixtures.json")
+
+    if os.path.exists(manifest):
+        with open(manifest, "r") as f:
+            fixtures = json.load(f)
+        if fixtures["params"] == json.loads(json.dumps(fixture_params)):
+            return fixtures
+
+    print("Building benchmark fixtures in '{0}'".format(fixture_dir))
+    if not os.path.exists(fixture_dir):
+        os.makedirs(fixture_dir)
+
+    numpy.random.seed(fixture_params["seed"])
+
+    fixtures = {"params": fixture_params}
+    fixtures.update(_build_rasters(fixture_dir, fixture_params))
+    fixtures["csv"]     = _build_csv(fixture_dir, fixture_params)
+    fixtures["hdf5"]    = _build_hdf5(fixture_dir, fixture_params)
+    fixtures["nongrid"] = _build_nongrid(fixture_dir, fixture_params)
+
+    with open(manifest, "w") as f:
+        json.dump(fixtures, f, indent = 4)
+
+    return fixtures
+
+
+def _build_rasters(fixture_dir, params):
+    """
+    Writes a stack of daily temperature like GeoTIFFs with random NoData voids,
+    and a pair of daily maximum and minimum temperature GeoTIFFs.
+    """
+
+    import gdal
+    import osr
+
+    size = params["raster_size"]
+    raster_dir = os.path.join(fixture_dir, "rasters")
+    if not os.path.exists(raster_dir):
+        os.makedirs(raster_dir)
+
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    projection   = srs.ExportToWkt()
+    geotransform = (-77.0, 0.01, 0.0, 38.0, 0.0, -0.01)
+
+    def write(outpath, numpy_rast):
+        gtiff = gdal.GetDriverByName("GTiff")
+        outdata = gtiff.Create(outpath, size, size, 1, gdal.GDT_Float32, ["TILED=YES"])
+        outdata.SetGeoTransform(geotransform)
+        outdata.SetProjection(projection)
+        outband = outdata.GetRasterBand(1)
+        outband.SetNoDataValue(NoData_Value)
+        outband.WriteArray(numpy_rast.astype("float32"))
+        outband.FlushCache()
+        del outband, outdata
+        return outpath
+
+    # smooth spatial pattern plus noise, so statistics are not trivial
+    y, x = numpy.mgrid[0:size, 0:size] / float(size)
+    pattern = 10 * numpy.sin(2 * numpy.pi * x) * numpy.cos(2 * numpy.pi * y)
+
+    stack = []
+    start = datetime(2015, 1, 1)
+    for i in range(params["raster_count"]):
+        numpy_rast = 15 + pattern + 5 * numpy.random.randn(size, size)
+        numpy_rast[numpy.random.rand(size, size) < 0.2] = NoData_Value
+
+        name = "temp_{0}.tif".format((start + timedelta(days = i)).strftime("%Y%j"))
+        stack.append(write(os.path.join(raster_dir, name), numpy_rast))
+
+    tmax = write(os.path.join(raster_dir, "tmax.tif"), 25 + pattern + 3 * numpy.random.randn(size, size))
+    tmin = write(os.path.join(raster_dir, "tmin.tif"), 5 + pattern + 3 * numpy.random.randn(size, size))
+
+    return {"raster_stack": stack, "tmax": tmax, "tmin": tmin}
+
+
+def _build_csv(fixture_dir, params):
+    """
+    Writes an hourly weather station like csv with a time column and two data columns
+    """
+
+    csv_path = os.path.join(fixture_dir, "hourly.csv")
+    start = datetime(2010, 1, 1)
+
+    with open(csv_path, "w") as f:
+        f.write("datetime,temp,rh\n")
+        for hour in range(params["csv_hours"]):
+            time_str = (start + timedelta(hours = hour)).strftime("%Y%m%d%H%M")
+            f.write("{0},{1:.2f},{2:.1f}\n".format(time_str,
+                    15 + 10 * numpy.sin(2 * numpy.pi * hour / 24.0) + numpy.random.randn(),
+                    numpy.random.uniform(20, 100)))
+
+    return csv_path
+
+
+def _build_hdf5(fixture_dir, params):
+    """
+    Writes an HDF5 file laid out like a GPM IMERG half hourly file, with chunked and
+    compressed layers in a "Grid" group.
+    """
+
+    import h5py
+
+    hdf_path = os.path.join(fixture_dir, "3B-HHR-L.MS.MRG.3IMERG.20150401-S000000-E002959.0000.V03E.RT-H5")
+    shape = tuple(params["hdf_shape"])
+
+    with h5py.File(hdf_path, "w") as hdf:
+        grid = hdf.create_group("Grid")
+        grid.create_dataset("HQobservationTime", data = numpy.random.randint(0, 30, shape).astype("int16"),
+                            chunks = True, compression = "gzip")
+        grid.create_dataset("HQprecipitation", data = numpy.random.exponential(1, shape).astype("float32"),
+                            chunks = True, compression = "gzip")
+        grid.create_dataset("precipitationCal", data = numpy.random.exponential(1, shape).astype("float32"),
+                            chunks = True, compression = "gzip")
+        grid.create_dataset("precipitationUncal", data = numpy.random.exponential(1, shape).astype("float32"),
+                            chunks = True, compression = "gzip")
+
+    return hdf_path
+
+
+def _build_nongrid(fixture_dir, params):
+    """
+    Saves lat, lon and data arrays of a curved, swath like set of points to an npz file.
+    The swath is about one degree across, so it may be gridded at 100m resolution.
+    """
+
+    n = params["nongrid_points"]
+    j, i = numpy.mgrid[0:n, 0:n] / float(n)
+
+    lat  = 37.0 + i + 0.05 * numpy.sin(numpy.pi * j) + 0.001 * numpy.random.randn(n, n)
+    lon  = -77.0 + j + 0.1 * i + 0.001 * numpy.random.randn(n, n)
+    data = numpy.sin(4 * lat) * numpy.cos(4 * lon) + 0.1 * numpy.random.randn(n, n)
+
+    npz_path = os.path.join(fixture_dir, "nongrid.npz")
+    numpy.savez(npz_path, lat = lat, lon = lon, data = data)
+
+    return npz_path
+
+
+if __name__ == "__main__":
+    build_bench_env(r"C:\Users\jwely\Desktop\dnppybench")
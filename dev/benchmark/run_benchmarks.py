@@ -0,0 +1,392 @@
+__author__ = 'jwely'
+
+import os
+import sys
+import json
+import Queue
+import shutil
+import platform
+import multiprocessing
+from datetime import datetime
+from timeit import default_timer
+
+from build_bench_env import build_bench_env
+
+
+# fractional increase over the baseline in time or peak memory that counts as a regression
+TOLERANCE = 0.25
+
+# seconds that one run of a benchmark may take before it is stopped and recorded as failed
+TIMEOUT = 1800
+
+# seconds between checks that a benchmark process is still running
+POLL_SECONDS = 1
+
+
+def run_benchmarks(bench_dir, names = None, repeat = 3, baseline = None,
+                   save_baseline = False, tolerance = TOLERANCE, timeout = TIMEOUT, **params):
+    """
+    Times a fixed set of dnppy hot paths on synthetic fixtures and records
+    the wall time and peak memory of each one to a json file.
+
+    Each benchmark runs in its own fresh process, so the peak memory of one does not
+    hide that of another, and only the operation itself is timed, not the loading of
+    its inputs. The best of ``repeat`` runs is kept. If a baseline json from an earlier
+    run exists, results are compared against it and any benchmark that got slower or
+    used more memory by more than ``tolerance`` is reported as a regression. A benchmark
+    that fails, crashes its process, or runs longer than ``timeout`` is recorded with
+    its "error" and reported, without stopping the others.
+
+    :param bench_dir:       directory for fixtures, scratch outputs and json results
+    :param names:           list of benchmark names to run, defaults to all of BENCHMARKS
+    :param repeat:          number of times to run each benchmark
+    :param baseline:        filepath to a baseline json, defaults to "baseline.json"
+                            in bench_dir
+    :param save_baseline:   set True to save these results as the new baseline
+    :param tolerance:       fractional increase allowed before reporting a regression
+    :param timeout:         seconds one run of a benchmark may take before it is stopped
+    :param params:          any fixture parameters to override, see ``build_bench_env``
+
+    :return results:        dict of results, including a list of any "regressions"
+    """
+
+    fixtures = build_bench_env(bench_dir, **params)
+
+    if names is None:
+        names = [name for name, setup in BENCHMARKS]
+    setups = dict(BENCHMARKS)
+
+    results = {"created":       datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+               "dnppy_version": _dnppy_version(),
+               "python":        platform.python_version(),
+               "platform":      platform.platform(),
+               "cpu_count":     multiprocessing.cpu_count(),
+               "fixtures":      fixtures["params"],
+               "benchmarks":    {}}
+
+    for name in names:
+        if name not in setups:
+            raise Exception("Unknown benchmark '{0}', use one of {1}".format(
+                name, [bench_name for bench_name, setup in BENCHMARKS]))
+
+        runs = [_run_in_process(name, fixtures, bench_dir, timeout) for i in range(repeat)]
+        errors = [run["error"] for run in runs if "error" in run]
+
+        # a failed benchmark is recorded with its error, and the rest of the suite still runs
+        if errors:
+            results["benchmarks"][name] = {"seconds": None, "peak_mb": None,
+                                           "repeat": repeat, "error": errors[0]}
+            print("{0:<28} FAILED {1}".format(name, errors[0]))
+            continue
+
+        results["benchmarks"][name] = {"seconds":   min(run["seconds"] for run in runs),
+                                       "peak_mb":   _max_or_none([run["peak_mb"] for run in runs]),
+                                       "repeat":    repeat}
+
+        print("{0:<28} {1:>9.3f} s {2:>10} MB".format(name,
+              results["benchmarks"][name]["seconds"], results["benchmarks"][name]["peak_mb"]))
+
+    if baseline is None:
+        baseline = os.path.join(bench_dir, "baseline.json")
+
+    if os.path.exists(baseline) and not save_baseline:
+        with open(baseline, "r") as f:
+            results["regressions"] = compare_benchmarks(results, json.load(f), tolerance)
+
+        for regression in results["regressions"]:
+            print("REGRESSION: {0}".format(regression))
+    else:
+        results["regressions"] = []
+
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    with open(os.path.join(bench_dir, "results_{0}.json".format(stamp)), "w") as f:
+        json.dump(results, f, indent = 4, sort_keys = True)
+
+    if save_baseline:
+        with open(baseline, "w") as f:
+            json.dump(results, f, indent = 4, sort_keys = True)
+        print("Saved baseline '{0}'".format(baseline))
+
+    return results
+
+
+def compare_benchmarks(results, baseline, tolerance = TOLERANCE):
+    """
+    Compares two sets of benchmark results
+
+    :param results:     dict of results as returned by ``run_benchmarks``
+    :param baseline:    dict of results from an earlier run
+    :param tolerance:   fractional increase allowed before reporting a regression
+
+    :return regressions: list of strings describing each regression
+    """
+
+    regressions = []
+
+    if results["fixtures"] != baseline["fixtures"]:
+        regressions.append("fixture parameters differ from the baseline, results are not comparable")
+        return regressions
+
+    for name, result in sorted(results["benchmarks"].items()):
+        if name not in baseline["benchmarks"]:
+            continue
+        base = baseline["benchmarks"][name]
+
+        if result.get("error"):
+            if not base.get("error"):
+                regressions.append("{0} failed with {1}".format(name, result["error"]))
+            continue
+
+        for key, units in [("seconds", "s"), ("peak_mb", "MB")]:
+            if result[key] is None or not base[key]:
+                continue
+            if result[key] > base[key] * (1 + tolerance):
+                regressions.append("{0} {1} went from {2:.3f}{4} to {3:.3f}{4}".format(
+                    name, key, base[key], result[key], units))
+
+    return regressions
+
+
+def _run_in_process(name, fixtures, bench_dir, timeout = TIMEOUT):
+    """
+    runs one benchmark in a fresh process and returns its timing and memory,
+    or a dict with the "error" it failed with. A process that exits without a
+    result (such as one killed for running out of memory), or that is still
+    running after ``timeout`` seconds, is recorded as an error.
+    """
+
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target = _run_one, args = (name, fixtures, bench_dir, queue))
+    process.start()
+    start = default_timer()
+
+    while True:
+        try:
+            result = queue.get(timeout = POLL_SECONDS)
+            break
+        except Queue.Empty:
+            pass
+
+        if not process.is_alive():
+            # the result may have arrived just before the process exited
+            try:
+                result = queue.get(timeout = POLL_SECONDS)
+            except Queue.Empty:
+                result = {"error": "process exited with code {0} without a result".format(process.exitcode)}
+            break
+
+        if default_timer() - start > timeout:
+            process.terminate()
+            result = {"error": "timed out after {0} seconds".format(timeout)}
+            break
+
+    process.join()
+    if process.exitcode and "error" not in result:
+        result = {"error": "process exited with code {0}".format(process.exitcode)}
+    return result
+
+
+def _run_one(name, fixtures, bench_dir, queue):
+    """ sets up and times one benchmark within a worker process """
+
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+
+        workdir = os.path.join(bench_dir, "scratch", name)
+        if os.path.exists(workdir):
+            shutil.rmtree(workdir)
+        os.makedirs(workdir)
+
+        operation = dict(BENCHMARKS)[name](fixtures, workdir)
+
+        start = default_timer()
+        operation()
+        seconds = default_timer() - start
+
+        queue.put({"seconds": seconds, "peak_mb": _peak_mb()})
+
+    except Exception as e:
+        queue.put({"error": "{0}: {1}".format(type(e).__name__, e)})
+
+
+def _peak_mb():
+    """ peak resident memory of this process in MB, or None where it cannot be found """
+
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # linux reports kilobytes, mac reports bytes
+        if sys.platform == "darwin":
+            return round(peak / 1048576.0, 1)
+        return round(peak / 1024.0, 1)
+
+    except ImportError:
+        try:
+            import psutil
+            return round(psutil.Process().memory_info().peak_wset / 1048576.0, 1)
+        except (ImportError, AttributeError):
+            return None
+
+
+def _max_or_none(values):
+    values = [value for value in values if value is not None]
+    if values:
+        return max(values)
+    return None
+
+
+def _dnppy_version():
+    import dnppy
+    return getattr(dnppy, "__version__", None)
+
+
+# Each benchmark setup takes the fixtures dict and a scratch directory, loads whatever
+# inputs it needs, and returns a function with no arguments that performs the timed work.
+
+def _bench_many_stats(fixtures, workdir):
+    from dnppy import raster
+    raster.set_io_backend("gdal")
+    return lambda: raster.many_stats(fixtures["raster_stack"], workdir, "bench",
+                                     saves = ["AVG", "STD", "NUM", "SUM", "MIN", "MAX"])
+
+
+def _bench_many_stats_workers(fixtures, workdir):
+    from dnppy import raster
+    raster.set_io_backend("gdal")
+    return lambda: raster.many_stats(fixtures["raster_stack"], workdir, "bench",
+                                     saves = ["AVG", "STD", "NUM", "SUM", "MIN", "MAX"],
+                                     workers = max(2, multiprocessing.cpu_count()))
+
+
+def _bench_gap_fill_temporal(fixtures, workdir):
+    from dnppy import raster
+    raster.set_io_backend("gdal")
+    return lambda: raster.gap_fill_temporal(fixtures["raster_stack"], workdir)
+
+
+def _bench_degree_days(fixtures, workdir):
+    from dnppy import raster
+    raster.set_io_backend("gdal")
+    highs, meta = raster.to_numpy(fixtures["tmax"], "float32")
+    lows, meta  = raster.to_numpy(fixtures["tmin"], "float32")
+    highs = highs.filled(-9999)
+    lows  = lows.filled(-9999)
+    return lambda: raster.degree_days(-10, highs, lows, -9999, roof = 30, floor = 0)
+
+
+def _bench_degree_days_accum(fixtures, workdir):
+    from dnppy import raster
+    raster.set_io_backend("gdal")
+    return lambda: raster.degree_days_accum(fixtures["raster_stack"], [50, 100], workdir)
+
+
+def _read_time_series(fixtures):
+    from dnppy import textio
+    from dnppy import tsa
+    tdo = textio.text_data()
+    tdo.read_csv(fixtures["csv"])
+    ts = tsa.time_series("bench")
+    ts.from_tdo(tdo)
+    return ts
+
+
+def _bench_define_time(fixtures, workdir):
+    ts = _read_time_series(fixtures)
+    return lambda: ts.define_time("datetime", "%Y%m%d%H%M")
+
+
+def _bench_make_subsets(fixtures, workdir):
+    ts = _read_time_series(fixtures)
+    ts.define_time("datetime", "%Y%m%d%H%M")
+    return lambda: ts.make_subsets("%d", overlap_width = 1)
+
+
+def _bench_group_bins(fixtures, workdir):
+    ts = _read_time_series(fixtures)
+    ts.define_time("datetime", "%Y%m%d%H%M")
+    return lambda: ts.group_bins("%j", overlap_width = 2)
+
+
+def _solar_grid(fixtures):
+    import numpy
+    size = fixtures["params"]["raster_size"]
+    return numpy.mgrid[38:37:complex(0, size), -77:-76:complex(0, size)]
+
+
+def _bench_solar_grid(fixtures, workdir):
+    from dnppy import solar
+
+    lat, lon = _solar_grid(fixtures)
+
+    def operation():
+        sc = solar.solar(lat, lon, datetime(2015, 5, 15, 12), -4)
+        sc.get_zenith()
+        sc.get_elevation()
+        sc.get_azimuth()
+
+    return operation
+
+
+def _bench_solar_series(fixtures, workdir):
+    from dnppy import solar
+
+    lat, lon = _solar_grid(fixtures)
+    times = [datetime(2015, 5, 15, hour) for hour in range(24)]
+
+    def operation():
+        ss = solar.solar_series(lat, lon, times, -4)
+        for i in range(len(times)):
+            ss.get_zenith(i)
+            ss.get_elevation(i)
+            ss.get_azimuth(i)
+
+    return operation
+
+
+def _bench_sample_by_grid(fixtures, workdir):
+    import numpy
+    from dnppy import convert
+
+    npz = numpy.load(fixtures["nongrid"])
+    ngd = convert.nongrid_data(npz["lat"], npz["lon"], npz["data"], "N")
+    return lambda: ngd.sample_by_grid(100)
+
+
+def _bench_HDF5_to_numpy(fixtures, workdir):
+    from dnppy import convert
+    return lambda: convert.HDF5_to_numpy(fixtures["hdf5"], ["precipitationCal"])
+
+
+# ordered list of (name, setup) for every benchmark
+BENCHMARKS = [("many_stats",              _bench_many_stats),
+              ("many_stats_workers",      _bench_many_stats_workers),
+              ("gap_fill_temporal",       _bench_gap_fill_temporal),
+              ("degree_days",             _bench_degree_days),
+              ("degree_days_accum",       _bench_degree_days_accum),
+              ("tsa_define_time",         _bench_define_time),
+              ("tsa_make_subsets",        _bench_make_subsets),
+              ("tsa_group_bins",          _bench_group_bins),
+              ("solar_grid",              _bench_solar_grid),
+              ("solar_series_24h",        _bench_solar_series),
+              ("nongrid_sample_by_grid",  _bench_sample_by_grid),
+              ("HDF5_to_numpy",           _bench_HDF5_to_numpy)]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description = "Benchmark dnppy hot paths on synthetic data")
+    parser.add_argument("bench_dir", help = "directory for fixtures, outputs and results")
+    parser.add_argument("--names", nargs = "+", default = None, help = "benchmarks to run")
+    parser.add_argument("--repeat", type = int, default = 3, help = "runs of each benchmark")
+    parser.add_argument("--baseline", default = None, help = "baseline json to compare against")
+    parser.add_argument("--save-baseline", action = "store_true", help = "save results as the baseline")
+    parser.add_argument("--tolerance", type = float, default = TOLERANCE, help = "allowed fractional increase")
+    parser.add_argument("--timeout", type = float, default = TIMEOUT, help = "seconds allowed for each run")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.bench_dir, args.names, args.repeat, args.baseline,
+                             args.save_baseline, args.tolerance, args.timeout)
+
+    sys.exit(1 if results["regressions"] else 0)
@@ -0,0 +1,289 @@
+__author__ = 'jwely'
+
+from dnppy.download import download_engine, download_manifest
+
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+import threading
+import shutil
+import socket
+import time
+import os
+
+
+def test_download_engine(test_dir):
+    """
+    tests the download_engine against local stand in servers, so no internet
+    connection is needed:
+        http downloads over pooled connections, within the per host limit
+        ".part" files, renamed into place only once complete
+        resuming an interrupted download with an http range request
+        the download_manifest, and files that changed after download
+        verify passes that cannot reach the server
+        pooled ftp sessions, resuming over ftp, and sessions the server timed out
+
+    The ftp tests require pyftpdlib, and are skipped without it.
+    """
+
+    work_dir = os.path.join(test_dir, "download_engine")
+    if os.path.exists(work_dir):
+        shutil.rmtree(work_dir)
+
+    served_dir = os.path.join(work_dir, "served")
+    os.makedirs(served_dir)
+
+    contents = {}
+    for i in range(12):
+        name = "file_{0:02d}.bin".format(i)
+        contents[name] = os.urandom(200000 + i * 1000)
+        with open(os.path.join(served_dir, name), "wb") as f:
+            f.write(contents[name])
+
+    _test_http(served_dir, os.path.join(work_dir, "http"), contents)
+    _test_ftp(served_dir, os.path.join(work_dir, "ftp"), contents)
+    return
+
+
+def _test_http(served_dir, out_dir, contents):
+    """ tests http downloads from a local server """
+
+    server = _http_server(served_dir)
+    url = "http://127.0.0.1:{0}/".format(server.server_port)
+
+    try:
+        # pooled connections and the per host limit
+        print("testing pooled http downloads with 'download_many'")
+        engine = download_engine(workers = 6, max_per_host = 2, retries = 0)
+        jobs = [(url + name, os.path.join(out_dir, name)) for name in sorted(contents)]
+        failed = engine.download_many(jobs)
+
+        assert failed == [], failed
+        for name in contents:
+            assert _read(os.path.join(out_dir, name)) == contents[name], name
+        assert server.max_active <= 2, "per host limit exceeded, {0} at once".format(server.max_active)
+        assert server.connections <= 2, "{0} connections for 2 workers".format(server.connections)
+        assert not [name for name in os.listdir(out_dir) if name.endswith(".part")]
+
+        # an interrupted download leaves only a ".part" file, which is then resumed
+        print("testing interrupted and resumed http downloads")
+        name    = "file_05.bin"
+        outname = os.path.join(out_dir, "resumed.bin")
+        try:
+            engine.download(url + "cut/" + name, outname)
+            raise AssertionError("a truncated download did not fail")
+        except AssertionError:
+            raise
+        except Exception:
+            pass
+
+        assert not os.path.exists(outname)
+        assert 0 < os.path.getsize(outname + ".part") < len(contents[name])
+
+        del server.ranges[:]
+        engine.download(url + name, outname)
+        assert _read(outname) == contents[name]
+        assert not os.path.exists(outname + ".part")
+        assert server.ranges == ["bytes={0}-".format(len(contents[name]) // 2)], server.ranges
+
+        # the manifest tells complete files from altered ones
+        print("testing the download manifest")
+        manifest = download_manifest(out_dir)
+        assert manifest.is_complete("file_00.bin")
+
+        with open(os.path.join(out_dir, "file_00.bin"), "ab") as f:
+            f.write("extra bytes")
+        assert not manifest.is_complete("file_00.bin")
+
+        del server.ranges[:]
+        engine.download(url + "file_00.bin", os.path.join(out_dir, "file_00.bin"))
+        assert _read(os.path.join(out_dir, "file_00.bin")) == contents["file_00.bin"]
+        assert server.ranges == [], "a file longer than the original was resumed"
+
+        # a verify pass keeps existing files when the server cannot be reached
+        print("testing verify passes without a server")
+        outname = os.path.join(out_dir, "file_01.bin")
+        try:
+            engine.download("http://127.0.0.1:{0}/file_01.bin".format(_unused_port()), outname, verify = True)
+        except Exception:
+            pass
+        assert _read(outname) == contents["file_01.bin"]
+        assert not os.path.exists(outname + ".part")
+
+        engine.close()
+
+    finally:
+        server.shutdown()
+        server.server_close()
+    return
+
+
+def _test_ftp(served_dir, out_dir, contents):
+    """ tests ftp downloads from a local server """
+
+    try:
+        from pyftpdlib.authorizers import DummyAuthorizer
+        from pyftpdlib.handlers import FTPHandler
+        from pyftpdlib.servers import FTPServer
+    except ImportError:
+        print("pyftpdlib is not installed, skipping ftp tests")
+        return
+
+    connections = []
+
+    class handler(FTPHandler):
+        timeout = 2         # idle seconds before the server closes a session
+
+        def on_connect(self):
+            connections.append(self.remote_ip)
+
+    handler.authorizer = DummyAuthorizer()
+    handler.authorizer.add_anonymous(served_dir)
+
+    server = FTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target = server.serve_forever, kwargs = {"timeout": 0.1})
+    thread.daemon = True
+    thread.start()
+    url = "ftp://127.0.0.1:{0}/".format(server.address[1])
+
+    try:
+        # one session is reused for a series of files
+        print("testing pooled ftp downloads")
+        engine = download_engine(retries = 0)
+        for name in sorted(contents)[:4]:
+            engine.download(url + name, os.path.join(out_dir, name))
+            assert _read(os.path.join(out_dir, name)) == contents[name]
+        assert len(connections) == 1, "{0} ftp sessions for 4 files".format(len(connections))
+
+        # a partial file is resumed with REST
+        print("testing resumed ftp downloads")
+        name    = "file_06.bin"
+        outname = os.path.join(out_dir, name)
+        with open(outname + ".part", "wb") as f:
+            f.write(contents[name][:50000])
+        engine.download(url + name, outname)
+        assert _read(outname) == contents[name]
+
+        # a pooled session that the server timed out is replaced
+        print("testing ftp sessions that timed out")
+        time.sleep(3)
+        name = "file_07.bin"
+        engine.download(url + name, os.path.join(out_dir, name))
+        assert _read(os.path.join(out_dir, name)) == contents[name]
+        assert len(connections) == 2
+
+        engine.close()
+
+    finally:
+        server.close_all()
+    return
+
+
+class _http_handler(BaseHTTPRequestHandler):
+    """
+    serves files from a directory with keep alive connections and range requests.
+    paths starting with "/cut/" send only the first half of the file, then hang up.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_HEAD(self):
+        self._send(body = False)
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+        try:
+            time.sleep(0.02)
+            self._send(body = True)
+        finally:
+            with self.server.lock:
+                self.server.active -= 1
+
+    def _send(self, body):
+        cut  = self.path.startswith("/cut/")
+        path = os.path.join(self.server.root, self.path.replace("/cut/", "/").lstrip("/"))
+
+        if not os.path.isfile(path):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        data  = _read(path)
+        start = 0
+        byte_range = self.headers.get("Range")
+
+        if byte_range and body:
+            self.server.ranges.append(byte_range)
+            start = int(byte_range.split("=")[1].split("-")[0])
+
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */{0}".format(len(data)))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes {0}-{1}/{2}".format(start, len(data) - 1, len(data)))
+        else:
+            self.send_response(200)
+
+        self.send_header("Content-Length", str(len(data) - start))
+        self.send_header("Last-Modified", self.date_time_string(int(os.path.getmtime(path))))
+        self.end_headers()
+
+        if not body:
+            return
+        if cut:
+            self.wfile.write(data[:len(data) // 2])
+            self.close_connection = True
+        else:
+            self.wfile.write(data[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+class _http_server(ThreadingMixIn, HTTPServer):
+    """ threaded local http server that records connections, concurrency and range requests """
+
+    daemon_threads = True
+
+    def __init__(self, root):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), _http_handler)
+        self.root        = root
+        self.lock        = threading.Lock()
+        self.connections = 0
+        self.active      = 0
+        self.max_active  = 0
+        self.ranges      = []
+
+        thread = threading.Thread(target = self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+
+def _read(filepath):
+    with open(filepath, "rb") as f:
+        return f.read()
+
+
+def _unused_port():
+    """ returns a local port that nothing is listening on """
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+if __name__ == "__main__":
+    test_dir = r"C:\Users\jwely\Desktop\dnppytest"
+    test_download_engine(test_dir)
@@ -0,0 +1,648 @@
+__author__ = 'jwely'
+
+from dnppy import landsat
+from dnppy import solar
+
+from scipy import stats
+import datetime
+import numpy
+import shutil
+import math
+import gdal
+import osr
+import os
+
+
+# every synthetic scene is on this grid, in UTM zone 18 north
+GEOTRANSFORM = (300000.0, 30.0, 0.0, 4200000.0, 0.0, -30.0)
+SHAPE = (211, 187)
+
+
+def test_landsat_module(test_dir):
+    """
+    tests the numpy and gdal engines of the landsat module, which replace arcpy map
+    algebra, against reference formulas applied to whole synthetic scenes:
+        toa_products
+        make_cloud_mask_457
+        decode_bqa
+        bqa_mask
+        make_cloud_mask_8
+        apply_cloud_mask
+        scene
+        surface_reflectance
+    """
+
+    work_dir = os.path.join(test_dir, "landsat_module")
+    if os.path.exists(work_dir):
+        shutil.rmtree(work_dir)
+    os.makedirs(work_dir)
+
+    _test_toa_products(work_dir)
+    _test_cloud_mask_457(work_dir)
+    _test_decode_bqa(work_dir)
+    _test_scene(work_dir)
+    _test_surface_reflectance(work_dir)
+    return
+
+
+def _test_toa_products(work_dir):
+    """ checks toa_products for landsat 8 and 7 against the formulas of the individual functions """
+
+    print("testing 'toa_products' on a Landsat 8 scene")
+    mtl, dn = _landsat_8_scene(os.path.join(work_dir, "toa_8"), "LC80140342014164LGN00")
+
+    # small windows, so the scene is processed in several pieces
+    outputs = landsat.toa_products(mtl, ["TOA_Rad", "TOA_Ref", "ASBTemp", "NDVI"],
+                                   band_nums = [4, 5, 10], window_pixels = 5000)
+
+    sin_elev = math.sin(math.radians(60.5))
+
+    def rad(b):
+        return dn[b] * (0.01 + int(b) * 0.001) + (-50 + int(b))
+
+    def ref(b):
+        return (dn[b] * 2.0E-05 - 0.1) / sin_elev
+
+    expected = {"B4_TOA_Rad":  rad("4"),
+                "B5_TOA_Rad":  rad("5"),
+                "B10_TOA_Rad": rad("10"),
+                "B4_TOA_Ref":  ref("4"),
+                "B5_TOA_Ref":  ref("5"),
+                "B10_ASBTemp": 1321.08 / numpy.log(774.89 / rad("10") + 1),
+                "B11_ASBTemp": 1201.14 / numpy.log(480.89 / rad("11") + 1),
+                "NDVI":        (ref("5") - ref("4")) / (ref("5") + ref("4"))}
+    _check_outputs(outputs, expected, 1e-5)
+
+    # int16 outputs hold the same values, to within their scale factors
+    outputs = landsat.toa_products(mtl, ["TOA_Rad", "TOA_Ref", "ASBTemp", "NDVI"],
+                                   band_nums = [4, 5, 10], outdir = os.path.join(work_dir, "toa_8_int16"),
+                                   int16 = True)
+    _check_outputs(outputs, expected, 0.06)
+
+    print("testing 'toa_products' on a Landsat 7 scene")
+    mtl, dn = _landsat_7_scene(os.path.join(work_dir, "toa_7"), "LE70410362002335EDC00")
+    outputs = landsat.toa_products(mtl, ["TOA_Rad", "TOA_Ref", "ASBTemp", "NDVI"], band_nums = [3, 4])
+
+    # earth sun distance for day 335, and band ESUN values, as in toa_reflectance_457
+    theta = 2 * math.pi * 335 / 365.0
+    dsun2 = (1.00011 + 0.034221 * math.cos(theta) + 0.001280 * math.sin(theta) +
+             0.000719 * math.cos(2 * theta) + 0.000077 * math.sin(2 * theta))
+    esun  = {"3": 1551.0, "4": 1044.0}
+    cos_zenith = math.cos(math.radians(90 - 31.2))
+
+    def rad7(b):
+        return (191.6 + 6.2) / (255 - 1) * (dn[b] - 1) - 6.2
+
+    def ref7(b):
+        return math.pi * rad7(b) * dsun2 / (esun[b] * cos_zenith)
+
+    expected = {"B3_TOA_Rad":        rad7("3"),
+                "B4_TOA_Rad":        rad7("4"),
+                "B3_TOA_Ref":        ref7("3"),
+                "B4_TOA_Ref":        ref7("4"),
+                "B6_VCID_1_ASBTemp": 1282.71 / numpy.log(666.09 / rad7("6_VCID_1") + 1),
+                "B6_VCID_2_ASBTemp": 1282.71 / numpy.log(666.09 / rad7("6_VCID_2") + 1),
+                "NDVI":              (ref7("4") - ref7("3")) / (ref7("4") + ref7("3"))}
+    _check_outputs(outputs, expected, 1e-5)
+    return
+
+
+def _test_cloud_mask_457(work_dir):
+    """ checks the windowed make_cloud_mask_457 against both passes of ACCA on whole arrays """
+
+    # a scene without snow uses the upper thermal threshold, a snowy one the lower
+    for seed, snowy in [(1, False), (3, True)]:
+        print("testing 'make_cloud_mask_457' on a scene {0} snow".format("with" if snowy else "without"))
+        folder = os.path.join(work_dir, "acca_{0}".format(seed))
+        bands  = _acca_scene(folder, "LT50410362011240PAC01", seed, snowy)
+
+        # small windows, so the statistics are gathered across several pieces
+        mask_path = landsat.make_cloud_mask_457(
+            os.path.join(folder, "LT50410362011240PAC01_B2_TOA_Ref.tif"), window_pixels = 30000)
+
+        got      = gdal.Open(mask_path).GetRasterBand(1).ReadAsArray()
+        expected = _acca_reference(*bands)
+
+        # percentiles of cloud temperatures are taken from 0.01 Kelvin bins, not exactly
+        mismatched = numpy.count_nonzero(got != expected)
+        assert mismatched <= expected.size * 0.001, "{0} pixels differ".format(mismatched)
+    return
+
+
+def _test_decode_bqa(work_dir):
+    """ checks the BQA lookup tables against bit arithmetic, and the masks made with them """
+
+    print("testing 'decode_bqa' and 'bqa_mask'")
+    rng = numpy.random.RandomState(0)
+    bqa = rng.randint(0, 2 ** 16, SHAPE).astype("uint16")
+    bqa[:3] = 1
+    bits = bqa.astype("int64")
+
+    decoded = landsat.decode_bqa(bqa)
+    assert (decoded["fill"] == (bits & 1).astype(bool)).all()
+    assert (decoded["dropped_frame"] == ((bits >> 1) & 1).astype(bool)).all()
+    assert (decoded["terrain_occlusion"] == ((bits >> 2) & 1).astype(bool)).all()
+    assert (decoded["water"] == (bits >> 4) & 3).all()
+    assert (decoded["snow"] == (bits >> 10) & 3).all()
+    assert (decoded["cirrus"] == (bits >> 12) & 3).all()
+    assert (decoded["cloud"] == (bits >> 14) & 3).all()
+
+    mask = landsat.bqa_mask(bqa, snow = "medium")
+    expected = numpy.where(((bits >> 14) & 3 >= 3) | ((bits >> 12) & 3 >= 3) | ((bits >> 10) & 3 >= 2), 0, 1)
+    expected[(bits & 1) == 1] = 255
+    assert (mask == expected).all()
+
+    # values that the arcpy version remapped, as cloud (0), clear (1) and fill (255)
+    for value, masked in [(61440, 0), (53248, 0), (28672, 0), (20480, 1), (36864, 1), (2720, 1), (1, 255)]:
+        assert landsat.bqa_mask(numpy.array([value]))[0] == masked, value
+
+    print("testing 'make_cloud_mask_8' and 'apply_cloud_mask'")
+    folder = os.path.join(work_dir, "bqa")
+    os.makedirs(folder)
+    name = "LC80140342014164LGN00"
+
+    # band 4 shares the grid of the BQA band, while panchromatic band 8 has twice the resolution
+    bqa_path = os.path.join(folder, "{0}_BQA.tif".format(name))
+    _write_tif(bqa_path, bqa)
+    b4 = rng.randint(1, 30000, SHAPE).astype("uint16")
+    _write_tif(os.path.join(folder, "{0}_B4.tif".format(name)), b4)
+    b8 = rng.randint(1, 30000, (SHAPE[0] * 2, SHAPE[1] * 2)).astype("uint16")
+    pan_gt = (GEOTRANSFORM[0], 15.0, 0.0, GEOTRANSFORM[3], 0.0, -15.0)
+    _write_tif(os.path.join(folder, "{0}_B8.tif".format(name)), b8, pan_gt)
+
+    mask_path = landsat.make_cloud_mask_8(bqa_path, window_pixels = 5000)
+    band = gdal.Open(mask_path).GetRasterBand(1)
+    assert (band.ReadAsArray() == landsat.bqa_mask(bqa)).all()
+    assert band.GetNoDataValue() == 255
+
+    # the mask, or the BQA band itself, blanks the masked pixels of every band
+    clear = landsat.bqa_mask(bqa) == 1
+    pan_clear = clear.repeat(2, axis = 0).repeat(2, axis = 1)
+    for mask_path in [mask_path, bqa_path]:
+        outputs = landsat.apply_cloud_mask(mask_path, folder, os.path.join(folder, "no_clouds"),
+                                           window_pixels = 5000)
+        assert len(outputs) == 2, outputs
+
+        for output in outputs:
+            got = gdal.Open(output).GetRasterBand(1).ReadAsArray()
+            if "_B8_" in output:
+                assert (got == numpy.where(pan_clear, b8, 0)).all()
+            else:
+                assert (got == numpy.where(clear, b4, 0)).all()
+    return
+
+
+def _test_scene(work_dir):
+    """ checks the products of landsat.scene against the rasters of the functions it wraps """
+
+    print("testing 'scene' products of a Landsat 8 scene")
+    folder = os.path.join(work_dir, "scene_8")
+    mtl, dn = _landsat_8_scene(folder, "LC80140342014164LGN00")
+
+    s = landsat.scene(mtl, cache_mb = 64)
+    products = {"B4_TOA_Ref":  s.get_toa_reflectance(4),
+                "NDVI":        s.get_ndvi(),
+                "B10_ASBTemp": s.get_atsat_bright_temp(10),
+                "B10_TOA_Rad": s.get_toa_radiance(10)}
+
+    outputs = landsat.toa_products(mtl, ["TOA_Rad", "TOA_Ref", "ASBTemp", "NDVI"], band_nums = [4, 10],
+                                   outdir = os.path.join(folder, "toa"))
+    for key in products:
+        output = [output for output in outputs if output.endswith("_{0}.tif".format(key))][0]
+        _check_array(key, products[key], _read_tif(output), 1e-6)
+        assert not products[key].flags.writeable
+
+    mask = s.get_cloud_mask(snow = "medium")
+    assert (mask == landsat.bqa_mask(dn["BQA"], snow = "medium")).all()
+
+    # a cache too small for every band drops and recomputes arrays as needed
+    small = landsat.scene(mtl, cache_mb = 0.5)
+    _check_array("NDVI", small.get_ndvi(), products["NDVI"], 1e-6)
+    _check_array("B4_TOA_Ref", small.get_toa_reflectance(4), products["B4_TOA_Ref"], 1e-6)
+
+    # products saved in a cache_dir are loaded by later scene objects
+    cache_dir = os.path.join(folder, "cache")
+    landsat.scene(mtl, cache_dir = cache_dir).get_ndvi()
+    assert len(os.listdir(cache_dir)) > 0
+    _check_array("NDVI", landsat.scene(mtl, cache_dir = cache_dir).get_ndvi(), products["NDVI"], 1e-6)
+
+    print("testing 'scene' cloud masks of a Landsat 5 scene")
+    folder = os.path.join(work_dir, "scene_5")
+    mtl = _landsat_5_scene(folder, "LT50410362011240PAC01")
+
+    mask = landsat.scene(mtl).get_cloud_mask()
+    outputs = landsat.toa_products(mtl, ["TOA_Ref", "ASBTemp"], band_nums = [2, 3, 4, 5])
+    b2_path = [output for output in outputs if output.endswith("_B2_TOA_Ref.tif")][0]
+    expected = gdal.Open(landsat.make_cloud_mask_457(b2_path)).GetRasterBand(1).ReadAsArray()
+    assert (mask == expected).all()
+    assert (mask == 0).any()
+    return
+
+
+def _test_surface_reflectance(work_dir):
+    """
+    checks surface_reflectance against the per band formulas of the arcpy version, and
+    that DEMs on other grids are resampled once into tiles that later scenes reuse.
+    """
+
+    print("testing 'surface_reflectance' with a DEM on the scene grid")
+    folder = os.path.join(work_dir, "surface")
+    name   = "LC80140342014164LGN00"
+    mtl, dn = _landsat_8_scene(folder, name)
+    landsat.toa_products(mtl, ["TOA_Ref"], band_nums = [2, 3, 4, 5, 6, 7])
+
+    rng = numpy.random.RandomState(0)
+    dem = (rng.rand(*SHAPE) * 1500).astype("float32")
+    dem[50:53, 60:63] = -9999
+    dem_path = os.path.join(work_dir, "dem_aligned.tif")
+    _write_tif(dem_path, dem, nodata = -9999)
+
+    cache_dir = os.path.join(work_dir, "dem_tiles")
+    outputs = landsat.surface_reflectance(mtl, folder, dem_path, 12.0, outdir = os.path.join(folder, "out"),
+                                          kt = 0.9, dem_cache_dir = cache_dir, window_pixels = 5000)
+    assert not os.path.exists(cache_dir), "a DEM on the scene grid was resampled"
+
+    # the cosine of the solar zenith at the scene center, where the corners average to
+    center = solar.solar(37.1, -76.475, datetime.datetime(2014, 6, 13, 15, 49, 29), 0)
+    cth = math.cos(math.radians(center.get_zenith()))
+    elevation = numpy.where(dem == -9999, numpy.nan, dem.astype("float64"))
+
+    for band, output in zip([2, 3, 4, 5, 6, 7], outputs):
+        toa = _read_tif(os.path.join(folder, "{0}_B{1}_TOA_Ref.tif".format(name, band)))
+        expected = _surface_reflectance_reference(band, toa, elevation, 12.0, cth, 0.9)
+        _check_array(os.path.basename(output), _read_tif(output), expected, 1e-4)
+
+    # the scene returns the same values, even with a cache too small to hold all six bands
+    s = landsat.scene(mtl, cache_mb = 0.3)
+    _check_array("scene band 2", s.get_surface_reflectance(2, dem_path, 12.0, kt = 0.9),
+                 _read_tif(outputs[0]), 1e-5)
+
+    print("testing 'surface_reflectance' with a coarser DEM")
+    coarse = (rng.rand(300, 300) * 1500).astype("float32")
+    coarse_path = os.path.join(work_dir, "dem_coarse.tif")
+    _write_tif(coarse_path, coarse, (285000.0, 90.0, 0.0, 4215000.0, 0.0, -90.0), nodata = -9999)
+
+    outputs = landsat.surface_reflectance(mtl, folder, coarse_path, 12.0, outdir = os.path.join(folder, "coarse"),
+                                          dem_cache_dir = cache_dir)
+    tiles = os.listdir(cache_dir)
+    assert len(tiles) == 1, tiles
+    tile_time = os.path.getmtime(os.path.join(cache_dir, tiles[0]))
+    for output in outputs:
+        assert (numpy.isnan(_read_tif(output)) == numpy.isnan(dn["1"])).all()
+
+    # another scene of the same path/row, on a grid shifted by whole pixels, reuses the tile
+    shifted_gt = (GEOTRANSFORM[0] + 40 * 30.0, 30.0, 0.0, GEOTRANSFORM[3] - 25 * 30.0, 0.0, -30.0)
+    folder = os.path.join(work_dir, "surface_shifted")
+    mtl, dn = _landsat_8_scene(folder, "LC80140342014180LGN00", shifted_gt, seed = 1)
+    landsat.toa_products(mtl, ["TOA_Ref"], band_nums = [2, 3, 4, 5, 6, 7])
+    landsat.surface_reflectance(mtl, folder, coarse_path, 12.0, dem_cache_dir = cache_dir)
+
+    assert os.listdir(cache_dir) == tiles
+    assert os.path.getmtime(os.path.join(cache_dir, tiles[0])) == tile_time
+    return
+
+
+def _surface_reflectance_reference(band, toa, dem, dew_point, cth, kt):
+    """ surface reflectance of a Landsat 8 band, with the constants of the arcpy version """
+
+    # effective narrowband transmissivity constants c1 to c5, and path reflectance, by band
+    constants = {2: ([0.987, -0.00071, 0.000036, 0.0880, 0.0789], 0.254),
+                 3: ([2.319, -0.00016, 0.000105, 0.0437, -1.2697], 0.149),
+                 4: ([0.951, -0.00033, 0.000280, 0.0875, 0.1014], 0.147),
+                 5: ([0.375, -0.00048, 0.005018, 0.1355, 0.6621], 0.311),
+                 6: ([0.234, -0.00101, 0.004336, 0.0560, 0.7757], 0.103),
+                 7: ([0.365, -0.00097, 0.004296, 0.0155, 0.6390], 0.036)}
+    (c1, c2, c3, c4, c5), prc = constants[band]
+
+    svp = 0.6108 * math.exp((17.27 * dew_point) / (dew_point + 237.3))
+    ap  = 101.3 * (((293 - (0.0065 * dem)) / 293) ** 5.26)
+    wia = (0.14 * svp * ap) + 2.1
+
+    enbt1 = c1 * (numpy.exp((c2 * ap) / (kt * cth)) - (((c3 * wia) + c4) / cth)) + c5
+    enbt2 = c1 * (numpy.exp((c2 * ap) / kt) - ((c3 * wia) + c4)) + c5
+    pr = prc * (1 - enbt1)
+
+    return (toa - pr) / (enbt1 * enbt2)
+
+
+def _acca_scene(folder, name, seed, snowy = False):
+    """
+    writes TOA reflectance for bands 2 to 5 and brightness temperature for band 6 of a
+    desert scene with cold clouds, named as toa_reflectance_457 and atsat_bright_temp_457
+    name them. Some rows and columns are NoData (-9999).
+
+    :return bands:  list of the five bands as float64 arrays, with NoData as nan
+    """
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    rng = numpy.random.RandomState(seed)
+    ys, xs = 600, 517
+
+    B2 = rng.uniform(0.05, 0.3, (ys, xs))
+    B3 = rng.uniform(0.05, 0.35, (ys, xs))
+    B4 = B3 * rng.uniform(0.9, 2.5, (ys, xs))
+    B5 = B4 / rng.uniform(0.6, 1.6, (ys, xs))
+    B6 = rng.uniform(220, 310, (ys, xs))
+
+    cloud = rng.rand(ys, xs) < 0.2
+    n = cloud.sum()
+    B3[cloud] = rng.uniform(0.1, 0.6, n)
+    B4[cloud] = B3[cloud] * rng.uniform(0.9, 1.3, n)
+    B2[cloud] = B3[cloud] * rng.uniform(0.9, 1.2, n)
+    B5[cloud] = B4[cloud] * rng.uniform(0.6, 0.98, n)
+    B6[cloud] = rng.uniform(215, 290, n)
+
+    if snowy:
+        snow = rng.rand(ys, xs) < 0.03
+        B5[snow] = B2[snow] * 0.1
+        B3[snow] = 0.5
+
+    bands = [band.astype("float32") for band in [B2, B3, B4, B5, B6]]
+    bands[0][:4] = -9999
+    bands[4][:, :3] = -9999
+
+    names = ["B2_TOA_Ref", "B3_TOA_Ref", "B4_TOA_Ref", "B5_TOA_Ref", "B6_ASBTemp"]
+    for band_name, band in zip(names, bands):
+        _write_tif(os.path.join(folder, "{0}_{1}.tif".format(name, band_name)), band, nodata = -9999)
+
+    return [numpy.where(band == -9999, numpy.nan, band.astype("float64")) for band in bands]
+
+
+def _acca_reference(B2, B3, B4, B5, B6, Filter5Thresh = 2.0, Filter6Thresh = 2.0):
+    """
+    both passes of ACCA as the arcpy version of make_cloud_mask_457 ran them, on whole
+    arrays with exact percentiles. returns the mask, with 1 for good data and 0 for cloud.
+    """
+
+    with numpy.errstate(divide = "ignore", invalid = "ignore"):
+        data = numpy.isfinite(B2 + B3 + B4 + B5 + B6)
+        gaps = (B2 > 0) & (B3 > 0) & (B4 > 0) & (B5 > 0) & (B6 > 0)
+
+        cloud = B3 > 0.08
+        ndsi  = (B2 - B5) / (B2 + B5)
+        snow  = (ndsi > 0.6) & cloud
+        cloud &= (ndsi < 0.6) & (B6 < 300)
+
+        composite = (1 - B5) * B6
+        cloud &= composite < 225
+        amb    = composite > 225
+
+        cloud &= (B4 / B3 < Filter5Thresh) & (B4 / B2 < Filter6Thresh)
+        amb   &= (B4 / B3 > Filter5Thresh) & (B4 / B2 > Filter6Thresh)
+
+        desert = B4 / B5 > 1.0
+        cloud &= desert
+        amb   &= B4 / B5 < 1.0
+
+        warm_cloud = (composite > 210) & cloud
+        cold_cloud = (composite < 210) & cloud
+
+    desert_index = desert[gaps].mean()
+    cold_mean    = cold_cloud[gaps].mean()
+    snow_present = snow[gaps].mean() > 0.01
+
+    if snow_present:
+        cloud = cold_cloud
+        amb   = amb | warm_cloud
+
+    with numpy.errstate(invalid = "ignore"):
+        temps = B6[cloud & (B6 > 0)]
+    mean, std, skew = temps.mean(), temps.std(), stats.skew(temps)
+    p98, p97, p82 = [numpy.percentile(temps, q) for q in [98.75, 97.5, 82.5]]
+
+    if cold_mean > 0.004 and desert_index > 0.5 and mean < 295:
+        if skew > 0:
+            shift = std if skew > 1 else std * skew
+            p97 += shift
+            p82 += shift
+        if p97 > p98:
+            p82 -= p97 - p98
+            p97 = p98
+
+        with numpy.errstate(invalid = "ignore"):
+            warm_amb = amb & (B6 < p97) & (B6 > p82)
+            cold_amb = amb & (B6 < p82) & (B6 > 0)
+
+        warm_amb_mean = B6[warm_amb].mean() if warm_amb.any() else 0
+        cold_amb_mean = B6[cold_amb].mean() if cold_amb.any() else 0
+
+        if warm_amb[data].mean() < 0.4 and warm_amb_mean < 295 and not snow_present:
+            cloud = cloud | warm_amb | cold_amb
+        elif cold_amb[data].mean() < 0.4 and cold_amb_mean < 295:
+            cloud = cloud | cold_amb
+
+    return (~cloud).astype("uint8")
+
+
+def _landsat_8_scene(folder, name, geotransform = GEOTRANSFORM, seed = 0):
+    """
+    writes a Landsat 8 scene of random digital numbers and a random BQA band, with an MTL
+    file of simple calibration coefficients. The first rows of every band are fill.
+
+    :return (mtl_path, bands):  the MTL filepath, and a dict of the bands as float64 arrays
+                                with fill as nan, and the BQA band as it is
+    """
+
+    rng = numpy.random.RandomState(seed)
+    fields = [("LANDSAT_SCENE_ID",       '"{0}"'.format(name)),
+              ("SPACECRAFT_ID",          '"LANDSAT_8"'),
+              ("FILE_NAME_BAND_QUALITY", '"{0}_BQA.tif"'.format(name)),
+              ("DATE_ACQUIRED",          "2014-06-13"),
+              ("SCENE_CENTER_TIME",      '"15:49:29.0Z"'),
+              ("SUN_ELEVATION",          "60.5"),
+              ("WRS_PATH",               "14"),
+              ("WRS_ROW",                "34")]
+
+    for corner, lat, lon in [("UL", 38.0, -77.5), ("UR", 38.1, -75.0), ("LL", 36.1, -78.0), ("LR", 36.2, -75.4)]:
+        fields += [("CORNER_{0}_LAT_PRODUCT".format(corner), str(lat)),
+                   ("CORNER_{0}_LON_PRODUCT".format(corner), str(lon))]
+
+    for b in range(1, 12):
+        fields += [("FILE_NAME_BAND_{0}".format(b),     '"{0}_B{1}.tif"'.format(name, b)),
+                   ("RADIANCE_MULT_BAND_{0}".format(b), str(0.01 + b * 0.001)),
+                   ("RADIANCE_ADD_BAND_{0}".format(b),  str(-50 + b))]
+    for b in range(1, 10):
+        fields += [("REFLECTANCE_MULT_BAND_{0}".format(b), "2.0E-05"),
+                   ("REFLECTANCE_ADD_BAND_{0}".format(b),  "-0.1")]
+    fields += [("K1_CONSTANT_BAND_10", "774.89"), ("K2_CONSTANT_BAND_10", "1321.08"),
+               ("K1_CONSTANT_BAND_11", "480.89"), ("K2_CONSTANT_BAND_11", "1201.14")]
+
+    mtl_path = _write_mtl(folder, name, fields)
+
+    bands = {}
+    for b in range(1, 12):
+        dn = rng.randint(6000, 30000, SHAPE).astype("uint16")
+        dn[:3] = 0
+        _write_tif(os.path.join(folder, "{0}_B{1}.tif".format(name, b)), dn, geotransform)
+        bands[str(b)] = _fill_as_nan(dn)
+
+    bqa = rng.randint(0, 2 ** 16, SHAPE).astype("uint16")
+    bqa[:3] = 1
+    _write_tif(os.path.join(folder, "{0}_BQA.tif".format(name)), bqa, geotransform)
+    bands["BQA"] = bqa
+
+    return mtl_path, bands
+
+
+def _landsat_7_scene(folder, name, seed = 0):
+    """
+    writes a Landsat 7 scene of random digital numbers, with an MTL file in the
+    format used since 2012. The first rows of every band are fill.
+
+    :return (mtl_path, bands):  the MTL filepath, and a dict of the bands as float64 arrays
+                                with fill as nan
+    """
+
+    rng = numpy.random.RandomState(seed)
+    fields = [("LANDSAT_SCENE_ID",  '"{0}"'.format(name)),
+              ("SPACECRAFT_ID",     '"LANDSAT_7"'),
+              ("DATE_ACQUIRED",     "2002-12-01"),
+              ("SCENE_CENTER_TIME", '"18:20:01.0Z"'),
+              ("SUN_ELEVATION",     "31.2")]
+
+    band_names = ["1", "2", "3", "4", "5", "6_VCID_1", "6_VCID_2", "7", "8"]
+    for b in band_names:
+        fields += [("FILE_NAME_BAND_" + b,        '"{0}_B{1}.tif"'.format(name, b)),
+                   ("RADIANCE_MAXIMUM_BAND_" + b, "191.6"),
+                   ("RADIANCE_MINIMUM_BAND_" + b, "-6.2"),
+                   ("QUANTIZE_CAL_MAX_BAND_" + b, "255"),
+                   ("QUANTIZE_CAL_MIN_BAND_" + b, "1")]
+
+    mtl_path = _write_mtl(folder, name, fields)
+
+    bands = {}
+    for b in band_names:
+        dn = rng.randint(40, 255, SHAPE).astype("uint8")
+        dn[:3] = 0
+        _write_tif(os.path.join(folder, "{0}_B{1}.tif".format(name, b)), dn)
+        bands[b] = _fill_as_nan(dn)
+
+    return mtl_path, bands
+
+
+def _landsat_5_scene(folder, name, seed = 0):
+    """
+    writes a Landsat 5 scene of random digital numbers, with bright pixels in band 3
+    so that some pixels are cloud. The first rows of every band are fill.
+
+    :return mtl_path:   the MTL filepath
+    """
+
+    rng = numpy.random.RandomState(seed)
+    fields = [("LANDSAT_SCENE_ID",  '"{0}"'.format(name)),
+              ("SPACECRAFT_ID",     '"LANDSAT_5"'),
+              ("DATE_ACQUIRED",     "2011-08-28"),
+              ("SCENE_CENTER_TIME", '"18:20:01.0Z"'),
+              ("SUN_ELEVATION",     "55.2")]
+
+    band_names = ["1", "2", "3", "4", "5", "6", "7"]
+    for b in band_names:
+        fields += [("FILE_NAME_BAND_" + b,        '"{0}_B{1}.tif"'.format(name, b)),
+                   ("RADIANCE_MAXIMUM_BAND_" + b, "15.3" if b == "6" else "250.0"),
+                   ("RADIANCE_MINIMUM_BAND_" + b, "1.238" if b == "6" else "-1.5"),
+                   ("QUANTIZE_CAL_MAX_BAND_" + b, "255"),
+                   ("QUANTIZE_CAL_MIN_BAND_" + b, "1")]
+
+    mtl_path = _write_mtl(folder, name, fields)
+
+    for b in band_names:
+        if b == "6":
+            dn = rng.randint(90, 160, SHAPE).astype("uint8")
+        else:
+            dn = rng.randint(1, 120, SHAPE).astype("uint8")
+        if b == "3":
+            dn[rng.rand(*SHAPE) < 0.3] = 200
+        dn[:3] = 0
+        _write_tif(os.path.join(folder, "{0}_B{1}.tif".format(name, b)), dn)
+
+    return mtl_path
+
+
+def _write_mtl(folder, name, fields):
+    """ writes an MTL metadata file with the given (name, value) fields """
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    mtl_path = os.path.join(folder, "{0}_MTL.txt".format(name))
+    with open(mtl_path, "w") as f:
+        f.write("GROUP = L1_METADATA_FILE\n")
+        for field, value in fields:
+            f.write("    {0} = {1}\n".format(field, value))
+        f.write("END_GROUP = L1_METADATA_FILE\nEND\n")
+    return mtl_path
+
+
+def _write_tif(filepath, array, geotransform = GEOTRANSFORM, nodata = None):
+    """ saves a numpy array as a single band GeoTIFF in UTM zone 18 north """
+
+    gdal_types = {"uint8":   gdal.GDT_Byte,
+                  "uint16":  gdal.GDT_UInt16,
+                  "float32": gdal.GDT_Float32}
+
+    ys, xs = array.shape
+    dataset = gdal.GetDriverByName("GTiff").Create(filepath, xs, ys, 1, gdal_types[str(array.dtype)], [])
+    dataset.SetGeoTransform(geotransform)
+
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32618)
+    dataset.SetProjection(srs.ExportToWkt())
+
+    band = dataset.GetRasterBand(1)
+    if nodata is not None:
+        band.SetNoDataValue(nodata)
+    band.WriteArray(array, 0, 0)
+    band.FlushCache()
+    dataset = None
+    return
+
+
+def _read_tif(filepath):
+    """ reads a GeoTIFF as a float64 array, with NoData as nan and its gdal scale applied """
+
+    band  = gdal.Open(filepath).GetRasterBand(1)
+    array = band.ReadAsArray().astype("float64")
+
+    if band.GetNoDataValue() is not None:
+        array[array == band.GetNoDataValue()] = numpy.nan
+    if band.GetScale():
+        array *= band.GetScale()
+    return array
+
+
+def _fill_as_nan(dn):
+    """ returns raw digital numbers as float64, with fill (0) as nan """
+
+    return numpy.where(dn == 0, numpy.nan, dn.astype("float64"))
+
+
+def _check_outputs(outputs, expected, tolerance):
+    """
+    checks that each output raster matches the expected array for the product it is
+    named after, with NoData in the same places and a relative error below tolerance.
+    """
+
+    assert len(outputs) == len(expected), [os.path.basename(o) for o in outputs]
+
+    for output in outputs:
+        key = [k for k in expected if output.endswith("_{0}.tif".format(k))][0]
+        _check_array(key, _read_tif(output), expected[key], tolerance)
+    return
+
+
+def _check_array(name, got, expected, tolerance):
+    """ checks an array against the expected one, treating nan and inf as NoData """
+
+    valid = numpy.isfinite(expected)
+    assert (numpy.isnan(got) == ~valid).all(), "{0} has NoData in the wrong places".format(name)
+
+    error = abs(got[valid] - expected[valid]) / numpy.maximum(1, abs(expected[valid]))
+    assert error.max() < tolerance, "{0} differs by {1}".format(name, error.max())
+    return
+
+
+if __name__ == "__main__":
+    test_dir = r"C:\Users\jwely\Desktop\dnppytest"
+    test_landsat_module(test_dir)
@@ -0,0 +1,78 @@
+__author__ = 'jwely'
+
+from dnppy import textio
+from dnppy import tsa
+
+from datetime import datetime, timedelta
+
+
+def test_time_series(test_dir = None):
+    """
+    tests subsets of time_series objects, in row and columnar mode:
+        make_subsets
+        clean
+        add_mono_time
+        rename_header
+
+    Needs no input data, test_dir is accepted for consistency with the other tests.
+    """
+
+    # three hourly data over two months, where most of december has invalid values
+    rows = []
+    for hours in range(0, 24 * 40, 3):
+        dto = datetime(2013, 11, 25, 3) + timedelta(hours = hours)
+        value = "bad" if (dto.month == 12 and dto.day < 30) else str(hours % 7)
+        rows.append([dto.strftime("%Y%m%d%H%M"), value])
+
+    for columnar in [False, True]:
+        print("testing subsets of time_series, columnar = {0}".format(columnar))
+
+        # decimal days of subsets count from the start of the parent, whether or not
+        # the subsets were copied out of their parent by clean
+        days = []
+        for clean in [False, True]:
+            ts = _build(rows, columnar)
+            ts.make_subsets("%m")
+            if clean:
+                ts.clean("val")
+            ts.add_mono_time()
+
+            parent_days = dict(zip(_dates(ts), ts.col_data["decimal_days"]))
+            for subset in ts.subsets:
+                for dt, day in zip(_dates(subset), subset.col_data["decimal_days"]):
+                    assert day == parent_days[dt], (dt, day, parent_days[dt])
+
+            december = [subset for subset in ts.subsets if "201312301800" in _dates(subset)][0]
+            days.append(december.col_data["decimal_days"][_dates(december).index("201312301800")])
+
+        assert days == [35.75, 35.75], days
+
+        # renamed headers of a subset do not change the parent
+        ts = _build(rows, columnar)
+        ts.make_subsets("%m")
+        ts.subsets[0].rename_header("val", "value")
+        assert ts.headers == ["dt", "val"] and "val" in ts.col_data
+        assert ts.subsets[0].headers == ["dt", "value"] and "value" in ts.subsets[0].col_data
+    return
+
+
+def _build(rows, columnar):
+    """ builds a time_series from rows of [time string, value] """
+
+    tdo = textio.text_data(["dt", "val"], [list(row) for row in rows])
+    ts = tsa.time_series("test")
+    ts.from_tdo(tdo)
+    if columnar:
+        ts.to_columnar()
+    ts.define_time("dt", "%Y%m%d%H%M")
+    return ts
+
+
+def _dates(ts):
+    """ returns the time column of a time_series as strings, which columnar mode stores as numbers """
+
+    return [str(dt) for dt in ts.col_data["dt"]]
+
+
+if __name__ == "__main__":
+    test_time_series()
@@ -1,51 +1,80 @@
 __author__ = 'jwely'
+__all__ = ["HDF5_to_numpy"]
+
+from hdf5_layer import hdf5_layer
 
 import h5py
 import os
 
-def HDF5_to_numpy(hdfpath, layers = None):
+def HDF5_to_numpy(hdfpath, layers = None, window = None, step = None, lazy = False):
     """
     NOTE: This is functionally identical to ``_extract_HDF_layer_data``, but employs
-    an h5py based approach instead of gdal. It is experimental, and not yet used
-    anywhere.
+    an h5py based approach instead of gdal. It is used by ``extract_GPM_IMERG``
+    when its "h5py" backend is chosen.
 
-    Extracts one or more layers from an HDF5 file and returns a dict of numpy arrays
+    Extracts one or more layers from an HDF5 file and returns a dict of numpy arrays.
+    Only the native HDF5 chunks of each layer that overlap the window are read, so
+    small regions of large files may be extracted quickly.
 
     :param hdfpath:     Filepath to an HDF5 file
     :param layers:      A list of integer values or layer names to extract
-                        leave "None" to return numpy arrays for ALL layers
+                        leave "None" to return numpy arrays for ALL layers. Integer
+                        values index only the layers with two or more dimensions,
+                        in the same order as the subdatasets that gdal lists, so
+                        they match the ``layer_indexs`` of the gdal backend. Layers
+                        with fewer dimensions, such as "lat" and "lon", may be
+                        requested by name.
+    :param window:      optional (xoff, yoff, xsize, ysize) pixel window to read from
+                        the last two axes of each layer, where x is the last axis.
+                        Layers with fewer than two dimensions are read whole.
+    :param step:        optional int, or (xstep, ystep) tuple, to read only every nth
+                        pixel of each layer for decimation.
+    :param lazy:        set True to return ``hdf5_layer`` objects instead of arrays,
+                        which read nothing until they are sliced or read.
 
     :return layer_dict: Dict with band names as keys and numpy arrays as values
     """
 
-    with h5py.File(hdfpath, "r", driver = "core") as hdf:
-        group  = hdf[list(hdf)[0]]
+    with h5py.File(hdfpath, "r") as hdf:
+        group_name = list(hdf)[0]
+        group  = hdf[group_name]
         bands  = list(group)
 
+        # gdal only lists datasets with two or more dimensions as subdatasets
+        rasters = [band for band in bands
+                   if isinstance(group[band], h5py.Dataset) and len(group[band].shape) >= 2]
+
         # print info about each dataset
         print("Contents of {0}".format(os.path.basename(hdfpath)))
-        for i,x in enumerate(group.values()):
-            print i,x
-
-        if layers is None:
-            layers = bands
-
-        elif isinstance(layers, str) or isinstance(layers, int):
-            layers = [layers]
-
-        # verify that the desired layer can be extracted
-        for i, layer in enumerate(layers):
-            if isinstance(layer, int) and layer <= len(bands):
-                layers[i] = bands[layer]
-            elif isinstance(layer, str) and layer in bands:
-                layers[i] = layer
-
-        layer_dict ={}
-        for layer in layers:
-            try:
-                layer_dict[layer] = group[layer][()]
-            except:
-                print("Failed to read layer '{0}'".format(layer))
+        for band in bands:
+            index = rasters.index(band) if band in rasters else "-"
+            print("  {0}  {1}".format(index, group[band]))
+
+    if layers is None:
+        layers = list(bands)
+
+    elif isinstance(layers, basestring) or isinstance(layers, int):
+        layers = [layers]
+
+    else:
+        layers = list(layers)
+
+    # verify that the desired layer can be extracted
+    for i, layer in enumerate(layers):
+        if isinstance(layer, int) and 0 <= layer < len(rasters):
+            layers[i] = rasters[layer]
+        elif isinstance(layer, basestring) and layer in bands:
+            layers[i] = layer
+        else:
+            raise Exception("{0} has no layer {1}, there are {2} layers of two or more "
+                            "dimensions and the layer names are {3}".format(
+                            os.path.basename(hdfpath), repr(layer), len(rasters), bands))
+
+    layer_dict ={}
+    for layer in layers:
+        layer_dict[layer] = hdf5_layer(hdfpath, "{0}/{1}".format(group_name, layer))
+        if not lazy:
+            layer_dict[layer] = layer_dict[layer].read(window, step)
 
     return layer_dict
 
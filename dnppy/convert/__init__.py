@@ -11,6 +11,7 @@ __author__ = ["Jwely",
               "djjensen"]
 
 
+from batch_extract import *
 from datatype_library import *
 from extract_archive import *
 from extract_GCMO_NetCDF import *
@@ -21,6 +22,7 @@ from extract_SMOS_NetCDF import *
 from extract_TRMM_HDF import *
 from extract_TRMM_NetCDF import *
 from HDF5_to_numpy import *
+from hdf5_layer import *
 from ll_to_utm import *
 from nongrid_data import *
 
@@ -1,5 +1,6 @@
 __author__ = 'jwely'
-__all__ = ["_extract_HDF_datatype"]
+__all__ = ["_extract_HDF_datatype",
+           "_extract_HDF_layer"]
 
 from _extract_HDF_layer_data import *
 from _gdal_dataset_to_tif import *
@@ -55,3 +56,24 @@ def _extract_HDF_datatype(hdf, layer_indexs, outdir = None, datatype = None,
 
     return output_filelist
 
+
+def _extract_HDF_layer(hdf, layer_index, outpath, datatype = None,
+                       force_custom = False, nodata_value = None):
+    """
+    Extracts a single layer of an HDF file to a tif. This is the unit of work
+    for ``batch_extract`` jobs of HDF products, see "_extract_HDF_datatype"
+    for a description of the parameters.
+
+    :return outpath:        filepath to the output file
+    """
+
+    dataset = _extract_HDF_layer_data(hdf, [layer_index])[layer_index]
+
+    print("creating dataset at {0}".format(outpath))
+
+    _gdal_dataset_to_tif(dataset, outpath,
+                        cust_projection = datatype.projectionTXT,
+                        cust_geotransform = datatype.geotransform,
+                        force_custom = force_custom,
+                        nodata_value = nodata_value)
+    return outpath
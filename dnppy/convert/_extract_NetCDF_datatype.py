@@ -1,5 +1,6 @@
 __author__ = 'jwely'
-__all__ = ["_extract_NetCDF_datatype"]
+__all__ = ["_extract_NetCDF_datatype",
+           "_extract_NetCDF_layer"]
 
 from _extract_NetCDF_layer_data import *
 from _gdal_dataset_to_tif import *
@@ -46,4 +47,26 @@ def _extract_NetCDF_datatype(netcdf, layer_indexs, outdir, datatype,
 
         output_filelist.append(outpath)
 
-    return output_filelist
\ No newline at end of file
+    return output_filelist
+
+
+def _extract_NetCDF_layer(netcdf, layer_index, outpath, datatype = None,
+                          force_custom = False, nodata_value = None):
+    """
+    Extracts a single layer of a NetCDF file to a tif. This is the unit of work
+    for ``batch_extract`` jobs of NetCDF products, see "_extract_NetCDF_datatype"
+    for a description of the parameters.
+
+    :return outpath:        filepath to the output file
+    """
+
+    dataset = _extract_NetCDF_layer_data(netcdf, [layer_index])[layer_index]
+
+    print("creating dataset at {0}".format(outpath))
+
+    _gdal_dataset_to_tif(dataset, outpath,
+                        cust_projection = datatype.projectionTXT,
+                        cust_geotransform = datatype.geotransform,
+                        force_custom = force_custom,
+                        nodata_value = nodata_value)
+    return outpath
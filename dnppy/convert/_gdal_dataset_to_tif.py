@@ -5,9 +5,20 @@ import gdal
 import os
 from _convert_dtype import *
 
+
+# approximate number of pixels to copy from each band at a time
+WINDOW_PIXELS = 2 ** 22
+
+# predictor to use with DEFLATE, LZW or ZSTD compression, by output datatype
+PREDICTORS = {gdal.GDT_Float32: 3,
+              gdal.GDT_Float64: 3}
+
+
 def _gdal_dataset_to_tif(gdal_dataset, outpath, cust_projection = None,
                          cust_geotransform = None, force_custom = False,
-                         nodata_value = None):
+                         nodata_value = None, compress = "DEFLATE", tiled = True,
+                         block_size = 256, bigtiff = "IF_SAFER", overviews = None,
+                         creation_options = None):
     """
     This function takes a gdal dataset object as returned from the
     "_extract_HDF_layer_data" OR "_extractNetCDF_layer_data functions
@@ -15,6 +26,10 @@ def _gdal_dataset_to_tif(gdal_dataset, outpath, cust_projection = None,
     geotransform or custom ones. This function should be wrapped in another
     function for a specific datatype.
 
+    Data is copied one band and one window of rows at a time, so memory use
+    does not depend on the size of the dataset. Outputs are tiled and compressed
+    GeoTIFFs by default.
+
     :param gdal_dataset:        A gdal.Dataset object
     :param outpath:             Output filepath for this dataset (tif)
     :param cust_projection:     A projection string, see datatype_library
@@ -27,6 +42,17 @@ def _gdal_dataset_to_tif(gdal_dataset, outpath, cust_projection = None,
                                 if valid variables can be pulled from the
                                 gdal.dataset metadata.
     :param nodata_value:        The value to set to Nodata
+    :param compress:            GeoTIFF compression, such as "DEFLATE", "LZW", "ZSTD"
+                                (if supported by the installed gdal) or None. A horizontal
+                                differencing predictor is used with DEFLATE, LZW and ZSTD.
+    :param tiled:               set False to write strips instead of square tiles
+    :param block_size:          width and height of tiles in pixels
+    :param bigtiff:             gdal BIGTIFF creation option, "YES", "NO", "IF_NEEDED"
+                                or "IF_SAFER"
+    :param overviews:           optional list of overview levels to build inside the tif,
+                                such as [2, 4, 8, 16]
+    :param creation_options:    optional list of additional gdal GTiff creation options,
+                                such as ["ZLEVEL=9"]. These override the options above.
 
     :return outpath:            The local system filepath to output dataset
     """
@@ -62,36 +88,94 @@ def _gdal_dataset_to_tif(gdal_dataset, outpath, cust_projection = None,
     print("using projection {0}".format(projection))
     print("using geotransform {0}".format(geotransform))
 
-    # set up the numpy array
-    numpy_array = gdal_dataset.ReadAsArray()
-    shape = numpy_array.shape
-
-    # determine its shape
-    if len(shape) == 2:
-        xsize = shape[1]
-        ysize = shape[0]
-        numbands = 1
-    elif len(shape) == 3:
-        xsize = shape[2]
-        ysize = shape[1]
-        numbands = shape[0]
-    else:
-        raise Exception("cannot write 1 dimensional data to tif")
+    # determine the shape and datatype of the dataset
+    xsize    = gdal_dataset.RasterXSize
+    ysize    = gdal_dataset.RasterYSize
+    numbands = gdal_dataset.RasterCount
+
+    if numbands == 0:
+        raise Exception("cannot write a dataset without any bands to tif")
+
+    sample = gdal_dataset.GetRasterBand(1).ReadAsArray(0, 0, 1, 1)
+    gdal_type = _convert_dtype(sample.dtype)
 
     # create the tiff
+    options = _creation_options(gdal_type, compress, tiled, block_size, bigtiff, creation_options)
+
     gtiff = gdal.GetDriverByName("GTiff")
-    outdata = gtiff.Create(outpath, xsize, ysize, numbands, _convert_dtype(numpy_array.dtype))
+    outdata = gtiff.Create(outpath, xsize, ysize, numbands, gdal_type, options)
     outdata.SetProjection(projection)
     outdata.SetGeoTransform(geotransform)
 
-    # write each band
+    # copy each band, one window of whole rows at a time
+    rows = max(1, WINDOW_PIXELS // xsize)
+    if tiled:
+        rows = max(block_size, rows // block_size * block_size)
+
     for i in range(numbands):
-        outraster = outdata.GetRasterBand(i+1)
-        outraster.WriteArray(numpy_array, 0, 0)
+        inband    = gdal_dataset.GetRasterBand(i + 1)
+        outraster = outdata.GetRasterBand(i + 1)
+
         if nodata_value is not None:
             outraster.SetNoDataValue(nodata_value)
+
+        for yoff in range(0, ysize, rows):
+            window = inband.ReadAsArray(0, yoff, xsize, min(rows, ysize - yoff))
+            outraster.WriteArray(window, 0, yoff)
+            del window
+
         outraster.FlushCache()
+        del inband, outraster
+
+    if overviews:
+        _build_overviews(outdata, overviews, compress)
+
+    outdata.FlushCache()
+    del outdata
 
     return outpath
 
 
+def _creation_options(gdal_type, compress = "DEFLATE", tiled = True, block_size = 256,
+                      bigtiff = "IF_SAFER", creation_options = None):
+    """
+    Builds a list of gdal GTiff creation options
+    """
+
+    options = {}
+
+    if tiled:
+        options["TILED"]      = "YES"
+        options["BLOCKXSIZE"] = str(block_size)
+        options["BLOCKYSIZE"] = str(block_size)
+
+    if compress:
+        options["COMPRESS"] = compress.upper()
+        if options["COMPRESS"] in ["DEFLATE", "LZW", "ZSTD"]:
+            options["PREDICTOR"] = str(PREDICTORS.get(gdal_type, 2))
+
+    if bigtiff:
+        options["BIGTIFF"] = bigtiff
+
+    for option in (creation_options or []):
+        key, value = option.split("=", 1)
+        options[key.upper()] = value
+
+    return ["{0}={1}".format(key, value) for key, value in sorted(options.items())]
+
+
+def _build_overviews(outdata, overviews, compress = None, resampling = "NEAREST"):
+    """
+    Builds internal overviews of an open gdal dataset, compressed like the dataset
+    """
+
+    previous = gdal.GetConfigOption("COMPRESS_OVERVIEW")
+    if compress:
+        gdal.SetConfigOption("COMPRESS_OVERVIEW", compress.upper())
+
+    try:
+        outdata.BuildOverviews(resampling, list(overviews))
+    finally:
+        gdal.SetConfigOption("COMPRESS_OVERVIEW", previous)
+
+    return
@@ -0,0 +1,162 @@
+__author__ = 'jwely'
+__all__ = ["batch_extract"]
+
+from dnppy import core
+from dnppy.download.download_manifest import MANIFEST_NAME
+
+from timeit import default_timer
+import multiprocessing
+import gdal
+import os
+
+
+def batch_extract(jobs, workers = 1, force_overwrite = False, worker_mb = 512):
+    """
+    Runs many file by layer extraction jobs, optionally with a pool of worker processes.
+    This is the driver behind the ``workers`` option of the ``extract_*`` functions.
+
+    Each job is a tuple of ``(function, inpath, layer_index, outpath, kwargs)``, where
+    function is a module level function such as ``_extract_HDF_layer``, which is called as
+    ``function(inpath, layer_index, outpath, **kwargs)`` to write one layer of one file to
+    a tif. Each output is written to a ".part" file and renamed into place once complete,
+    so an interrupted batch never leaves a truncated tif under its final name, and outputs
+    that already exist and can be opened are skipped. Only ``workers`` jobs are in flight
+    at once and each one copies its layer a window at a time, so memory use depends on
+    the number of workers, not on the number or size of the files.
+
+    :param jobs:            list of (function, inpath, layer_index, outpath, kwargs) tuples
+    :param workers:         number of processes to use. With 1, jobs run in this process.
+    :param force_overwrite: set True to redo jobs whose outputs already exist
+    :param worker_mb:       approximate memory in MB for the gdal block cache of each worker
+
+    :return report:         list of dicts, one per job in input order, with keys "inpath",
+                            "layer_index", "outpath", "status" (one of "done", "skipped"
+                            or "failed"), "seconds" and "error".
+    """
+
+    report = [None] * len(jobs)
+    tasks  = []
+
+    for i, (function, inpath, layer_index, outpath, kwargs) in enumerate(jobs):
+        if not force_overwrite and _is_valid_output(outpath):
+            report[i] = _result(inpath, layer_index, outpath, "skipped")
+        else:
+            tasks.append((i, function, inpath, layer_index, outpath, kwargs))
+
+    print("Extracting {0} layers with {1} workers, skipping {2} existing outputs".format(
+        len(tasks), workers, len(jobs) - len(tasks)))
+
+    if workers > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(workers, len(tasks)), _init_extract_worker, (worker_mb,))
+        results = pool.imap_unordered(_extract_job, tasks)
+    else:
+        pool = None
+        results = (_extract_job(task) for task in tasks)
+
+    try:
+        for done, (i, result) in enumerate(results):
+            report[i] = result
+            print("{0} {1} ({2}/{3})".format(result["status"], result["outpath"], done + 1, len(tasks)))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    failed = [result for result in report if result["status"] == "failed"]
+    for result in failed:
+        print("Failed to extract layer {0} of {1}! {2}".format(
+            result["layer_index"], result["inpath"], result["error"]))
+
+    return report
+
+
+def _batch_outputs(report):
+    """
+    returns the output filepaths from a batch_extract report, raising an
+    exception after the whole batch has run if any of the jobs failed.
+    """
+
+    failed = [result for result in report if result["status"] == "failed"]
+    if failed:
+        raise Exception("{0} of {1} layers could not be extracted, the first error was {2}".format(
+            len(failed), len(report), failed[0]["error"]))
+
+    return [result["outpath"] for result in report]
+
+
+def _layer_jobs(filelist, layer_indexs, outdir, function, **kwargs):
+    """
+    returns batch_extract jobs for every layer of every file, with output names made by
+    ``core.create_outname``. outputs are placed next to inputs if outdir is None.
+    The download manifest and the ".part" files of unfinished downloads or extracts,
+    which share directories with the input files, are skipped.
+    """
+
+    jobs = []
+    for filepath in core.enf_filelist(filelist):
+        if os.path.basename(filepath) == MANIFEST_NAME or filepath.endswith(".part"):
+            continue
+
+        file_outdir = outdir or os.path.dirname(filepath)
+
+        # made here rather than by the workers, which could race to create it
+        if not os.path.exists(file_outdir):
+            os.makedirs(file_outdir)
+
+        for layer_index in core.enf_list(layer_indexs):
+            outpath = core.create_outname(file_outdir, filepath, str(layer_index), "tif")
+            jobs.append((function, filepath, layer_index, outpath, kwargs))
+
+    return jobs
+
+
+def _init_extract_worker(worker_mb):
+    """ limits the gdal block cache of each worker process """
+
+    gdal.SetCacheMax(int(worker_mb * 2 ** 20))
+    return
+
+
+def _extract_job(task):
+    """ runs one job, writing to a partial file that is renamed into place when complete """
+
+    i, function, inpath, layer_index, outpath, kwargs = task
+    part  = outpath + ".part"
+    start = default_timer()
+
+    try:
+        function(inpath, layer_index, part, **kwargs)
+
+        # windows will not rename over an existing file
+        if os.path.exists(outpath):
+            os.remove(outpath)
+        os.rename(part, outpath)
+
+        return i, _result(inpath, layer_index, outpath, "done", default_timer() - start)
+
+    except Exception as e:
+        if os.path.exists(part):
+            os.remove(part)
+        return i, _result(inpath, layer_index, outpath, "failed", default_timer() - start,
+                          "{0}: {1}".format(type(e).__name__, e))
+
+
+def _is_valid_output(outpath):
+    """ returns True if outpath is a raster that gdal can open, with at least one band """
+
+    if not os.path.isfile(outpath):
+        return False
+
+    dataset = gdal.Open(outpath)
+    return dataset is not None and dataset.RasterCount > 0
+
+
+def _result(inpath, layer_index, outpath, status, seconds = 0.0, error = None):
+    """ builds one entry of a batch_extract report """
+
+    return {"inpath":      inpath,
+            "layer_index": layer_index,
+            "outpath":     outpath,
+            "status":      status,
+            "seconds":     round(seconds, 3),
+            "error":       error}
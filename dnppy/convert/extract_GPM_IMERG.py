@@ -4,16 +4,41 @@ __all__ = ["extract_GPM_IMERG"]
 from dnppy import core
 from datatype_library import *
 from _extract_HDF_datatype import *
+from _convert_dtype import _convert_dtype
+from _gdal_dataset_to_tif import _creation_options
+from HDF5_to_numpy import HDF5_to_numpy
+from batch_extract import *
+from batch_extract import _batch_outputs, _layer_jobs
 
-def extract_GPM_IMERG(hdf_list, layer_indexs, outdir = None, resolution = "0.1"):
+import gdal
+import os
+
+def extract_GPM_IMERG(hdf_list, layer_indexs, outdir = None, resolution = "0.1",
+                      backend = "gdal", window = None, step = None, workers = 1,
+                      force_overwrite = False, report = False):
     """
     Extracts GPM_IMERG data from its HDF5 format.
 
+    With the "h5py" backend, layers are read with ``HDF5_to_numpy`` one block of
+    native HDF5 chunks at a time, and only the chunks that overlap the window are read
+    at all, so small regions may be extracted from global files quickly.
+
     :param hdf_list:        list of hdf files or directory with hdfs
-    :param layer_indexs:    list of integer layer indexs
+    :param layer_indexs:    list of integer layer indexs, as listed in the table below.
+                            The same indexes select the same layers with either backend.
     :param outdir:          directory to place outputs
     :param resolution:      The size of a pixel in degrees, either
                             "0.1" or "0.15" depending on GPM product.
+    :param backend:         either "gdal" or "h5py". The h5py backend is always used
+                            if a window or step is given.
+    :param window:          optional (xoff, yoff, xsize, ysize) pixel window of each layer
+                            to extract, where x is the last (latitude) axis of the layer.
+    :param step:            optional int, or (xstep, ystep) tuple, to extract only every
+                            nth pixel of each layer.
+    :param workers:         number of processes with which to extract layers, see ``batch_extract``
+    :param force_overwrite: set True to extract layers even if valid outputs already exist
+    :param report:          set True to return the ``batch_extract`` report, with the status and
+                            time of every layer, rather than the list of output files.
     :return:                a list of all files created as output
 
     Typical contents of a GPM HDF are:
@@ -33,20 +58,66 @@ def extract_GPM_IMERG(hdf_list, layer_indexs, outdir = None, resolution = "0.1")
     == =========== ================================ ==============
     """
 
-    hdf_list = core.enf_filelist(hdf_list)
-    output_filelist = []
-
     # load the GPM datatype from the library
     datatype = datatype_library()["GPM_IMERG_{0}_GLOBAL".format(resolution)]
 
-    # for every hdf file in the input list
-    for hdf in hdf_list:
-        # extract layers and add the new filepaths to the output filelist
-        hdf_output_filelist =  _extract_HDF_datatype(hdf, layer_indexs, outdir,
-                                                     datatype, nodata_value = -9999.9)
-        output_filelist +=  hdf_output_filelist
+    # extract every layer of every hdf file in the input list
+    if backend == "h5py" or window is not None or step is not None:
+        jobs = _layer_jobs(hdf_list, layer_indexs, outdir, _extract_GPM_IMERG_h5py_layer,
+                           datatype = datatype, nodata_value = -9999.9, window = window, step = step)
+    else:
+        jobs = _layer_jobs(hdf_list, layer_indexs, outdir, _extract_HDF_layer,
+                           datatype = datatype, nodata_value = -9999.9)
+
+    results = batch_extract(jobs, workers, force_overwrite)
+
+    if report:
+        return results
+    return _batch_outputs(results)
+
+
+def _extract_GPM_IMERG_h5py_layer(hdf, layer_index, outpath, datatype, nodata_value,
+                                  window = None, step = None):
+    """
+    Extracts one layer from one GPM IMERG file to tif with h5py, streaming it
+    one block of rows at a time into a tiled and compressed GeoTIFF.
+
+    :return outpath:        filepath to the output file
+    """
+
+    layer = list(HDF5_to_numpy(hdf, layer_index, lazy = True).values())[0]
+    print("creating dataset at {0}".format(outpath))
+
+    # leading axes (such as time) must be of length one
+    shape = layer.out_shape(window, step)
+    if len(shape) < 2 or any(size != 1 for size in shape[:-2]):
+        raise Exception("cannot write layer of shape {0} to a single band tif".format(layer.shape))
+    ysize, xsize = shape[-2:]
+
+    # shift and scale the geotransform to the window and step
+    xoff, yoff = layer._window(window)[:2]
+    xstep, ystep = layer._step(step)
+    A, B, C, D, E, F = datatype.geotransform
+    geotransform = (A + xoff * B + yoff * C, B * xstep, C * ystep,
+                    D + xoff * E + yoff * F, E * xstep, F * ystep)
+
+    gdal_type = _convert_dtype(layer.dtype)
+
+    gtiff = gdal.GetDriverByName("GTiff")
+    outdata = gtiff.Create(outpath, xsize, ysize, 1, gdal_type, _creation_options(gdal_type))
+    outdata.SetProjection(datatype.projectionTXT)
+    outdata.SetGeoTransform(geotransform)
+
+    outraster = outdata.GetRasterBand(1)
+    outraster.SetNoDataValue(nodata_value)
+
+    for row, block in layer.iter_blocks(window, step):
+        outraster.WriteArray(block.reshape(block.shape[-2:]), 0, row)
+
+    outraster.FlushCache()
+    del outraster, outdata
 
-    return output_filelist
+    return outpath
 
 
 if __name__ == "__main__":
@@ -3,11 +3,13 @@ __all__ = ["extract_MPE_NetCDF"]
 
 from dnppy import core
 from datatype_library import *
-from _extract_NetCDF_layer_data import *
-from _gdal_dataset_to_tif import *
+from _extract_NetCDF_datatype import *
+from batch_extract import *
+from batch_extract import _batch_outputs, _layer_jobs
 
 
-def extract_MPE_NetCDF(netcdf_list, layer_indexs, outdir, area):
+def extract_MPE_NetCDF(netcdf_list, layer_indexs, outdir, area, workers = 1,
+                       force_overwrite = False, report = False):
     """
     extracts SMOS data from its native NetCDF format.
 
@@ -15,36 +17,25 @@ def extract_MPE_NetCDF(netcdf_list, layer_indexs, outdir, area):
     :param layer_indexs:    list of integer layer indices
     :param outdir:          directory to place outputs
     :param area:            presently only supports "CONUS"
+    :param workers:         number of processes with which to extract layers, see ``batch_extract``
+    :param force_overwrite: set True to extract layers even if valid outputs already exist
+    :param report:          set True to return the ``batch_extract`` report, with the status and
+                            time of every layer, rather than the list of output files.
 
     :return:                A list of all files created as output
     """
 
-    netcdf_list = core.enf_filelist(netcdf_list)
-    output_filelist = []
-
-    # load the GPM datatype from the library
+    # load the MPE datatype from the library
     dtype = datatype_library()["MPE_HRAP_{0}".format(area)]
 
-    # for every hdf file in the input list
-    for netcdf in netcdf_list:
-        data = _extract_NetCDF_layer_data(netcdf, layer_indexs)
-
-        for layer_index in layer_indexs:
-
-            dataset = data[layer_index]
-            outpath = core.create_outname(outdir, netcdf, str(layer_index), "tif")
-
-            print("creating dataset at {0}".format(outpath))
-
-            _gdal_dataset_to_tif(dataset, outpath,
-                                cust_projection = dtype.projectionTXT,
-                                cust_geotransform = dtype.geotransform,
-                                force_custom = False,
-                                nodata_value = -1)
-
-            output_filelist.append(outpath)
+    # extract every layer of every netcdf file in the input list
+    jobs = _layer_jobs(netcdf_list, layer_indexs, outdir, _extract_NetCDF_layer,
+                       datatype = dtype, nodata_value = -1)
+    results = batch_extract(jobs, workers, force_overwrite)
 
-    return output_filelist
+    if report:
+        return results
+    return _batch_outputs(results)
 
 
 if __name__ == "__main__":
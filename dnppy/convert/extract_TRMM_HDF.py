@@ -4,8 +4,11 @@ __all__ = ["extract_TRMM_HDF"]
 from dnppy import core
 from datatype_library import *
 from _extract_HDF_datatype import *
+from batch_extract import *
+from batch_extract import _batch_outputs, _layer_jobs
 
-def extract_TRMM_HDF(hdf_list, layer_indexs, outdir, resolution):
+def extract_TRMM_HDF(hdf_list, layer_indexs, outdir, resolution, workers = 1,
+                     force_overwrite = False, report = False):
     """
     Extracts TRMM products from HDF to tif.
     http://pmm.nasa.gov/data-access/data-products
@@ -16,23 +19,24 @@ def extract_TRMM_HDF(hdf_list, layer_indexs, outdir, resolution):
     :param resolution:      The size of a pixel in degrees, either
                             "0.25", "0.5", "1.0", "5.0" depending on
                             the specific TRMM product you are extracting.
+    :param workers:         number of processes with which to extract layers, see ``batch_extract``
+    :param force_overwrite: set True to extract layers even if valid outputs already exist
+    :param report:          set True to return the ``batch_extract`` report, with the status and
+                            time of every layer, rather than the list of output files.
     :return:                a list of all files created as output
 
     """
 
-    hdf_list = core.enf_filelist(hdf_list)
-    output_filelist = []
-
     # load the GPM datatype from the library
     datatype = datatype_library()["TRMM_{0}_GLOBAL".format(resolution)]
 
-    # for every hdf file in the input list
-    for hdf in hdf_list:
-        # extract layers and add the new filepaths to the output filelist
-        hdf_output_filelist =  _extract_HDF_datatype(hdf, layer_indexs, outdir, datatype)
-        output_filelist +=  hdf_output_filelist
+    # extract every layer of every hdf file in the input list
+    jobs = _layer_jobs(hdf_list, layer_indexs, outdir, _extract_HDF_layer, datatype = datatype)
+    results = batch_extract(jobs, workers, force_overwrite)
 
-    return output_filelist
+    if report:
+        return results
+    return _batch_outputs(results)
 
 
 if __name__ == "__main__":
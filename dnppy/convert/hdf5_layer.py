@@ -0,0 +1,161 @@
+__author__ = 'jwely'
+__all__ = ["hdf5_layer"]
+
+import h5py
+
+
+# approximate number of pixels to read at a time when iterating over blocks
+WINDOW_PIXELS = 2 ** 22
+
+
+class hdf5_layer():
+    """
+    Lazy handle to a single layer (dataset) within an HDF5 file
+
+    Creating an hdf5_layer only reads the shape, datatype, chunking and attributes
+    of the layer. Pixel values are read from the file only when requested, and h5py
+    only reads and decompresses the native HDF5 chunks that overlap the request,
+    so pulling a small region out of a large granule is fast and uses little memory.
+
+    Layers may be sliced just like numpy arrays, for example ``layer[100:200, 50:150]``,
+    or read with ``read`` and ``iter_blocks`` using a pixel window and a step for
+    decimation. Windows and steps apply to the last two axes of the layer, where
+    x is the last axis (columns) and y is the second to last axis (rows). Any
+    leading axes (such as a time axis of length one) are read in full. Layers with
+    fewer than two axes, such as the "lat", "lon" and "time" vectors of GPM files,
+    have no rows and columns to window, so they are always read whole.
+
+    :param hdfpath:     filepath to an HDF5 file
+    :param name:        full name of the layer within the file, such as "Grid/precipitationCal"
+    """
+
+    def __init__(self, hdfpath, name):
+
+        self.hdfpath = hdfpath
+        self.name = name
+
+        with h5py.File(hdfpath, "r") as hdf:
+            dataset = hdf[name]
+
+            self.shape  = dataset.shape
+            self.dtype  = dataset.dtype
+            self.chunks = dataset.chunks
+            self.attrs  = dict(dataset.attrs)
+        return
+
+
+    def __repr__(self):
+        return "<hdf5_layer '{0}' shape {1} {2}>".format(self.name, self.shape, self.dtype)
+
+
+    def __getitem__(self, key):
+        """ reads only the requested hyperslab of the layer """
+
+        with h5py.File(self.hdfpath, "r") as hdf:
+            return hdf[self.name][key]
+
+
+    def read(self, window = None, step = None):
+        """
+        Reads a window of the layer, optionally taking only every nth pixel
+
+        :param window:      (xoff, yoff, xsize, ysize) pixel window to read, or None
+                            to read the whole layer
+        :param step:        int, or (xstep, ystep) tuple, to read only every nth
+                            column and row. Defaults to 1, every pixel.
+
+        :return numpy_rast: numpy array of the layer values within the window
+        """
+
+        if len(self.shape) < 2:
+            return self[()]
+        return self[self._selection(window, step)]
+
+
+    def iter_blocks(self, window = None, step = None, window_pixels = WINDOW_PIXELS):
+        """
+        Generator that reads a window of the layer one block of rows at a time. Blocks
+        are a whole number of native HDF5 chunks tall, so no chunk is read twice.
+
+        :param window:          (xoff, yoff, xsize, ysize) pixel window to read, or None
+        :param step:            int, or (xstep, ystep) tuple, for decimation
+        :param window_pixels:   approximate number of pixels to read at a time
+
+        :return generator:      yields (row_offset, numpy_rast) tuples, where row_offset
+                                is the first row of the block within the output array
+        """
+
+        if len(self.shape) < 2:
+            yield 0, self[()]
+            return
+
+        xoff, yoff, xsize, ysize = self._window(window)
+        xstep, ystep = self._step(step)
+
+        out_rows = len(range(yoff, yoff + ysize, ystep))
+        out_cols = len(range(xoff, xoff + xsize, xstep))
+
+        # read a whole number of chunks along the row axis at a time
+        chunk_rows = self.chunks[-2] if self.chunks else 1
+        src_rows   = max(1, window_pixels // max(out_cols * xstep, 1))
+        src_rows   = max(chunk_rows, src_rows // chunk_rows * chunk_rows)
+        block_rows = max(1, src_rows // ystep)
+
+        lead = tuple(slice(None) for axis in self.shape[:-2])
+        cols = slice(xoff, xoff + xsize, xstep)
+
+        with h5py.File(self.hdfpath, "r") as hdf:
+            dataset = hdf[self.name]
+
+            for row in range(0, out_rows, block_rows):
+                start = yoff + row * ystep
+                stop  = yoff + min(row + block_rows, out_rows) * ystep
+                yield row, dataset[lead + (slice(start, stop, ystep), cols)]
+
+
+    def out_shape(self, window = None, step = None):
+        """ returns the shape of the array that ``read`` would return """
+
+        if len(self.shape) < 2:
+            return self.shape
+
+        xoff, yoff, xsize, ysize = self._window(window)
+        xstep, ystep = self._step(step)
+
+        return self.shape[:-2] + (len(range(yoff, yoff + ysize, ystep)),
+                                  len(range(xoff, xoff + xsize, xstep)))
+
+
+    def _window(self, window = None):
+        """ returns a window clipped to the extent of the layer """
+
+        ys, xs = self.shape[-2:]
+        if window is None:
+            return 0, 0, xs, ys
+
+        xoff, yoff, xsize, ysize = [int(value) for value in window]
+        if not (0 <= xoff < xs and 0 <= yoff < ys and xsize > 0 and ysize > 0):
+            raise Exception("window {0} is outside of layer with shape {1}".format(window, self.shape))
+
+        return xoff, yoff, min(xsize, xs - xoff), min(ysize, ys - yoff)
+
+
+    @staticmethod
+    def _step(step = None):
+        """ returns an (xstep, ystep) tuple """
+
+        if step is None:
+            return 1, 1
+        if isinstance(step, int):
+            return step, step
+        return int(step[0]), int(step[1])
+
+
+    def _selection(self, window = None, step = None):
+        """ returns a tuple of slices for a window and step """
+
+        xoff, yoff, xsize, ysize = self._window(window)
+        xstep, ystep = self._step(step)
+
+        return tuple(slice(None) for axis in self.shape[:-2]) + \
+               (slice(yoff, yoff + ysize, ystep), slice(xoff, xoff + xsize, xstep))
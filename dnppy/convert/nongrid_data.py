@@ -5,8 +5,18 @@ from ll_to_utm import *
 import numpy
 import math
 from scipy import interpolate
+from scipy.spatial import cKDTree
+import multiprocessing
 import datetime
 
+
+# approximate number of output grid cells to interpolate at a time
+CHUNK_CELLS = 250000
+
+# interpolation methods available to sample_by_grid
+METHODS = ["nearest", "idw", "linear", "cubic"]
+
+
 class nongrid_data():
     """
     This class houses non-gridded datasets. Its methods can be used
@@ -24,6 +34,9 @@ class nongrid_data():
 
     This sorting is done to optimize processing time when building
     a gridded dataset from what is effectively assumed to be point data.
+    Points within any rectangle are found by a binary search on utm_x,
+    and nearest neighbours are found with a KD-tree over all the points,
+    which is built once, the first time it is needed.
 
     :param lat:          matrix of values representing latitude
     :param lon:          matrix of values representing longitude
@@ -51,10 +64,10 @@ class nongrid_data():
             raise Exception("inputs are not the same dimensions!")
 
         # get bounding box info
-        self.min_lat = min(self.lat)
-        self.max_lat = max(self.lat)
-        self.min_lon = min(self.lon)
-        self.max_lon = max(self.lon)
+        self.min_lat = numpy.min(self.lat)
+        self.max_lat = numpy.max(self.lat)
+        self.min_lon = numpy.min(self.lon)
+        self.max_lon = numpy.max(self.lon)
 
         # determine the UTM zone of the center point of this data.
         self.mid_lon = self.max_lon - self.min_lon / 2
@@ -67,9 +80,14 @@ class nongrid_data():
         utmx, utmy = ll_to_utm(self.lat, self.lon, self.utm_zone, self.hemisphere)
 
         # sorts the data (transformed into utm space) by utmx
-        self.utmx = sorted(utmx)
-        self.utmy = [y for (x,y) in sorted(zip(utmx, utmy))]
-        self.data = [d for (x,d) in sorted(zip(utmx, self.data))]
+        order = numpy.argsort(utmx, kind = "mergesort")
+        self.utmx = utmx[order]
+        self.utmy = utmy[order]
+        self.data = self.data[order]
+        del order
+
+        # KD-tree of (utmx, utmy) points, see _get_index
+        self.index = None
 
         # find min and maximum utm coordinates
         self.min_utmx = numpy.min(self.utmx)
@@ -77,6 +95,10 @@ class nongrid_data():
         self.max_utmx = numpy.max(self.utmx)
         self.max_utmy = numpy.max(self.utmy)
 
+        # approximate distance between points, if they were spread evenly over the bounding box
+        self.spacing = ((self.max_utmx - self.min_utmx) * (self.max_utmy - self.min_utmy) /
+                        max(len(self.data), 1)) ** 0.5
+
         # print a summary
         print("location: UTM zone {0}{1}".format(self.utm_zone, self.hemisphere))
         print("LL UTM coordinates: {0} , {1}".format(self.min_utmx, self.min_utmy))
@@ -121,46 +143,85 @@ class nongrid_data():
         return dist
 
 
-    def _sample_by_location(self, utmx_matrix, utmy_matrix, resolution):
+    def _get_index(self):
+        """
+        returns a KD-tree of all (utmx, utmy) points, building it the first time.
+        """
+
+        if self.index is None:
+            print("Building spatial index of {0} points".format(len(self.data)))
+            # median splits are very slow to build on points already sorted by utmx,
+            # so the tree is split at the midpoint of each node instead.
+            self.index = cKDTree(numpy.column_stack((self.utmx, self.utmy)), balanced_tree = False)
+
+        return self.index
+
+
+    def _points_in_box(self, lowx, highx, lowy, highy):
+        """
+        returns the utmx, utmy and data values of all points strictly inside a box.
+        points are sorted by utmx, so the x range is found with a binary search.
+        """
+
+        start = numpy.searchsorted(self.utmx, lowx, side = "right")
+        stop  = numpy.searchsorted(self.utmx, highx, side = "left")
+
+        suby   = self.utmy[start:stop]
+        inside = (suby > lowy) & (suby < highy)
+
+        return self.utmx[start:stop][inside], suby[inside], self.data[start:stop][inside]
+
+
+    def _sample_by_location(self, utmx_matrix, utmy_matrix, resolution, method = "cubic",
+                            neighbors = 8, power = 2):
         """
         performs grid interpolation for a smaller subset of the total dataset.
-        utmx_matrix and utmy_matrix are the two components of a meshgrid
+        utmx_matrix and utmy_matrix are the two components of a meshgrid.
+        With the "nearest" and "idw" methods, grid cells without any points within
+        three pixels of them are set to nan. The scipy griddata methods ("linear"
+        and "cubic") use points within three pixels plus a margin around the chunk,
+        and set only cells outside the convex hull of those points to nan.
         """
 
         # establish a sample distance
         samp_dist = abs(3 * resolution)
 
-        # sort out data that is too far from input grid points
+        if method in ["nearest", "idw"]:
+            cells = numpy.column_stack((utmx_matrix.ravel(), utmy_matrix.ravel()))
+            k = 1 if method == "nearest" else neighbors
+
+            print("\t Finding {0} nearest points to each cell of {1} grid...".format(
+                                                        k, utmx_matrix.shape))
+            dist, idx = self._get_index().query(cells, k = k, distance_upper_bound = samp_dist)
+            dist = dist.reshape(len(cells), k)
+            idx  = idx.reshape(len(cells), k)
+
+            # missing neighbors are given an index equal to the number of points
+            found  = numpy.isfinite(dist)
+            values = self.data[numpy.where(found, idx, 0)].astype("float64")
+
+            if method == "nearest":
+                location_data_value = numpy.where(found[:, 0], values[:, 0], numpy.nan)
+
+            else:
+                with numpy.errstate(divide = "ignore", invalid = "ignore"):
+                    weights = numpy.where(found, 1.0 / dist ** power, 0.0)
+                    location_data_value = (weights * values).sum(axis = 1) / weights.sum(axis = 1)
+
+                # cells that fall exactly upon a point take its value
+                exact = found[:, 0] & (dist[:, 0] == 0)
+                location_data_value[exact] = values[exact, 0]
+
+            return location_data_value.reshape(utmx_matrix.shape)
+
+        # sort out data that is too far from input grid points, keeping a margin of a few
+        # points around the chunk so its edges are interpolated just like its middle.
         print("\t Subsetting samples...")
-        lowx = numpy.min(utmx_matrix) - samp_dist
-        highx = numpy.max(utmx_matrix) + samp_dist
-
-        lowy = numpy.min(utmy_matrix) - samp_dist
-        highy = numpy.max(utmy_matrix) + samp_dist
-
-        # remove low x points
-        lowxmask = numpy.where(numpy.array(self.utmx) > lowx)
-        subutmx = numpy.array(self.utmx)[lowxmask]
-        subutmy = numpy.array(self.utmy)[lowxmask]
-        subdata = numpy.array(self.data)[lowxmask]
-
-        # remove high x points
-        highxmask = numpy.where(subutmx < highx)
-        subutmx = subutmx[highxmask]
-        subutmy = subutmy[highxmask]
-        subdata = subdata[highxmask]
-
-        # remove low y points
-        lowymask = numpy.where(subutmy > lowy)
-        subutmx = subutmx[lowymask]
-        subutmy = subutmy[lowymask]
-        subdata = subdata[lowymask]
-
-        # remove high y points
-        #highymask = numpy.where(subutmy < highy)
-        #subutmx = subutmx[highymask]
-        #subutmy = subutmy[highymask]
-        #subdata = subdata[highymask]
+        margin = samp_dist + 3 * self.spacing
+        subutmx, subutmy, subdata = self._points_in_box(numpy.min(utmx_matrix) - margin,
+                                                        numpy.max(utmx_matrix) + margin,
+                                                        numpy.min(utmy_matrix) - margin,
+                                                        numpy.max(utmy_matrix) + margin)
 
         print("\t Performing interpolation across {1} grid with {0} points...".format(
                                             len(subdata), utmx_matrix.shape))
@@ -169,57 +230,137 @@ class nongrid_data():
         points = (subutmx, subutmy)
         meshgrid = (utmx_matrix, utmy_matrix)
 
-        if subdata.shape[0] != 0:
-            location_data_value = interpolate.griddata(points, subdata, meshgrid, method = "cubic")
+        if subdata.shape[0] >= 3:
+            location_data_value = interpolate.griddata(points, subdata, meshgrid, method = method)
             return location_data_value
         else:
-            return utmx_matrix * 0
+            return utmx_matrix * numpy.nan
 
 
-
-    def sample_by_grid(self, resolution):
+    def sample_by_grid(self, resolution, method = "cubic", chunk_cells = CHUNK_CELLS,
+                       neighbors = 8, power = 2, workers = 1, outpath = None):
         """
         Grids a dataset to the desired resolution in a UTM projection. input
         resolution is the length of one square pixel on a side in meters.
+
+        The output grid is built one chunk at a time, and only points near each chunk
+        (including a halo of points around its edges) are used to interpolate it, so
+        chunks match where they meet. Chunks may be spread across several worker
+        processes, and the output may be written to a memory mapped file instead of
+        being held in memory. Output cells without any points within three pixels of
+        them are set to nan.
+
+        :param resolution:      the length of one side of a square output pixel in meters
+        :param method:          interpolation method, one of:
+                                "nearest" value of the closest point,
+                                "idw" inverse distance weighted mean of the closest points,
+                                "linear" or "cubic" interpolation between points, with
+                                ``scipy.interpolate.griddata``. Defaults to "cubic".
+        :param chunk_cells:     approximate number of output cells to interpolate at a time
+        :param neighbors:       number of closest points to weight when method is "idw"
+        :param power:           distance exponent of weights when method is "idw"
+        :param workers:         number of processes to grid chunks with. On windows, calling
+                                scripts must be protected by ``if __name__ == "__main__":``
+        :param outpath:         optional filepath of a ".npy" file to hold the output grid as a
+                                numpy memmap, for grids too large to keep in memory.
+
+        :return outgrid:        2d numpy array (or memmap) with utmx along the first axis
         """
 
-        # build range arrays
-        x_range = list(numpy.arange(self.min_utmx, self.max_utmx, resolution))
-        y_range = list(numpy.arange(self.min_utmy, self.max_utmy, resolution))
+        if method not in METHODS:
+            raise Exception("method must be one of {0}".format(METHODS))
 
-        # build meshgrid
-        x_mesh, y_mesh = numpy.mgrid[self.min_utmx:self.max_utmx:complex(0,len(x_range)),
-                                     self.min_utmy:self.max_utmy:complex(0,len(y_range))]
+        # build range arrays
+        nx = len(numpy.arange(self.min_utmx, self.max_utmx, resolution))
+        ny = len(numpy.arange(self.min_utmy, self.max_utmy, resolution))
 
-        outgrid = numpy.zeros((len(x_range), len(y_range)))
+        # coordinates along each axis of the output meshgrid
+        x_axis = numpy.mgrid[self.min_utmx:self.max_utmx:complex(0, nx)]
+        y_axis = numpy.mgrid[self.min_utmy:self.max_utmy:complex(0, ny)]
 
-        # divide into equal number of slices and chunks
-        num_slices = int(((len(x_range) * len(y_range)) / 800000) * (2 ** 0.5))
-        slice_width = len(x_range) / float(num_slices)
+        if outpath is None:
+            outgrid = numpy.zeros((nx, ny))
+        else:
+            outgrid = numpy.lib.format.open_memmap(outpath, mode = "w+",
+                                                   dtype = "float64", shape = (nx, ny))
 
-        num_chunks = num_slices
-        chunk_height = len(y_range) / float(num_chunks)
+        chunks = self._grid_chunks(nx, ny, chunk_cells)
+        tasks  = [(xslice, yslice, x_axis[xslice], y_axis[yslice],
+                   resolution, method, neighbors, power) for xslice, yslice in chunks]
 
-        # perform griding for one slice of the output grid at a time.
+        # perform griding for one chunk of the output grid at a time.
         print("Dividing dataset into {0} pieces and griding to a matrix of size {1}".format(
-                                                        num_slices * num_chunks, outgrid.shape))
+                                                        len(chunks), outgrid.shape))
 
-        for aslice in range(num_slices):
-            for chunk in range(num_chunks):
+        # build the spatial index up front, so worker processes do not each build one
+        if method in ["nearest", "idw"]:
+            self._get_index()
 
-                print("processing chunk {0},{1}".format(aslice + 1, chunk + 1))
+        if workers > 1:
+            print("Griding chunks with {0} workers".format(workers))
+            pool = multiprocessing.Pool(workers, _init_grid_worker, (self,))
+            results = pool.imap_unordered(_grid_chunk, tasks)
+        else:
+            pool = None
+            _init_grid_worker(self)
+            results = (_grid_chunk(task) for task in tasks)
+
+        try:
+            for i, (xslice, yslice, outchunk) in enumerate(results):
+                outgrid[xslice, yslice] = outchunk
+                print("finished chunk {0} of {1} ({2:.0f}%)".format(
+                    i + 1, len(chunks), 100.0 * (i + 1) / len(chunks)))
+        finally:
+            _init_grid_worker(None)
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        if outpath is not None:
+            outgrid.flush()
 
-                chunkrange = slice(int(chunk * chunk_height),int((chunk + 1) * chunk_height))
-                slicerange = slice(int(aslice * slice_width),int((aslice + 1) * slice_width))
-                slice_x_mesh = x_mesh[chunkrange, slicerange]
-                slice_y_mesh = y_mesh[chunkrange, slicerange]
+        return outgrid
 
-                outslice = self._sample_by_location(slice_x_mesh, slice_y_mesh, resolution)
-                outgrid[chunkrange, slicerange] = outslice
 
-        print("100%")
+    @staticmethod
+    def _grid_chunks(nx, ny, chunk_cells = CHUNK_CELLS):
+        """
+        returns a list of (xslice, yslice) square chunks that cover an (nx, ny) grid
+        """
 
-        return outgrid
+        side = max(1, int(chunk_cells ** 0.5))
+        return [(slice(x, min(x + side, nx)), slice(y, min(y + side, ny)))
+                for x in range(0, nx, side) for y in range(0, ny, side)]
+
+
+# nongrid_data instance used by _grid_chunk, set in each worker process
+_grid_data = None
+
+
+def _init_grid_worker(ngd):
+    """
+    Gives a worker process the nongrid_data instance to grid chunks from, so that
+    the points are only passed to each worker once, rather than with every chunk.
+    """
+
+    global _grid_data
+    _grid_data = ngd
+    return
+
+
+def _grid_chunk(task):
+    """
+    Worker function for ``sample_by_grid``, interpolates one chunk of the output
+    grid and returns (xslice, yslice, values)
+    """
+
+    xslice, yslice, x_coords, y_coords, resolution, method, neighbors, power = task
+
+    chunk_x_mesh, chunk_y_mesh = numpy.meshgrid(x_coords, y_coords, indexing = "ij")
+    outchunk = _grid_data._sample_by_location(chunk_x_mesh, chunk_y_mesh, resolution,
+                                              method, neighbors, power)
+
+    return xslice, yslice, outchunk
 
 
 # testing area
@@ -8,7 +8,9 @@ __author__ = ["Jwely",
               "lancewatkins"]
 
 # local imports
+from download_engine import *
 from download_filelist import *
+from download_manifest import *
 from download_url import *
 from download_urls import *
 
@@ -19,8 +21,10 @@ from fetch_MODIS import *
 from fetch_MPE import *
 from fetch_SRTM import *
 from fetch_TRMM import *
+from landsat8_scene_index import *
 
 
 from list_http_e4ftl01 import *
 from list_http_waterweather import *
 from list_ftp import *
+from listing_index import *
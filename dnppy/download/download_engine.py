@@ -0,0 +1,825 @@
+__author__ = 'jwely'
+__all__ = ["download_engine"]
+
+import httplib
+import ftplib
+import urlparse
+import threading
+import Queue
+import socket
+import random
+import time
+import os
+
+from download_manifest import download_manifest, parse_checksum, file_checksum
+
+
+# number of bytes to read from a connection and write to disk at a time
+CHUNK_BYTES = 2 ** 20
+
+# maximum number of http redirects to follow for a single url
+MAX_REDIRECTS = 5
+
+
+class download_engine():
+    """
+    Downloads files from http(s) and ftp servers with a pool of worker threads,
+    reusing connections to each host.
+
+    A download_engine keeps idle http connections and logged in ftp sessions for every
+    host it has downloaded from, so many files from the same server are fetched without
+    a new connection, login or handshake for each one. The number of simultaneous
+    downloads from any single host is limited to ``max_per_host``, to avoid rejections
+    from servers that limit concurrent requests. Failed downloads are retried with
+    exponentially increasing waits.
+
+    Each file is streamed in chunks to a ``.part`` file next to its output, and renamed
+    into place once its size (and checksum, if one is given) has been checked, so partial
+    files never appear under their final names. A ``.part`` file left by a failed or
+    killed download is resumed from its last byte with an http range request or an ftp
+    REST command, so restarting a large job only costs the missing bytes. Completed files
+    are recorded in a ``download_manifest`` within each output directory, which is used
+    to tell complete files from truncated or altered ones on later runs.
+
+    :param workers:         maximum number of files to download at once with ``download_many``
+    :param max_per_host:    maximum number of simultaneous downloads from any one host
+    :param retries:         number of times to retry a failed download
+    :param backoff:         seconds to wait before the first retry, doubled for each retry
+    :param timeout:         socket timeout in seconds
+
+    Usage example
+
+    .. code-block:: python
+
+        engine = download_engine(workers = 8, max_per_host = 4)
+        failed = engine.download_many([(url, outpath) for url, outpath in zip(urls, outpaths)])
+        engine.close()
+    """
+
+    def __init__(self, workers = 4, max_per_host = 2, retries = 2, backoff = 5, timeout = 60):
+
+        self.workers      = workers
+        self.max_per_host = max_per_host
+        self.retries      = retries
+        self.backoff      = backoff
+        self.timeout      = timeout
+
+        self.lock        = threading.Lock()
+        self.host_limits = {}       # (scheme, host, port) : Semaphore
+        self.idle        = {}       # (scheme, host, port, username, password) : list of connections
+        self.manifests   = {}       # directory : download_manifest
+        return
+
+
+    def download(self, url, outname, force_overwrite = False, username = None, password = None,
+                 checksum = None, verify = False):
+        """
+        Downloads a single file, retrying it if it fails. Interrupted downloads
+        are resumed from where they stopped.
+
+        :param url:             a string url to file for download
+        :param outname:         filepath to write location of file
+        :param force_overwrite: set True to replace an existing file at outname
+        :param username:        use if url leads to file on ftp server with username
+        :param password:        use if url leads to file on ftp server with password
+        :param checksum:        optional expected checksum of the file, such as "md5:<hexdigest>",
+                                as given by some server listings. Files that do not match are
+                                downloaded again.
+        :param verify:          set True to check existing files against the size (and version,
+                                where the server gives one) of the file on the server, and
+                                download only the missing or changed parts of any that differ.
+                                Existing files are kept as they are if the server cannot be
+                                reached or does not have the file.
+
+        :return outname:        filepath to the downloaded file, or None if the server
+                                reported that the file does not exist (http 404)
+        """
+
+        head, tail = os.path.split(os.path.abspath(outname))
+        manifest = self._manifest(head)
+        part  = outname + ".part"
+        moved = None        # (size, mtime) of an existing file moved aside to be re-fetched
+
+        if force_overwrite:
+            if os.path.exists(part):
+                os.remove(part)
+            manifest.remove(tail)
+
+        # if output file already exists and is complete, do not download a file there.
+        elif os.path.isfile(outname):
+            if not self._needs_download(manifest, tail, outname, checksum, verify):
+                return outname
+
+            # ask the server before touching the file, so it is kept if the server cannot be reached
+            remote = None
+            if verify and checksum is None:
+                remote = self._remote_stat(url, username, password)
+                if remote is None:
+                    print("{0} was not found on the server, keeping the existing file".format(tail))
+                    return None
+
+                if self._matches_remote(manifest, tail, outname, remote):
+                    manifest.record_complete(tail, url = url, **remote)
+                    return outname
+
+            # treat a suspect file as a partial download, so only its missing bytes are fetched.
+            # files already as long as the one on the server cannot be repaired that way, so
+            # they are left in place until a whole new copy replaces them.
+            if os.path.exists(part):
+                os.remove(part)
+
+            total = (remote or manifest.get(tail) or {}).get("remote_size")
+            if total is None or os.path.getsize(outname) < total:
+                os.rename(outname, part)
+                moved = (os.path.getsize(part), os.path.getmtime(part))
+
+        if not os.path.exists(head):
+            try:
+                os.makedirs(head)
+            except OSError:
+                if not os.path.isdir(head):
+                    raise
+
+        try:
+            result = self._fetch_retrying(url, outname, username, password, checksum)
+        except Exception:
+            self._restore(outname, moved)
+            raise
+
+        if result is None:
+            self._restore(outname, moved)
+        return result
+
+
+    def _fetch_retrying(self, url, outname, username = None, password = None, checksum = None):
+        """ downloads (or resumes) one file, retrying it with increasing waits if it fails """
+
+        tail = os.path.basename(outname)
+        part = outname + ".part"
+
+        attempt = 0
+        resumed = os.path.exists(part)
+        while True:
+            try:
+                return self._fetch(url, outname, username, password, checksum)
+
+            # missing files and permission errors will not be fixed by trying again
+            except ftplib.error_perm:
+                raise
+
+            except Exception as e:
+
+                # a resumed file that turned out to be bad was discarded, so start it over now
+                if resumed and not os.path.exists(part):
+                    resumed = False
+                    print("{0} failed with {1}, downloading it from the start".format(tail, e))
+                    continue
+
+                if attempt == self.retries:
+                    raise
+                wait = self.backoff * (2 ** attempt) * random.uniform(0.9, 1.1)
+                print("{0} failed with {1}, retrying in {2:.0f}s".format(tail, e, wait))
+                time.sleep(wait)
+                attempt += 1
+
+
+    def download_many(self, jobs, force_overwrite = False, username = None, password = None,
+                      verify = False):
+        """
+        Downloads many files concurrently with a pool of worker threads.
+
+        :param jobs:            list of (url, outname) or (url, outname, checksum) tuples
+        :param force_overwrite: set True to replace existing files
+        :param username:        use if urls lead to files on ftp server with username
+        :param password:        use if urls lead to files on ftp server with password
+        :param verify:          set True to check existing files against the server, and
+                                download only the missing or changed parts of any that differ.
+
+        :return failed:         list of urls that could not be downloaded, in input order
+        """
+
+        tasks   = Queue.Queue()
+        results = {}
+
+        for i, job in enumerate(jobs):
+            tasks.put((i, job))
+
+        def worker():
+            while True:
+                try:
+                    i, job = tasks.get_nowait()
+                except Queue.Empty:
+                    return
+
+                url, outname = job[:2]
+                checksum = job[2] if len(job) > 2 else None
+                try:
+                    self.download(url, outname, force_overwrite, username, password, checksum, verify)
+                    print("{0} is downloaded".format(os.path.basename(outname)))
+                    results[i] = True
+                except Exception as e:
+                    print("{0} failed! {1}".format(os.path.basename(outname), e))
+                    results[i] = False
+
+        threads = [threading.Thread(target = worker) for i in range(max(1, min(self.workers, len(jobs))))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return [job[0] for i, job in enumerate(jobs) if not results.get(i)]
+
+
+    def list_dir(self, url, username = None, password = None):
+        """
+        Reads the listing of a directory on a server over a pooled connection
+
+        :param url:         url of a directory on an http(s) or ftp server
+        :param username:    use if url leads to a directory on ftp server with username
+        :param password:    use if url leads to a directory on ftp server with password
+
+        :return lines:      list of raw lines of the listing, which are the lines of the html
+                            page for http directories, or the output of the ftp LIST command
+                            (as from ``ftplib.FTP.dir``) for ftp directories.
+        """
+
+        url = url.strip()
+        scheme = url.split(":")[0].lower()
+
+        if scheme in ["http", "https"]:
+            return self._read_http(url).splitlines()
+        elif scheme == "ftp":
+            return self._list_ftp(url, username, password)
+        else:
+            raise Exception("Unknown url protocol type, must be http or ftp")
+
+
+    def close(self):
+        """ closes all idle connections """
+
+        with self.lock:
+            idle, self.idle = self.idle, {}
+
+        for connections in idle.values():
+            for connection in connections:
+                self._close(connection)
+        return
+
+
+    def _fetch(self, url, outname, username = None, password = None, checksum = None):
+        """ downloads (or resumes) one file with a single attempt """
+
+        url = url.strip()
+        scheme = url.split(":")[0].lower()
+
+        if scheme in ["http", "https"]:
+            return self._fetch_http(url, outname, checksum)
+        elif scheme == "ftp":
+            return self._fetch_ftp(url, outname, username, password, checksum)
+        else:
+            raise Exception("Unknown url protocol type, must be http or ftp")
+
+
+    def _fetch_http(self, url, outname, checksum = None, redirects = 0):
+        """ streams one http(s) file to disk, resuming partial files and following redirects """
+
+        parts = urlparse.urlsplit(url)
+        key   = (parts.scheme.lower(), parts.hostname, parts.port, None, None)
+        path  = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        head, tail = os.path.split(os.path.abspath(outname))
+        manifest = self._manifest(head)
+        part     = outname + ".part"
+        offset   = os.path.getsize(part) if os.path.isfile(part) else 0
+
+        # ask only for the missing bytes, but for the whole file if it changed on the server
+        headers = {}
+        if offset:
+            entry = manifest.get(tail) or {}
+            headers["Range"] = "bytes={0}-".format(offset)
+            if entry.get("etag") or entry.get("last_modified"):
+                headers["If-Range"] = entry.get("etag") or entry.get("last_modified")
+
+        with self._host_limit(key):
+            connection, response = self._http_request(key, path, headers)
+
+            try:
+                if response.status in [301, 302, 303, 307, 308]:
+                    location = response.getheader("location")
+                    response.read()
+                    self._checkin(key, connection, response)
+
+                    if location is None or redirects >= MAX_REDIRECTS:
+                        raise Exception("too many or bad redirects for {0}".format(url))
+                    redirect = urlparse.urljoin(url, location)
+
+                elif response.status == 404:
+                    response.read()
+                    self._checkin(key, connection, response)
+                    return None
+
+                # nothing left to fetch if the partial file is already the full file
+                elif response.status == 416:
+                    start, end, total = self._content_range(response.getheader("content-range"))
+                    response.read()
+                    self._checkin(key, connection, response)
+
+                    if total == offset:
+                        return self._finalize(url, outname, total, checksum)
+                    os.remove(part)
+                    raise Exception("HTTP 416, partial file does not match {0}".format(url))
+
+                elif response.status not in [200, 206]:
+                    response.read()
+                    self._checkin(key, connection, response)
+                    raise Exception("HTTP {0} {1} for {2}".format(response.status, response.reason, url))
+
+                else:
+                    if response.status == 206:
+                        start, end, total = self._content_range(response.getheader("content-range"))
+                        if start != offset:
+                            response.read()
+                            self._checkin(key, connection, response)
+                            os.remove(part)
+                            raise Exception("server resumed {0} at the wrong byte".format(url))
+                        print("Resuming {0} from byte {1}".format(tail, offset))
+                    else:
+                        length = response.getheader("content-length")
+                        total  = int(length) if length else None
+
+                    manifest.update(tail, url = url, complete = False, remote_size = total,
+                                    etag = response.getheader("etag"),
+                                    last_modified = response.getheader("last-modified"))
+
+                    self._write_part(part, response.status == 206, response.read)
+                    self._checkin(key, connection, response)
+                    return self._finalize(url, outname, total, checksum)
+
+            except (httplib.HTTPException, socket.error):
+                self._close(connection)
+                raise
+
+        # follow redirects outside of the original host limit
+        return self._fetch_http(redirect, outname, checksum, redirects + 1)
+
+
+    def _http_request(self, key, path, headers = None, method = "GET"):
+        """
+        sends a GET (or other) request on a pooled connection, retrying once on a fresh
+        connection if a reused one turns out to have been closed by the server.
+        """
+
+        headers = dict(headers or {})
+        headers.update({"User-Agent": "dnppy", "Connection": "keep-alive"})
+
+        connection = self._checkout(key)
+        try:
+            connection.request(method, path, headers = headers)
+            return connection, connection.getresponse()
+        except (httplib.HTTPException, socket.error):
+            self._close(connection)
+
+        connection = self._connect(key)
+        try:
+            connection.request(method, path, headers = headers)
+            return connection, connection.getresponse()
+        except:
+            self._close(connection)
+            raise
+
+
+    def _read_http(self, url, redirects = 0):
+        """ returns the body of a (small) http(s) page, following redirects """
+
+        parts = urlparse.urlsplit(url)
+        key   = (parts.scheme.lower(), parts.hostname, parts.port, None, None)
+        path  = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        with self._host_limit(key):
+            connection, response = self._http_request(key, path)
+
+            try:
+                body = response.read()
+                self._checkin(key, connection, response)
+
+            except (httplib.HTTPException, socket.error):
+                self._close(connection)
+                raise
+
+        if response.status in [301, 302, 303, 307, 308]:
+            location = response.getheader("location")
+            if location is None or redirects >= MAX_REDIRECTS:
+                raise Exception("too many or bad redirects for {0}".format(url))
+            return self._read_http(urlparse.urljoin(url, location), redirects + 1)
+
+        elif response.status != 200:
+            raise Exception("HTTP {0} {1} for {2}".format(response.status, response.reason, url))
+
+        return body
+
+
+    def _remote_stat(self, url, username = None, password = None, redirects = 0):
+        """
+        returns a dict with the "remote_size", "etag" and "last_modified" of a file on
+        the server, with None for any that the server does not give, or None if the
+        server reports that the file does not exist. Uses http HEAD or ftp SIZE and MDTM.
+        """
+
+        url = url.strip()
+        parts  = urlparse.urlsplit(url)
+        scheme = parts.scheme.lower()
+
+        if scheme == "ftp":
+            key      = ("ftp", parts.hostname, parts.port, username, password)
+            dirname  = "/" + "/".join(parts.path.split("/")[1:-1])
+            filename = parts.path.split("/")[-1]
+
+            with self._host_limit(key):
+                ftp = self._checkout(key)
+                try:
+                    if getattr(ftp, "dnppy_cwd", None) != dirname:
+                        ftp.cwd(dirname)
+                        ftp.dnppy_cwd = dirname
+                    total, modified = self._ftp_stat(ftp, filename)
+
+                except ftplib.error_perm as e:
+                    self._checkin(key, ftp)
+                    if str(e).startswith("550"):
+                        return None
+                    raise
+
+                except:
+                    self._close(ftp)
+                    raise
+
+                self._checkin(key, ftp)
+                return {"remote_size": total, "etag": None, "last_modified": modified}
+
+        elif scheme not in ["http", "https"]:
+            raise Exception("Unknown url protocol type, must be http or ftp")
+
+        key  = (scheme, parts.hostname, parts.port, None, None)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        with self._host_limit(key):
+            connection, response = self._http_request(key, path, method = "HEAD")
+            try:
+                response.read()
+                self._checkin(key, connection, response)
+            except (httplib.HTTPException, socket.error):
+                self._close(connection)
+                raise
+
+        if response.status in [301, 302, 303, 307, 308]:
+            location = response.getheader("location")
+            if location is None or redirects >= MAX_REDIRECTS:
+                raise Exception("too many or bad redirects for {0}".format(url))
+            return self._remote_stat(urlparse.urljoin(url, location), username, password, redirects + 1)
+
+        elif response.status == 404:
+            return None
+
+        elif response.status != 200:
+            raise Exception("HTTP {0} {1} for {2}".format(response.status, response.reason, url))
+
+        length = response.getheader("content-length")
+        return {"remote_size":   int(length) if length else None,
+                "etag":          response.getheader("etag"),
+                "last_modified": response.getheader("last-modified")}
+
+
+    def _list_ftp(self, url, username = None, password = None):
+        """ returns the LIST output for an ftp directory over a pooled session """
+
+        parts   = urlparse.urlsplit(url)
+        key     = ("ftp", parts.hostname, parts.port, username, password)
+        dirname = "/" + parts.path.strip("/")
+
+        with self._host_limit(key):
+            ftp = self._checkout(key)
+            try:
+                if getattr(ftp, "dnppy_cwd", None) != dirname:
+                    ftp.cwd(dirname)
+                    ftp.dnppy_cwd = dirname
+
+                lines = []
+                ftp.dir(lines.append)
+
+            except ftplib.error_perm:
+                self._checkin(key, ftp)
+                raise
+
+            except:
+                self._close(ftp)
+                raise
+
+            self._checkin(key, ftp)
+            return lines
+
+
+    def _fetch_ftp(self, url, outname, username = None, password = None, checksum = None):
+        """ streams one ftp file to disk over a pooled session, resuming partial files """
+
+        parts    = urlparse.urlsplit(url)
+        key      = ("ftp", parts.hostname, parts.port, username, password)
+        dirname  = "/" + "/".join(parts.path.split("/")[1:-1])
+        filename = parts.path.split("/")[-1]
+
+        head, tail = os.path.split(os.path.abspath(outname))
+        manifest = self._manifest(head)
+        part     = outname + ".part"
+        offset   = os.path.getsize(part) if os.path.isfile(part) else 0
+
+        with self._host_limit(key):
+            ftp = self._checkout(key)
+            try:
+                if getattr(ftp, "dnppy_cwd", None) != dirname:
+                    ftp.cwd(dirname)
+                    ftp.dnppy_cwd = dirname
+
+                total, modified = self._ftp_stat(ftp, filename)
+
+                # start over if the file changed on the server since the partial download
+                entry = manifest.get(tail) or {}
+                if offset and modified and entry.get("last_modified") not in [None, modified]:
+                    offset = 0
+                if total is not None and offset > total:
+                    offset = 0
+
+                manifest.update(tail, url = url, complete = False, remote_size = total,
+                                etag = None, last_modified = modified)
+
+                if total is None or offset < total:
+                    if offset:
+                        print("Resuming {0} from byte {1}".format(tail, offset))
+
+                    def retrieve(write):
+                        ftp.retrbinary("RETR " + filename, write, CHUNK_BYTES, rest = offset or None)
+
+                    try:
+                        self._write_part(part, offset > 0, retrieve = retrieve)
+
+                    # servers that cannot resume (REST) are read from the beginning
+                    except (ftplib.error_perm, ftplib.error_reply) as e:
+                        if not offset or str(e).startswith("550"):
+                            raise
+
+                        def retrieve(write):
+                            ftp.retrbinary("RETR " + filename, write, CHUNK_BYTES)
+
+                        self._write_part(part, False, retrieve = retrieve)
+
+            except ftplib.error_perm:
+                self._checkin(key, ftp)
+                raise
+
+            except:
+                self._close(ftp)
+                raise
+
+            self._checkin(key, ftp)
+            return self._finalize(url, outname, total, checksum)
+
+
+    @staticmethod
+    def _ftp_stat(ftp, filename):
+        """ returns the size and modification time of a file on an ftp server, or None where unknown """
+
+        total, modified = None, None
+        try:
+            ftp.voidcmd("TYPE I")
+            total = ftp.size(filename)
+        except ftplib.error_perm as e:
+            if str(e).startswith("550"):
+                raise
+
+        try:
+            modified = ftp.sendcmd("MDTM " + filename).split()[-1]
+        except ftplib.error_perm:
+            pass
+
+        return total, modified
+
+
+    @staticmethod
+    def _content_range(content_range):
+        """ returns (start, end, total) from an http Content-Range header, with None for unknowns """
+
+        start, end, total = None, None, None
+        if content_range:
+            byte_range, length = content_range.split()[-1].split("/")
+            if byte_range != "*":
+                start, end = [int(value) for value in byte_range.split("-")]
+            if length != "*":
+                total = int(length)
+
+        return start, end, total
+
+
+    @staticmethod
+    def _write_part(part, append, read = None, retrieve = None):
+        """
+        writes data to a partial file next to the output, appending to it when resuming.
+        data is either pulled with read(nbytes) or pushed by calling retrieve(write).
+        Partial files are left in place if the transfer fails, so it can be resumed.
+        """
+
+        with open(part, "ab" if append else "wb") as f:
+            if retrieve is not None:
+                retrieve(f.write)
+            else:
+                while True:
+                    chunk = read(CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+        return
+
+
+    def _finalize(self, url, outname, total = None, checksum = None):
+        """
+        checks the size and checksum of a partial file, renames it into place
+        and records it in the manifest as complete.
+        """
+
+        head, tail = os.path.split(os.path.abspath(outname))
+        part = outname + ".part"
+        size = os.path.getsize(part)
+
+        # short files are kept to be resumed, but files longer than expected are discarded
+        if total is not None and size != total:
+            if size > total:
+                os.remove(part)
+            raise Exception("{0} is incomplete, got {1} of {2} bytes".format(tail, size, total))
+
+        if checksum is not None:
+            checksum = parse_checksum(checksum)
+            if file_checksum(part, checksum.split(":")[0]) != checksum:
+                os.remove(part)
+                raise Exception("{0} does not match checksum {1}".format(tail, checksum))
+
+        # windows will not rename over an existing file
+        if os.path.exists(outname):
+            os.remove(outname)
+        os.rename(part, outname)
+
+        self._manifest(head).record_complete(tail, checksum, url = url)
+        return outname
+
+
+    @staticmethod
+    def _needs_download(manifest, name, outname, checksum = None, verify = False):
+        """ returns True if an existing file is not known to be a complete download """
+
+        if not verify and manifest.is_complete(name, checksum):
+            return False
+
+        # files downloaded before there was a manifest are assumed complete, unless checked
+        if manifest.get(name) is None and checksum is None and not verify:
+            return False
+
+        # a matching checksum settles whether a file is complete without asking the server
+        if checksum is not None:
+            checksum = parse_checksum(checksum)
+            if file_checksum(outname, checksum.split(":")[0]) == checksum:
+                manifest.record_complete(name, checksum)
+                return False
+
+        return True
+
+
+    @staticmethod
+    def _matches_remote(manifest, name, outname, remote):
+        """
+        returns True if an existing file has the size of the file on the server, and
+        the same version as when it was downloaded, where the server gives a version.
+        """
+
+        if remote["remote_size"] is None or remote["remote_size"] != os.path.getsize(outname):
+            return False
+
+        entry = manifest.get(name) or {}
+        for field in ["etag", "last_modified"]:
+            if entry.get(field) and remote[field] and entry[field] != remote[field]:
+                return False
+
+        return True
+
+
+    @staticmethod
+    def _restore(outname, moved):
+        """
+        puts an existing file that was moved aside to be fetched again back in place after
+        a failed fetch, as long as no new data was written to it. Files that were partly
+        fetched again are left as ".part" files, so the next attempt can resume them.
+        """
+
+        part = outname + ".part"
+        if moved is None or os.path.exists(outname) or not os.path.isfile(part):
+            return
+
+        if (os.path.getsize(part), os.path.getmtime(part)) == moved:
+            os.rename(part, outname)
+        return
+
+
+    def _manifest(self, directory):
+        """ returns the download_manifest for a directory """
+
+        with self.lock:
+            if directory not in self.manifests:
+                self.manifests[directory] = download_manifest(directory)
+            return self.manifests[directory]
+
+
+    def _host_limit(self, key):
+        """ returns the semaphore limiting simultaneous downloads from a host """
+
+        host = key[:3]
+        with self.lock:
+            if host not in self.host_limits:
+                self.host_limits[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self.host_limits[host]
+
+
+    def _checkout(self, key):
+        """
+        returns an idle connection to a host, or a new one. Idle ftp sessions are checked
+        with a NOOP first, since servers close sessions that sit idle for too long.
+        """
+
+        with self.lock:
+            connections = self.idle.get(key)
+            connection  = connections.pop() if connections else None
+
+        if isinstance(connection, ftplib.FTP):
+            try:
+                connection.voidcmd("NOOP")
+            except ftplib.all_errors:
+                self._close(connection)
+                connection = None
+
+        if connection is None:
+            connection = self._connect(key)
+        return connection
+
+
+    def _checkin(self, key, connection, response = None):
+        """ returns a connection to the pool, unless the server is closing it """
+
+        if response is not None and response.will_close:
+            self._close(connection)
+            return
+
+        with self.lock:
+            self.idle.setdefault(key, []).append(connection)
+        return
+
+
+    def _connect(self, key):
+        """ opens a new connection (or logged in ftp session) to a host """
+
+        scheme, host, port, username, password = key
+
+        if scheme == "http":
+            return httplib.HTTPConnection(host, port, timeout = self.timeout)
+
+        elif scheme == "https":
+            return httplib.HTTPSConnection(host, port, timeout = self.timeout)
+
+        ftp = ftplib.FTP()
+        ftp.connect(host, port or ftplib.FTP_PORT, self.timeout)
+
+        # log in to the server with user specified username and password
+        if username is not None and password is not None:
+            ftp.login(username, password)
+        elif username is not None:
+            ftp.login(username)
+        else:
+            ftp.login()
+
+        return ftp
+
+
+    @staticmethod
+    def _close(connection):
+        """ closes a connection, ignoring errors from connections that are already dead """
+
+        try:
+            if isinstance(connection, ftplib.FTP):
+                try:
+                    connection.quit()
+                except ftplib.all_errors:
+                    connection.close()
+            else:
+                connection.close()
+        except Exception:
+            pass
+        return
@@ -49,7 +49,7 @@ def download_filelist(ftp_texts, file_type = None, outdir = None):
             if len(failed)>0:
                 print("retry number {0} to grab {1} failed downloads!".format(i,len(failed)))
                 time.sleep(60)
-                failed = download_urls(failed, file_type, outdir)
+                failed = download_urls(failed, outdir, file_type)
 
         # once all tries are complete, print a list of files which repeatedly failed
         if len(failed)>0:
@@ -0,0 +1,204 @@
+__author__ = 'jwely'
+__all__ = ["download_manifest"]
+
+import threading
+import hashlib
+import json
+import os
+
+
+# name of the manifest file kept in each download directory
+MANIFEST_NAME = "download_manifest.jsonl"
+
+# number of bytes to read at a time when computing checksums
+CHUNK_BYTES = 2 ** 20
+
+
+class download_manifest():
+    """
+    Record of the files downloaded into one directory.
+
+    The manifest is a json lines file named ``download_manifest.jsonl`` within the
+    directory, with one entry per file giving its source url, size, modification time,
+    checksum (when one was known), and whether the download was completed. The size
+    and modification time recorded when a download finishes let later runs tell a
+    complete file from a truncated or altered one without contacting the server.
+    Partial downloads record the size and version (etag or last-modified date) of the
+    file on the server, so that they can be resumed safely.
+
+    Updates are appended to the file as they happen, so a killed job loses at most the
+    entry it was writing. The file is compacted to one line per entry when it is next
+    opened.
+
+    :param directory:   the directory holding the downloaded files
+    """
+
+    def __init__(self, directory):
+
+        self.directory = os.path.abspath(directory)
+        self.path      = os.path.join(self.directory, MANIFEST_NAME)
+        self.entries   = {}
+        self.lock      = threading.Lock()
+
+        self._load()
+        return
+
+
+    def get(self, name):
+        """ returns the entry for a filename, or None """
+
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None:
+                return dict(entry)
+            return None
+
+
+    def update(self, name, **fields):
+        """
+        Updates the entry for a filename with new fields and saves it
+
+        :param name:    the name of a file within the directory
+        :param fields:  any fields to change, such as ``size = 1024``
+        """
+
+        with self.lock:
+            entry = dict(self.entries.get(name, {}))
+            entry.update(fields)
+            entry["name"] = name
+            self.entries[name] = entry
+
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry, sort_keys = True) + "\n")
+        return
+
+
+    def remove(self, name):
+        """ forgets the entry for a filename """
+
+        with self.lock:
+            if self.entries.pop(name, None) is not None:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps({"name": name, "removed": True}) + "\n")
+        return
+
+
+    def is_complete(self, name, checksum = None):
+        """
+        Returns True if a file was completely downloaded and has not changed since,
+        according to its size and modification time.
+
+        :param name:        the name of a file within the directory
+        :param checksum:    optional expected checksum, such as "md5:<hexdigest>". The file
+                            is only complete if its recorded checksum matches this one.
+        """
+
+        entry = self.get(name)
+        path  = os.path.join(self.directory, name)
+
+        if entry is None or not entry.get("complete") or not os.path.isfile(path):
+            return False
+
+        if entry.get("size") != os.path.getsize(path):
+            return False
+
+        if entry.get("mtime") != int(os.path.getmtime(path)):
+            return False
+
+        if checksum is not None and entry.get("checksum") != parse_checksum(checksum):
+            return False
+
+        return True
+
+
+    def record_complete(self, name, checksum = None, **fields):
+        """
+        Records that a file in the directory has been completely downloaded, along with
+        its current size and modification time.
+
+        :param name:        the name of a file within the directory
+        :param checksum:    optional checksum of the file, such as "md5:<hexdigest>"
+        :param fields:      any other fields to record, such as the url
+        """
+
+        path = os.path.join(self.directory, name)
+        if checksum is not None:
+            checksum = parse_checksum(checksum)
+
+        self.update(name, complete = True, checksum = checksum,
+                    size = os.path.getsize(path), mtime = int(os.path.getmtime(path)), **fields)
+        return
+
+
+    def _load(self):
+        """ reads entries from the manifest file, compacting it if it has grown """
+
+        if not os.path.isfile(self.path):
+            return
+
+        lines = 0
+        with open(self.path, "r") as f:
+            for line in f:
+                lines += 1
+                try:
+                    entry = json.loads(line)
+                    name  = entry["name"]
+                except (ValueError, KeyError, TypeError):
+                    # a line cut short by a killed job
+                    continue
+
+                if entry.get("removed"):
+                    self.entries.pop(name, None)
+                else:
+                    self.entries[name] = entry
+
+        if lines > len(self.entries):
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as f:
+                for name in sorted(self.entries):
+                    f.write(json.dumps(self.entries[name], sort_keys = True) + "\n")
+
+            # windows will not rename over an existing file
+            os.remove(self.path)
+            os.rename(temp_path, self.path)
+        return
+
+
+def parse_checksum(checksum):
+    """
+    Returns a checksum as an "algorithm:hexdigest" string. Checksums given
+    without an algorithm are assumed to be md5, sha1 or sha256 by their length.
+    """
+
+    if ":" in checksum:
+        algorithm, digest = checksum.split(":", 1)
+    else:
+        digest = checksum
+        algorithm = {32: "md5", 40: "sha1", 64: "sha256"}.get(len(checksum.strip()))
+        if algorithm is None:
+            raise Exception("Could not tell the algorithm of checksum '{0}'".format(checksum))
+
+    return "{0}:{1}".format(algorithm.strip().lower(), digest.strip().lower())
+
+
+def file_checksum(filepath, algorithm = "md5"):
+    """
+    Computes the checksum of a file, reading it in chunks
+
+    :param filepath:    the file to check
+    :param algorithm:   any algorithm in hashlib, such as "md5" or "sha256"
+
+    :return checksum:   checksum as an "algorithm:hexdigest" string
+    """
+
+    digest = hashlib.new(algorithm)
+    with open(filepath, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_BYTES)
+            if not chunk:
+                break
+            digest.update(chunk)
+
+    return "{0}:{1}".format(algorithm, digest.hexdigest())
@@ -1,16 +1,31 @@
 __author__ = 'jwely'
 
-import urllib
-import ftplib
-import os
+from download_engine import download_engine
+
+import threading
 
 __all__ = ["download_url"]
 
 
-def download_url(url, outname, username = None, password = None, force_overwrite = False):
+# engine shared by all calls to download_url, so connections are reused between calls
+_shared_engine = None
+_shared_lock   = threading.Lock()
+
+
+def download_url(url, outname, username = None, password = None, force_overwrite = False,
+                 checksum = None, verify = False):
     """
     Download a single file. input source url and output filename
 
+    The file is streamed to disk, and connections to each server (including logged
+    in ftp sessions) are kept open and reused by later calls to download_url. See
+    ``download_engine`` to download many files at once.
+
+    An interrupted download leaves a ``.part`` file behind, and the next call to
+    download_url for the same outname resumes it from where it stopped. Completed
+    files are recorded in a ``download_manifest`` in the output directory, so files
+    that were truncated or altered after download are fetched again.
+
     :param url:             a string url to file for download
     :param outname:         filepath to write location of file
     :param username:        use if url leads to file on ftp server with username
@@ -18,56 +33,25 @@ def download_url(url, outname, username = None, password = None, force_overwrite
     :param force_overwrite: by default, this function will not overwrite existing files
                             on drive. This is to avoid accidental overwrite of critical
                             files as well as repeated download of the same files.
+    :param checksum:        optional expected checksum of the file, such as "md5:<hexdigest>"
+    :param verify:          set True to check an existing file against the server, and
+                            download only its missing or changed parts if they differ.
 
     :return outname:    returns filepath to locally created file after download
     """
 
-    # if output file already exists, do not download a file there.
-    if os.path.isfile(os.path.abspath(outname)) and not force_overwrite:
-        return outname
-
-    head, tail = os.path.split(outname)
-    if not os.path.exists(head) and head is not "":
-        os.makedirs(head)
-
-    if "http" in url[:4]:
-        connection  = urllib.urlopen(url)
-        page        = connection.read()
-
-        # escapes in the event of a 404 not found
-        if "404 Not Found" in page:
-            return None
-
-        writefile   = open(outname, 'wb+')
-        writefile.write(page)
-        writefile.close()
-        del connection
-        return outname
-
-    elif "ftp:" in url[:4]:
-        filename = os.path.basename(url)
-        server   = url.split("/")[2]
-        path     = "/".join(url.split("/")[3:-1])
-
-        ftp = ftplib.FTP(server)
-
-        # log in to the server with user specified username and password
-        if username is not None and password is not None:
-            ftp.login(username, password)
-        elif username is not None:
-            ftp.login(username)
-        else:
-            ftp.login()
-
-        ftp.cwd(path)
-        ftp.retrbinary("RETR " + filename, open(outname, 'wb').write)
-        ftp.quit()
-        return outname
+    return _get_shared_engine().download(url, outname, force_overwrite, username, password,
+                                              checksum, verify)
 
-    else:
-        raise Exception("Unknown url protocol type, must be http or ftp")
 
+def _get_shared_engine():
+    """ returns the download_engine shared by calls to download_url """
 
+    global _shared_engine
+    with _shared_lock:
+        if _shared_engine is None:
+            _shared_engine = download_engine(retries = 0)
+        return _shared_engine
 
 
 if __name__ == "__main__":
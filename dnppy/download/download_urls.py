@@ -1,12 +1,12 @@
 __author__ = 'jwely'
 
 from dnppy import core
-from download_url import download_url
-import os, time
+from download_engine import download_engine
+import os
 
 __all__ = ["download_urls"]
 
-def download_urls(url_list, outdir, file_types = None):
+def download_urls(url_list, outdir, file_types = None, workers = 4, max_per_host = 2, verify = False):
     """
     Downloads a list of files. Retries failed downloads
 
@@ -14,32 +14,37 @@ def download_urls(url_list, outdir, file_types = None):
     built to be nested within "Download_filelist" to allow loops to continuously retry
     failed files until they are successful or a retry limit is reached.
 
-    :param url_list:   array of urls, probably as read from a text file
-    :param file_types: list of file types to download. Useful for excluding extraneous
-                       metadata by only downloading 'hdf' or 'tif' for example. Please note
-                       that often times, you actually NEED the metadata.
-    :param outdir:     folder where files are to be placed after download
+    Files are downloaded several at a time with a ``download_engine``, which reuses
+    connections to each server and retries failures with increasing waits. Partially
+    downloaded files left by an earlier, interrupted run are resumed rather than
+    downloaded again from the start.
+
+    :param url_list:     array of urls, probably as read from a text file
+    :param file_types:   list of file types to download. Useful for excluding extraneous
+                         metadata by only downloading 'hdf' or 'tif' for example. Please note
+                         that often times, you actually NEED the metadata.
+    :param outdir:       folder where files are to be placed after download
+    :param workers:      number of files to download at once
+    :param max_per_host: maximum number of simultaneous downloads from any one server.
+                         Some servers, such as REVERB, reject too many requests at once.
+    :param verify:       set True to check files that already exist in outdir against the
+                         server, and download only the missing or changed parts of any
+                         that differ.
 
     :return failed:    list of files which failed download
     """
 
-    failed   = []
     url_list = core.enf_list(url_list)
 
     # creates output folder at desired path if it doesn't already exist
     if not os.path.exists(outdir):
         os.makedirs(outdir)
 
-    # establish a wait time that will increase when downloads fail. This helps to reduce
-    # the frequency of REVERB server rejections for requesting too many downloads
-    wait = 0
-
+    jobs = []
     for site in url_list:
         download = False
         url      = site.rstrip()
-        sub      = url.split("/")
-        leng     = len(sub)
-        name     = sub[leng-1]
+        name     = url.split("/")[-1]
 
         # Determine whether or not to download the file based on filetype.
         if file_types is not None:
@@ -49,24 +54,17 @@ def download_urls(url_list, outdir, file_types = None):
         else:
             download = True
 
-        # attempt download of the file, or skip it.
         if download:
+            jobs.append((url, os.path.join(outdir, name)))
 
-            try:
-                # wait for the wait time before attempting writing a file
-                time.sleep(wait)
-                download_url(url, os.path.join(outdir,name))
-                print("{0} is downloaded {1}".format(name, wait))
-
-                # reduce the wait time when downloads succeed.
-                if wait >= 1:
-                    wait -= wait
+    engine = download_engine(workers, max_per_host)
+    try:
+        failed = engine.download_many(jobs, verify = verify)
+    finally:
+        engine.close()
 
-            # add to the fail count if the download is unsuccessful and wait longer next time.
-            except:
-                print("{0} will be retried! {1}".format(sub[leng-1], wait))
-                wait += 5
-                failed.append(url)
+    for url in failed:
+        print("{0} will be retried!".format(url.split("/")[-1]))
 
     print("Finished downloading urls!")
-    return failed
\ No newline at end of file
+    return failed
@@ -4,6 +4,7 @@ from dnppy import textio
 from dnppy import core
 
 from download_url import download_url
+from landsat8_scene_index import landsat8_scene_index
 
 import datetime
 import urllib
@@ -15,7 +16,7 @@ __all__ = ["fetch_Landsat8"]
 
 
 def fetch_Landsat8(path_row_pairs, start_dto, end_dto, outdir,
-                   max_cloud_cover = 100, bands = None):
+                   max_cloud_cover = 100, bands = None, index = None):
     """
     This function downloads all landsat 8 tiles for the input path_row_pairs and
     within the bounds of the start_dto and the end_dto, and saves them to the output directory.
@@ -27,38 +28,33 @@ def fetch_Landsat8(path_row_pairs, start_dto, end_dto, outdir,
     :param end_dto:         python datetime object of end date of range
     :param outdir:          the folder to save the output landsat files in
     :param max_cloud_cover: maximum percent cloud cover that is acceptable to download the file.
+    :param bands:           list of bands to download when not all are desired, see
+                            ``fetch_Landsat8_tile``. The MTL file is always downloaded.
+    :param index:           optional ``landsat8_scene_index`` to find scenes in. By default,
+                            the index in the users home directory is used and refreshed
+                            from the latest scene list.
 
     :return output_filelist: A list of tile names downloaded by this function.
     """
 
-    # fetch an updated scene list with custom function.
-    scene_list = fetch_Landsat8_scene_list()
+    # bring the local scene index up to date, then find scenes within it
+    close_index = index is None
+    if index is None:
+        index = landsat8_scene_index()
 
-    path_row_pairs = core.enf_list(path_row_pairs)
-    output_tilenames = []
+    try:
+        index.refresh()
+        scenes = index.query(core.enf_list(path_row_pairs), start_dto, end_dto, max_cloud_cover)
+    finally:
+        if close_index:
+            index.close()
+
+    print("Found {0} scenes with less than {1}% cloud cover".format(len(scenes), max_cloud_cover))
 
-    for path_row_pair in path_row_pairs:
-        #format input strings
-        path, row = path_row_pair
-        path_str  = str(path).zfill(3)
-        row_str   = str(row).zfill(3)
-
-        # loop through the scene list
-        # if the date for the given path/row scene is within the date range, download it with landsat_8_scene
-
-        for row in scene_list:
-            tilename    = row[0]
-            datestring  = row[1].split(".")[0] # removes fractional seconds from datestring
-            date        = datetime.datetime.strptime(datestring, "%Y-%m-%d %H:%M:%S")
-            pathrow_id  = "LC8{0}{1}".format(path_str, row_str)
-            cloud_cover = float(row[2])
-
-            if cloud_cover < max_cloud_cover:
-                if pathrow_id in row[0]:
-                    if start_dto <=  date  <= end_dto:
-                        amazon_url = row[-1]
-                        fetch_Landsat8_tile(amazon_url, tilename, outdir, bands)
-                        output_tilenames.append(os.path.join(outdir, tilename))
+    output_tilenames = []
+    for tilename, date, cloud_cover, amazon_url in scenes:
+        fetch_Landsat8_tile(amazon_url, tilename, outdir, bands)
+        output_tilenames.append(os.path.join(outdir, tilename))
 
     print("Finished retrieving landsat 8 data!")
     return output_tilenames
@@ -106,13 +102,11 @@ def fetch_Landsat8_tile(amazon_url, tilename, outdir, bands = None):
                 link     = amazon_url.replace("index.html",filename)
                 savename = os.path.join(outdir, tilename, filename)
 
-                # try twice if filepath doesn't already exist
-                if not os.path.isfile(savename):
-                    try:    download_url(link, savename)
-                    except: download_url(link, savename)
-                    print("\tDownloaded {0}".format(filename))
-                else:
-                    print("\t Found {0}".format(filename))
+                # try twice, the second attempt resumes where the first stopped.
+                # complete files from earlier runs are not downloaded again.
+                try:    download_url(link, savename)
+                except: download_url(link, savename)
+                print("\tDownloaded {0}".format(filename))
 
     return os.path.join(outdir, tilename)
 
@@ -134,8 +128,8 @@ def fetch_Landsat8_scene_list():
     gz_path    = "{0}/dnppy/landsat/metadata/scene_list.gz".format(directory)
     txt_path   = "{0}/dnppy/landsat/metadata/scene_list.txt".format(directory)
 
-    # download then extract the gz file to a txt file.
-    download_url("http://landsat-pds.s3.amazonaws.com/scene_list.gz", gz_path)
+    # download (or update) then extract the gz file to a txt file.
+    download_url("http://landsat-pds.s3.amazonaws.com/scene_list.gz", gz_path, verify = True)
     with gzip.open(gz_path,'rb') as gz:
         content = gz.read()
         with open(txt_path, 'wb+') as f:
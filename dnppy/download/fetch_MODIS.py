@@ -3,8 +3,7 @@ __author__ = 'jwely'
 
 from dnppy import core
 
-from list_ftp import list_ftp
-from list_http_e4ftl01 import list_http_e4ftl01
+from listing_index import listing_index
 from download_url import download_url
 
 import os
@@ -12,7 +11,7 @@ import os
 __all__ = ["fetch_MODIS"]
 
 def fetch_MODIS(product, version, tiles, outdir, start_dto, end_dto,
-                                                force_overwrite = False):
+                                                force_overwrite = False, index = None):
     """
     Fetch MODIS Land products from one of two servers. If this function
     runs and downloads 0 files, check that your inputs are consistent
@@ -30,6 +29,10 @@ def fetch_MODIS(product, version, tiles, outdir, start_dto, end_dto,
     :param start_dto:       datetime object, the starting date of the range of data to download
     :param end_dto:         datetime object, the ending date of the range of data to download
     :param force_overwrite: will re-download files even if they already exist
+    :param index:           optional ``listing_index`` in which to cache server listings.
+                            By default, the listing index in the users home directory
+                            is used, so later requests for other tiles or overlapping
+                            dates do not list the same server folders again.
 
     :return out_filepaths:  a list of filepaths to all files created by this function
     """
@@ -54,58 +57,43 @@ def fetch_MODIS(product, version, tiles, outdir, start_dto, end_dto,
     else:
         print("Connected to {0}".format(site))
 
-    # Depending on the type of connection (ftp vs http) populate the file list
-    try:
-        if isftp:
-            dates,_ = list_ftp(site, False, False, Dir)
-        else:
-            dates   = list_http_e4ftl01(site)
-    except:
-        raise ValueError("Could not connect to {0}/{1}".format(site,Dir))
+    if isftp:
+        root = '/'.join(['ftp://' + site, Dir])
+    else:
+        root = site
 
-    # refine contents down to just addresses of valid year and j_day
-    good_dates = []
-    for date in dates:
-        try:
-            date_dto = datetime.strptime(date, "%Y.%m.%d")
-            if start_dto <= date_dto <= end_dto:
-                good_dates.append(date)
+    # bring the listing index up to date for this date range, listing only
+    # date folders that have not been listed before.
+    close_index = index is None
+    if index is None:
+        index = listing_index()
 
+    try:
+        try:
+            failed = index.sync(root, start_dto, end_dto)
         except:
-            print("skipping non date folder name {0}".format(date))
+            raise ValueError("Could not connect to {0}/{1}".format(site,Dir))
 
+        if failed:
+            print("Could not list {0} date folders, files within them are skipped".format(len(failed)))
 
-    print('Found {0} days within range'.format(len(good_dates)))
-
-    # for all folders within the desired date range,  map the subfolder contents.
-    for good_date in good_dates:
-
-        if isftp:
-            files,_ = list_ftp(site, False, False, Dir + '/' + good_date)
-
-        else:
-            files   = list_http_e4ftl01(site + '/' + good_date)
-
-        for afile in files:
+        addresses = index.query(root, start_dto, end_dto, tiles)
+    finally:
+        if close_index:
+            index.close()
 
-            # only list files with desired tile names and not preview jpgs
-            if not '.jpg' in afile:
-                for tile in tiles:
-                    if tile in afile:
+    for address in addresses:
+        afile = address.split('/')[-1]
 
-                        # assemble the address
-                        if isftp:
-                            address='/'.join(['ftp://'+site, Dir, good_date, afile])
-                        else:
-                            address='/'.join([site, good_date, afile])
+        # only download files with desired tile names and not preview jpgs
+        if not '.jpg' in afile:
 
-                        #download the file
-                        outname = os.path.join(outdir, afile)
-                        out_filepaths.append(outname)
-                        if not os.path.isfile(outname) and not force_overwrite:
-                            download_url(address, outname)
+            #download the file
+            outname = os.path.join(outdir, afile)
+            out_filepaths.append(outname)
+            download_url(address, outname, force_overwrite = force_overwrite)
 
-                        print('Downloaded {0}'.format(address))
+            print('Downloaded {0}'.format(address))
 
     print("Finished retrieving MODIS - {0} data!".format(product))
     print("Downloaded {0} files".format(len(out_filepaths)))
@@ -0,0 +1,189 @@
+__author__ = 'jwely'
+__all__ = ["landsat8_scene_index"]
+
+from download_url import download_url
+
+from datetime import datetime
+import sqlite3
+import gzip
+import csv
+import os
+
+
+# default locations of the scene index and the scene list it is built from
+INDEX_PATH      = os.path.join(os.path.expanduser("~"), ".dnppy", "landsat8_scene_index.sqlite")
+SCENE_LIST_PATH = os.path.join(os.path.expanduser("~"), ".dnppy", "scene_list.gz")
+SCENE_LIST_URL  = "http://landsat-pds.s3.amazonaws.com/scene_list.gz"
+
+# format of acquisition dates within the index, which sorts in date order
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class landsat8_scene_index():
+    """
+    Local, indexed copy of the Landsat 8 scene list hosted by amazon web services at
+    [https://aws.amazon.com/public-data-sets/landsat/]
+
+    The scene list is a large csv of every scene in the archive. Rather than scanning
+    all of it for each path/row, its scenes are loaded once into a small sqlite database
+    keyed on path, row and acquisition date, so queries for hundreds of path/rows over
+    many years take well under a second. Newer scene lists are loaded incrementally,
+    adding new scenes and updating changed ones, and a scene list that has already
+    been loaded is skipped.
+
+    :param index_path:  filepath to the index database. defaults to a file in a
+                        ".dnppy" folder in the users home directory.
+
+    Usage example
+
+    .. code-block:: python
+
+        index  = landsat8_scene_index()
+        index.refresh()
+        scenes = index.query([(44, 27), (44, 28)], datetime(2014, 1, 1), datetime(2015, 1, 1), 20)
+        index.close()
+    """
+
+    def __init__(self, index_path = None):
+
+        if index_path is None:
+            index_path = INDEX_PATH
+
+        head = os.path.dirname(os.path.abspath(index_path))
+        if not os.path.exists(head):
+            os.makedirs(head)
+
+        self.index_path = index_path
+        self.db = sqlite3.connect(index_path)
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS scenes (entity_id TEXT PRIMARY KEY, "
+                            "path INTEGER, row INTEGER, acquired TEXT, cloud_cover REAL, url TEXT)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS scenes_path_row ON scenes (path, row, acquired)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS sources (filepath TEXT PRIMARY KEY, "
+                            "size INTEGER, mtime INTEGER)")
+        return
+
+
+    def refresh(self, scene_list_path = None):
+        """
+        Downloads the scene list from amazon if the copy on disk is missing, incomplete,
+        or older than the one on the server, then loads any new scenes into the index.
+
+        :param scene_list_path:     filepath at which to keep the scene list, defaults
+                                    to "scene_list.gz" next to the default index.
+
+        :return new_scenes:         the number of scenes added to the index
+        """
+
+        if scene_list_path is None:
+            scene_list_path = SCENE_LIST_PATH
+
+        print("Updating scene list")
+        download_url(SCENE_LIST_URL, scene_list_path, verify = True)
+        return self.update(scene_list_path)
+
+
+    def update(self, scene_list_path):
+        """
+        Loads the scenes from a scene list file into the index, unless that same file
+        has already been loaded.
+
+        :param scene_list_path:     filepath to a scene list, as a ".gz" or text csv
+
+        :return new_scenes:         the number of scenes added to the index
+        """
+
+        filepath = os.path.abspath(scene_list_path)
+        size     = os.path.getsize(filepath)
+        mtime    = int(os.path.getmtime(filepath))
+
+        source = self.db.execute("SELECT size, mtime FROM sources WHERE filepath = ?", (filepath,)).fetchone()
+        if source == (size, mtime):
+            return 0
+
+        before = self.count()
+
+        if filepath.endswith(".gz"):
+            opener = gzip.open
+        else:
+            opener = open
+
+        with opener(filepath, "rb") as f:
+            reader  = csv.reader(f)
+            columns = dict((name, i) for i, name in enumerate(next(reader)))
+
+            with self.db:
+                self.db.executemany("INSERT OR REPLACE INTO scenes VALUES (?, ?, ?, ?, ?, ?)",
+                                    self._parse_rows(reader, columns))
+                self.db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)", (filepath, size, mtime))
+
+        new_scenes = self.count() - before
+        print("Added {0} new scenes to the landsat 8 scene index".format(new_scenes))
+        return new_scenes
+
+
+    def query(self, path_row_pairs, start_dto = None, end_dto = None, max_cloud_cover = 100):
+        """
+        Finds the scenes for a list of path/rows within a date range
+
+        :param path_row_pairs:  tupled integer values of path,row coordinates of tile. may be
+                                a list of several tuples. example: [(1,1),(1,2)]
+        :param start_dto:       python datetime object of start date of range, or None
+        :param end_dto:         python datetime object of end date of range, or None
+        :param max_cloud_cover: only scenes with less than this percent cloud cover are returned
+
+        :return scenes:         list of (tilename, acquisition datetime, cloud cover, amazon_url)
+                                tuples, ordered by path/row in input order, then by date
+        """
+
+        if isinstance(path_row_pairs, tuple):
+            path_row_pairs = [path_row_pairs]
+
+        start = start_dto.strftime(DATE_FORMAT) if start_dto is not None else ""
+        end   = end_dto.strftime(DATE_FORMAT) if end_dto is not None else "9999"
+
+        scenes = []
+        for path, row in path_row_pairs:
+            rows = self.db.execute("SELECT entity_id, acquired, cloud_cover, url FROM scenes "
+                                   "WHERE path = ? AND row = ? AND acquired >= ? AND acquired <= ? "
+                                   "AND cloud_cover < ? ORDER BY acquired",
+                                   (int(path), int(row), start, end, max_cloud_cover))
+
+            for entity_id, acquired, cloud_cover, url in rows:
+                scenes.append((str(entity_id), datetime.strptime(acquired, DATE_FORMAT), cloud_cover, str(url)))
+
+        return scenes
+
+
+    def count(self):
+        """ returns the number of scenes in the index """
+
+        return self.db.execute("SELECT COUNT(*) FROM scenes").fetchone()[0]
+
+
+    def close(self):
+        """ closes the index database """
+
+        self.db.close()
+        return
+
+
+    @staticmethod
+    def _parse_rows(reader, columns):
+        """ generator of index rows from the rows of a scene list csv """
+
+        entity = columns["entityId"]
+        date   = columns["acquisitionDate"]
+        cloud  = columns["cloudCover"]
+        url    = columns["download_url"]
+
+        for line in reader:
+            if not line:
+                continue
+
+            # path and row are the 3rd to 9th characters of the entity id, as in LC80440272015123LGN00
+            entity_id = line[entity]
+            acquired  = line[date].split(".")[0]    # removes fractional seconds from datestring
+
+            yield (entity_id, int(entity_id[3:6]), int(entity_id[6:9]), acquired,
+                   float(line[cloud]), line[url])
@@ -1,6 +1,7 @@
 __author__ = 'jwely'
 
-import ftplib
+from download_url import _get_shared_engine
+
 import socket
 
 __all__ = ["list_ftp"]
@@ -12,6 +13,9 @@ def list_ftp(site, username = None , password = None, dir = None):
     patch through to the "download_url" function. returns False if the server has
     rejected our connection
 
+    Logged in ftp sessions are kept open and reused by later calls to list_ftp and
+    download_url. To list many directories repeatedly, see ``listing_index``.
+
     :param site:        url to ftp website root, does not need to include "ftp://"
     :param username:    username to log in with, if required
     :param password:    password to log in with, if required
@@ -25,35 +29,27 @@ def list_ftp(site, username = None , password = None, dir = None):
     if "ftp://" in site:
         site = site.replace("ftp://", "")
 
+    if dir is None:
+        dir = ""
+
     try:
-        ftp = ftplib.FTP(site)
+        rawdata = _get_shared_engine().list_dir("ftp://" + "/".join([site, dir]), username, password)
     except EOFError:
         return [], []
 
     except socket.gaierror:
         raise Exception("Socket.gaierror indicates this ftp address '{0}' does not exist".format(site))
 
+    filenames = _parse_ftp_dir(rawdata)
+    filepaths = ["ftp://"+"/".join([site, dir, afile]).replace("//","/") for afile in filenames]
 
-    if username is not None and password is not None:
-        ftp.login(username, password)
-    elif username is not None:
-        ftp.login(username)
-    else:
-        ftp.login()
+    return filenames, filepaths
 
-    if dir is not None:
-        ftp.cwd(dir)
-    else:
-        ftp.cwd("")
-        dir = ""
 
-    rawdata = []
-    ftp.dir(rawdata.append)
-    filenames = [i.split()[-1] for i in rawdata]
-    filepaths = ["ftp://"+"/".join([site, dir, afile]).replace("//","/") for afile in filenames]
-    ftp.quit()
+def _parse_ftp_dir(rawdata):
+    """ returns the filenames from lines of ftp LIST output """
 
-    return filenames, filepaths
+    return [i.split()[-1] for i in rawdata]
 
 
 # testin area
@@ -61,4 +57,4 @@ if __name__ == "__main__":
     filenames, filepaths = list_ftp("n5eil01u.ecs.nsidc.org")
 
     for filename in filenames:
-        print filename
\ No newline at end of file
+        print filename
@@ -1,6 +1,6 @@
 __author__ = 'jwely'
 
-import urllib
+from download_url import _get_shared_engine
 
 __all__ = ["list_http_e4ftl01"]
 
@@ -9,13 +9,19 @@ def list_http_e4ftl01(site):
     Lists contents of  http download site at [http://e4ftl01.cr.usgs.gov]
     which hosts select MODIS products, landsat WELD, and SRTM data.
 
+    Connections to the server are kept open and reused by later calls. To list
+    many directories repeatedly, see ``listing_index``.
+
     :param site: a url to somewhere on the server at http://e4ftl01.cr.usgs.gov
 
     :return file_urls: returns a list of urls to files on that http page.
     """
 
-    website = urllib.urlopen(site)
-    string  = website.readlines()
+    return _parse_e4ftl01(_get_shared_engine().list_dir(site))
+
+
+def _parse_e4ftl01(string):
+    """ returns the names of files and folders from lines of an e4ftl01 html page """
 
     file_urls = []
     for line in string:
@@ -23,4 +29,4 @@ def list_http_e4ftl01(site):
             file_urls.append(line.replace('/','').split('"')[5])
         except:
             pass
-    return file_urls
\ No newline at end of file
+    return file_urls
@@ -0,0 +1,253 @@
+__author__ = 'jwely'
+__all__ = ["listing_index"]
+
+from download_engine import download_engine
+from list_ftp import _parse_ftp_dir
+from list_http_e4ftl01 import _parse_e4ftl01
+
+from datetime import datetime, timedelta
+import threading
+import sqlite3
+import Queue
+import time
+import os
+
+
+# default location of the listing index, shared by all scripts run by this user
+INDEX_PATH = os.path.join(os.path.expanduser("~"), ".dnppy", "listing_index.sqlite")
+
+
+class listing_index():
+    """
+    Persistent, on disk index of the contents of remote directories on http and ftp
+    servers, built for servers that keep data in one folder per date, such as the
+    MODIS archives at e4ftl01.cr.usgs.gov and n5eil01u.ecs.nsidc.org.
+
+    Listings are stored in a small sqlite database, so later runs (and repeated requests
+    for other tiles or date ranges) are answered from the local index without contacting
+    the server. Listings are considered fresh for ``ttl`` seconds. Date folders whose date
+    was more than ``settle_days`` before they were listed are assumed to never change, so
+    syncing an archive again only lists the root folder and any new or recent date folders.
+    Date folders are listed concurrently over pooled connections.
+
+    :param index_path:      filepath to the index database. defaults to a file in a
+                            ".dnppy" folder in the users home directory.
+    :param ttl:             seconds for which a listing is fresh, defaults to one day
+    :param settle_days:     days after which a date folder is assumed to be complete
+    :param workers:         maximum number of directories to list at once
+    :param max_per_host:    maximum number of simultaneous listings from any one host
+    :param username:        use if listing an ftp server with username
+    :param password:        use if listing an ftp server with password
+
+    Usage example
+
+    .. code-block:: python
+
+        index = listing_index()
+        root  = "http://e4ftl01.cr.usgs.gov/MOLT/MOD11A1.005"
+        index.sync(root, datetime(2005, 1, 1), datetime(2015, 1, 1))
+        urls  = index.query(root, datetime(2010, 1, 1), datetime(2011, 1, 1), ["h11v05"])
+        index.close()
+    """
+
+    def __init__(self, index_path = None, ttl = 86400, settle_days = 7, workers = 8,
+                 max_per_host = 4, username = None, password = None):
+
+        if index_path is None:
+            index_path = INDEX_PATH
+
+        head = os.path.dirname(os.path.abspath(index_path))
+        if not os.path.exists(head):
+            os.makedirs(head)
+
+        self.index_path  = index_path
+        self.ttl         = ttl
+        self.settle_days = settle_days
+        self.workers     = workers
+        self.username    = username
+        self.password    = password
+
+        self.engine = download_engine(workers, max_per_host)
+        self.db = sqlite3.connect(index_path)
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS folders (url TEXT PRIMARY KEY, listed REAL)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS entries (folder TEXT, name TEXT, "
+                            "PRIMARY KEY (folder, name))")
+        return
+
+
+    def list(self, url, refresh = False):
+        """
+        Lists the names of the files and folders in one remote directory
+
+        :param url:         url of a directory on an http or ftp server
+        :param refresh:     set True to list the directory even if the index is fresh
+
+        :return names:      sorted list of names within the directory
+        """
+
+        url = self._folder_url(url)
+        if refresh or not self._is_fresh(url):
+            self._store({url: self._list(url)})
+        return self._names(url)
+
+
+    def sync(self, root_url, start_dto = None, end_dto = None, date_format = "%Y.%m.%d",
+             refresh = False):
+        """
+        Updates the index for a root directory of date folders, listing only those
+        date folders within the date range that are not already in the index, or
+        that are recent enough to still be changing.
+
+        :param root_url:    url of a directory holding one folder per date
+        :param start_dto:   datetime object, the earliest date folder to list, or None
+        :param end_dto:     datetime object, the latest date folder to list, or None
+        :param date_format: datetime format of the date folder names
+        :param refresh:     set True to list every folder in range even if the index is fresh
+
+        :return failed:     list of urls of date folders that could not be listed
+        """
+
+        root_url = self._folder_url(root_url)
+        folders  = self._dated(root_url, self.list(root_url, refresh), start_dto, end_dto, date_format)
+        stale    = [url for date, url in folders if refresh or not self._is_fresh(url, date)]
+
+        print("Found {0} date folders within range, listing {1}".format(len(folders), len(stale)))
+
+        tasks    = Queue.Queue()
+        listings = {}
+        failed   = []
+
+        for url in stale:
+            tasks.put(url)
+
+        def worker():
+            while True:
+                try:
+                    url = tasks.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    listings[url] = self._list(url)
+                except Exception as e:
+                    print("Could not list {0}! {1}".format(url, e))
+                    failed.append(url)
+
+        threads = [threading.Thread(target = worker) for i in range(max(1, min(self.workers, len(stale))))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # the database is only touched from this thread
+        self._store(listings)
+        return failed
+
+
+    def query(self, root_url, start_dto = None, end_dto = None, contains = None,
+              date_format = "%Y.%m.%d"):
+        """
+        Returns urls of the files within the date folders of a root directory, using
+        only the index. Call ``sync`` first to bring the index up to date.
+
+        :param root_url:    url of a directory holding one folder per date
+        :param start_dto:   datetime object, the earliest date folder to include, or None
+        :param end_dto:     datetime object, the latest date folder to include, or None
+        :param contains:    list of strings, such as tile names. Only files with names
+                            containing one of these are returned. Defaults to all files.
+        :param date_format: datetime format of the date folder names
+
+        :return urls:       list of file urls, in order of date then name
+        """
+
+        if isinstance(contains, basestring):
+            contains = [contains]
+
+        root_url = self._folder_url(root_url)
+        folders  = self._dated(root_url, self._names(root_url), start_dto, end_dto, date_format)
+
+        urls = []
+        for date, folder in folders:
+            for name in self._names(folder):
+                if contains is None or any(string in name for string in contains):
+                    urls.append(folder + "/" + name)
+        return urls
+
+
+    def close(self):
+        """ closes the index database and any idle connections """
+
+        self.engine.close()
+        self.db.close()
+        return
+
+
+    def _list(self, url):
+        """ lists a remote directory from the server """
+
+        lines = self.engine.list_dir(url, self.username, self.password)
+
+        if url.startswith("ftp://"):
+            return _parse_ftp_dir(lines)
+        return _parse_e4ftl01(lines)
+
+
+    def _is_fresh(self, url, date = None):
+        """ returns True if the index holds a listing of url that does not need refreshing """
+
+        row = self.db.execute("SELECT listed FROM folders WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return False
+
+        listed = row[0]
+        if date is not None and date < datetime.fromtimestamp(listed) - timedelta(days = self.settle_days):
+            return True
+        return time.time() - listed < self.ttl
+
+
+    def _names(self, url):
+        """ returns the indexed names within a directory """
+
+        rows = self.db.execute("SELECT name FROM entries WHERE folder = ? ORDER BY name", (url,))
+        return [row[0] for row in rows]
+
+
+    def _store(self, listings):
+        """ saves a dict of {url: names} listings to the index """
+
+        listed = time.time()
+        with self.db:
+            for url, names in listings.items():
+                self.db.execute("DELETE FROM entries WHERE folder = ?", (url,))
+                self.db.executemany("INSERT OR IGNORE INTO entries VALUES (?, ?)",
+                                    [(url, name) for name in names])
+                self.db.execute("INSERT OR REPLACE INTO folders VALUES (?, ?)", (url, listed))
+        return
+
+
+    @staticmethod
+    def _folder_url(url):
+        """ directory urls without a protocol are assumed to be ftp, as with list_ftp """
+
+        url = url.strip().rstrip("/")
+        if "://" not in url:
+            url = "ftp://" + url
+        return url
+
+
+    @staticmethod
+    def _dated(root_url, names, start_dto = None, end_dto = None, date_format = "%Y.%m.%d"):
+        """ returns sorted (datetime, url) tuples for names that are dates within a range """
+
+        folders = []
+        for name in names:
+            try:
+                date = datetime.strptime(name, date_format)
+            except ValueError:
+                continue
+
+            if (start_dto is None or start_dto <= date) and (end_dto is None or date <= end_dto):
+                folders.append((date, root_url + "/" + name))
+
+        return sorted(folders)
@@ -6,7 +6,9 @@ Landsat imagery is pretty versatile and commonly used, so the landsat data has i
 module for common tasks associated with this product. This includes things like converting
 to top-of-atmosphere reflectance, at-satellite brightness temperature, cloud masking, and others.
 
-Requires ``arcpy``
+Requires ``arcpy``. ``toa_products`` computes several of these products from a whole
+scene at once with ``numpy`` and ``gdal`` instead of arcpy map algebra, as does
+``surface_reflectance``.
 """
 
 __author__ = ["djjensen",
@@ -16,11 +18,13 @@ __author__ = ["djjensen",
 # local imports
 from atsat_bright_temp import *
 from cloud_mask import *
+from decode_bqa import *
 from landsat_metadata import *
 from ndvi import *
 from scene import *
 from surface_reflectance import *
 from surface_temp import *
+from toa_products import *
 from toa_radiance import *
 from toa_reflectance import *
 
@@ -1,14 +1,12 @@
 
 # imports
 from dnppy import core
+from dnppy import raster
+from dnppy.raster.to_numpy_blocks import _block_windows, WINDOW_PIXELS
+from decode_bqa import bqa_mask, MASK_NODATA
 import numpy
-import arcpy
+import gdal
 import os
-try: from scipy import stats
-except: pass
-if arcpy.CheckExtension('Spatial')=='Available':
-    arcpy.CheckOutExtension('Spatial')
-    arcpy.env.overwriteOutput = True
 
 
 __all__=['make_cloud_mask_457',     # complete
@@ -16,21 +14,43 @@ __all__=['make_cloud_mask_457',     # complete
          'apply_cloud_mask']        # complete
 
 
-def make_cloud_mask_8(BQA_path, outdir = None):
+# bit flags of the pixel classes found by the first pass of make_cloud_mask_457
+_DATA       = 1     # no band is NoData
+_CLOUD      = 2     # passed filters 1 to 7
+_WARM_CLOUD = 4     # warm cloud, from filter 8
+_COLD_CLOUD = 8     # cold cloud, from filter 8
+_AMB        = 16    # ambiguous pixel, revisited by the second pass
+_WARM_AMB   = 32    # ambiguous pixel within the upper temperature thresholds
+_COLD_AMB   = 64    # ambiguous pixel below the lower temperature threshold
+
+# histogram of cloud temperatures used for percentiles, in Kelvin
+TEMP_MAX        = 400
+TEMP_BINS_PER_K = 100
+TEMP_SHIFT      = 273.15    # moments are summed about this value for precision
+
+
+def make_cloud_mask_8(BQA_path, outdir = None, cloud = "high", cirrus = "high", snow = None,
+                      water = None, window_pixels = WINDOW_PIXELS):
     """
     Creates a cloud mask tiff file from the Landsat 8 Quality Assessment Band (BQA) file.
     Requires only the BQA tiff file included in the dataset.
 
-    :param BQA_path:    The full filepath to the BQA file for the raw Landsat 8 dataset
-    :param outdir:      Output directory to save cloudless band tifs and the cloud mask
+    The bit fields of the BQA band are decoded with ``landsat.bqa_mask``. By default, pixels
+    with high cloud or high cirrus confidence are masked, and other fields such as snow and
+    water may be masked as well. Fill pixels are NoData. The mask has 1 for good data and 0
+    for masked pixels, and the BQA band is read one window at a time, in a single pass.
+
+    :param BQA_path:        The full filepath to the BQA file for the raw Landsat 8 dataset
+    :param outdir:          Output directory to save cloudless band tifs and the cloud mask
+    :param cloud:           lowest cloud confidence to mask, "low", "medium", "high" or None
+    :param cirrus:          lowest cirrus confidence to mask, "low", "medium", "high" or None
+    :param snow:            lowest snow/ice confidence to mask, "low", "medium", "high" or None
+    :param water:           lowest water confidence to mask, "low", "medium", "high" or None
+    :param window_pixels:   approximate number of pixels to process at a time
 
     :return cloud_mask_path: Filepath to newly created cloud mask
     """
 
-    #define the range of values in the BQA file to be reclassified as cloud (0) or not cloud (1)
-    remap = arcpy.sa.RemapRange([[50000,65000,0],[28670,32000,0],[2,28669,1],[32001,49999,1],[1,1,"NoData"]])
-    outReclass = arcpy.sa.Reclassify(BQA_path, "Value", remap)
-
     #set the name and save the binary cloud mask tiff file
     BQA = os.path.abspath(BQA_path)
     name = os.path.split(BQA)[1]
@@ -44,28 +64,38 @@ def make_cloud_mask_8(BQA_path, outdir = None):
     else:
         folder = os.path.dirname(BQA)
         cloud_mask_path = core.create_outname(folder, TileName, "Mask", "tif")
-        
-    outReclass.save(cloud_mask_path)
+
+    meta = raster.metadata(BQA, backend = "gdal")
+    with raster.block_writer(cloud_mask_path, meta, "uint8", MASK_NODATA) as writer:
+        for bqa, bqa_meta in raster.to_numpy_blocks(BQA, window_pixels = window_pixels):
+            writer.write(bqa_mask(bqa, cloud, cirrus, snow, water), bqa_meta)
 
     return cloud_mask_path
 
 
 
-def make_cloud_mask_457(B2_TOA_Ref, outdir = None, Filter5Thresh = 2.0, Filter6Thresh = 2.0):
+def make_cloud_mask_457(B2_TOA_Ref, outdir = None, Filter5Thresh = 2.0, Filter6Thresh = 2.0,
+                        window_pixels = WINDOW_PIXELS):
     """
     Creates a binary mask raster for removal of cloud-covered pixels in raw Landsat 4, 5, and 7 bands.
 
     To be performed on Landsat 4, 5, or 7 data. Must be processed first with landsat.toa_reflectance_457
-    for bands 2, 3, 4, and 5 and landsat.atsat_bright_temp_457 for band 6.
+    for bands 2, 3, 4, and 5 and landsat.atsat_bright_temp_457 for band 6 (or with landsat.toa_products).
 
     Note that for this function to run properly, bands 2, 3, 4, 5, and 6 must each be in the same folder
     and have the correct naming convention output by the landsat.toa_reflectance_457 and landsat.atsat_bright_temp_457
-    functions (e.g. LT50410362011240PAC01_B2_TOA_Ref.tif, LT50410362011240PAC01_B6_Temp.tif).
+    functions (e.g. LT50410362011240PAC01_B2_TOA_Ref.tif, LT50410362011240PAC01_B6_ASBTemp.tif).
+
+    This is the two pass Automated Cloud Cover Assessment (ACCA). It runs on numpy arrays with
+    gdal, reading the bands one window at a time, so no temporary rasters are written. Statistics
+    of cloud temperatures used by the second pass are accumulated as the bands are read, with
+    percentiles taken from a histogram of 0.01 Kelvin bins.
 
     :param B2_TOA_Ref:      The full filepath to the band 2 top-of-atmosphere reflectance tiff file
     :param outdir:          Output directory to the cloud mask and TOA band tiffs
     :param Filter5Thresh:   Optional threshold value for Filter #5, default set at 2
     :param Filter6Thresh:   Optional threshold value for Filter #6, default set at 2
+    :param window_pixels:   approximate number of pixels to process at a time
 
     :return cloud_mask_path: Filepath to newly created cloud mask
     """
@@ -79,169 +109,183 @@ def make_cloud_mask_457(B2_TOA_Ref, outdir = None, Filter5Thresh = 2.0, Filter6T
         band_6 = None
 
     B2_path = os.path.abspath(B2_TOA_Ref)
-
-    Band2 = arcpy.Raster(B2_path)
-
-    band_path3 = B2_path.replace("B2_TOA_Ref.tif", "B3_TOA_Ref.tif")
-    band_path4 = B2_path.replace("B2_TOA_Ref.tif", "B4_TOA_Ref.tif")
-    band_path5 = B2_path.replace("B2_TOA_Ref.tif", "B5_TOA_Ref.tif")
-    band_path6 = B2_path.replace("B2_TOA_Ref.tif", "B{0}_ASBTemp.tif".format(band_6))
-
-    Band3 = arcpy.Raster(band_path3)
-    Band4 = arcpy.Raster(band_path4)
-    Band5 = arcpy.Raster(band_path5)
-    Band6 = arcpy.Raster(band_path6)
-    
-    del band_path3, band_path4, band_path5, band_path6
+    band_paths = [B2_path,
+                  B2_path.replace("B2_TOA_Ref.tif", "B3_TOA_Ref.tif"),
+                  B2_path.replace("B2_TOA_Ref.tif", "B4_TOA_Ref.tif"),
+                  B2_path.replace("B2_TOA_Ref.tif", "B5_TOA_Ref.tif"),
+                  B2_path.replace("B2_TOA_Ref.tif", "B{0}_ASBTemp.tif".format(band_6))]
+
+    datasets = [gdal.Open(band_path) for band_path in band_paths]
+    for band_path, dataset in zip(band_paths, datasets):
+        if dataset is None:
+            raise Exception("Could not open '{0}'".format(band_path))
+    bands = [dataset.GetRasterBand(1) for dataset in datasets]
 
     name = os.path.split(B2_path)[1]
 
     if outdir is None:
         outdir = os.path.split(B2_path)[0]
-            
-    #Establishing location of gaps in data. 0 = Gap, 1 = Data
-    #This will be used multiple times in later steps
-    print("Creating Gap Mask")
-    GapMask = ((Band2 > 0) * (Band3 > 0) * (Band4 > 0)*(Band5 > 0) * (Band6 > 0))
-    GapMask.save(os.path.join(outdir,"GapMask.tif"))
+
+    windows = _block_windows(bands[0], window_pixels)
+    shape   = (bands[0].YSize, bands[0].XSize)
+
+    def read(i, xoff, yoff, wx, wy):
+        return _read_window(bands[i], xoff, yoff, wx, wy)
+
+    classes, cloud_flags = _acca_457(read, windows, shape, Filter5Thresh, Filter6Thresh)
+
+    #create output name
+    mask_path = name.replace("_B2_TOA_Ref.tif", "")
+    outdir = os.path.abspath(outdir)
+    outname = core.create_outname(outdir, mask_path, "Mask", "tif")
+
+    #switch legend to 1=good data 0 = cloud pixel
+    meta = raster.metadata(B2_path, backend = "gdal")
+    with raster.block_writer(outname, meta, "uint8", NoData_Value = 255) as writer:
+        for xoff, yoff, wx, wy in windows:
+            flags = classes[yoff:yoff + wy, xoff:xoff + wx]
+            writer.write((flags & cloud_flags) == 0, meta.window(xoff, yoff, wx, wy))
+
+    print("Cloud mask saved at {0}".format(outname))
+    cloud_mask_path = outname
+
+    return cloud_mask_path
+
+
+def _acca_457(read, windows, shape, Filter5Thresh = 2.0, Filter6Thresh = 2.0):
+    """
+    Runs both passes of the ACCA cloud detection used by make_cloud_mask_457 and landsat.scene.
+
+    :param read:            function called as read(i, xoff, yoff, wx, wy) that returns a window
+                            of band 2, 3, 4 or 5 TOA reflectance or band 6 brightness temperature
+                            (for i = 0 to 4) as float32, with NaN at NoData
+    :param windows:         list of (xoff, yoff, xsize, ysize) windows that cover the scene
+    :param shape:           (rows, columns) of the scene
+    :param Filter5Thresh:   threshold value for Filter #5
+    :param Filter6Thresh:   threshold value for Filter #6
+
+    :return classes:        uint8 array of the class flags of every pixel
+    :return cloud_flags:    flags of the classes that are cloud, so that
+                            ``(classes & cloud_flags) > 0`` is the cloud mask
+    """
+
+    # the class of every pixel is kept as bit flags in one byte
+    classes = numpy.zeros(shape, dtype = "uint8")
+
+    gap_count   = 0
+    data_count  = 0
+    desert_count = 0
+    cold_count  = 0
+    snow_count  = 0
+    cold_temps  = _temp_stats()
+    warm_temps  = _temp_stats()
 
     print("First pass underway")
+    for xoff, yoff, wx, wy in windows:
+        Band2, Band3, Band4, Band5, Band6 = [read(i, xoff, yoff, wx, wy) for i in range(5)]
+        flags = numpy.zeros((wy, wx), dtype = "uint8")
+
+        with numpy.errstate(divide = "ignore", invalid = "ignore"):
+
+            #Establishing location of gaps in data. False = Gap, True = Data
+            Data    = numpy.isfinite(Band2) & numpy.isfinite(Band3) & numpy.isfinite(Band4) \
+                    & numpy.isfinite(Band5) & numpy.isfinite(Band6)
+            GapMask = (Band2 > 0) & (Band3 > 0) & (Band4 > 0) & (Band5 > 0) & (Band6 > 0)
+
+            #Filter 1 - Brightness Threshold--------------------------------------------
+            Cloudmask = Band3 > .08
+
+            #Filter 2 - Normalized Snow Difference Index--------------------------------
+            NDSI = (Band2 - Band5)/(Band2 + Band5)
+            Snow = (NDSI > .6) & Cloudmask
+            Cloudmask &= (NDSI < .6)
+
+            #Filter 3 - Temperature Threshold-------------------------------------------
+            Cloudmask &= (Band6 < 300)
+
+            #Filter 4 - Band 5/6 Composite----------------------------------------------
+            Composite = (1 - Band5) * Band6
+            Cloudmask &= (Composite < 225)
+            Amb = (Composite > 225)
+
+            #Filter 5 - Band 4/3 Ratio (eliminates vegetation)--------------------------
+            #bright cloud tops are sometimes cut out by this filter. original threshold was
+            #raising this threshold will make the algorithm more aggresive
+            Cloudmask &= ((Band4/Band3) < Filter5Thresh)
+            Amb &= ((Band4/Band3) > Filter5Thresh)
+
+            #Filter 6 - Band 4/2 Ratio (eliminates vegetation)--------------------------
+            #bright cloud tops are sometimes cut out by this filter. original threshold was
+            #raising this threshold will make the algorithm more aggresive
+            Cloudmask &= ((Band4/Band2) < Filter6Thresh)
+            Amb &= ((Band4/Band2) > Filter6Thresh)
+
+            #Filter 7 - Band 4/5 Ratio (Eliminates desert features)---------------------
+            #   DesertIndex recorded
+            DesertIndMask = ((Band4/Band5) > 1.0)
+            Cloudmask &= DesertIndMask
+            Amb &= ((Band4/Band5) < 1.0)
+
+            #Filter 8  Band 5/6 Composite (Seperates warm and cold clouds)--------------
+            WarmCloud = (Composite > 210) & Cloudmask
+            ColdCloud = (Composite < 210) & Cloudmask
+
+            HasTemp = Band6 > 0
+
+        # pixels with NoData in any band are not part of any class
+        Cloudmask &= Data
+        Amb       &= Data
+
+        flags[Data]      |= _DATA
+        flags[Cloudmask] |= _CLOUD
+        flags[WarmCloud] |= _WARM_CLOUD
+        flags[ColdCloud] |= _COLD_CLOUD
+        flags[Amb]       |= _AMB
+        classes[yoff:yoff + wy, xoff:xoff + wx] = flags
+
+        #Counting pixels classified as Desert, Cold Cloud and Snow within the data
+        gap_count    += numpy.count_nonzero(GapMask)
+        data_count   += numpy.count_nonzero(Data)
+        desert_count += numpy.count_nonzero(DesertIndMask & GapMask)
+        cold_count   += numpy.count_nonzero(ColdCloud & GapMask)
+        snow_count   += numpy.count_nonzero(Snow & GapMask)
+
+        #Collecting statistics for Cloud pixel Temperature values, cold clouds apart from the others
+        cold_temps.add(Band6[ColdCloud & HasTemp])
+        warm_temps.add(Band6[Cloudmask & ~ColdCloud & HasTemp])
+
+    #Calculating percentage of the scene that is classified as Desert, Cold Cloud and Snow
+    DesertIndex   = float(desert_count) / max(gap_count, 1)
+    ColdCloudMean = float(cold_count) / max(gap_count, 1)
+    SnowPerc      = float(snow_count) / max(gap_count, 1)
 
-    #Filter 1 - Brightness Threshold--------------------------------------------
-    Cloudmask = Band3 > .08
-
-    #Filter 2 - Normalized Snow Difference Index--------------------------------
-    NDSI = (Band2 - Band5)/(Band2 + Band5)
-    Snow = (NDSI > .6) * Cloudmask
-    Cloudmask *= (NDSI < .6)
-
-    #Filter 3 - Temperature Threshold-------------------------------------------
-    Cloudmask *= (Band6 < 300)
-
-    #Filter 4 - Band 5/6 Composite----------------------------------------------
-    Cloudmask *= (((1-Band5) * Band6) < 225)
-    Amb = (((1 - Band5) * Band6) > 225)
-
-    #Filter 5 - Band 4/3 Ratio (eliminates vegetation)--------------------------
-    #bright cloud tops are sometimes cut out by this filter. original threshold was
-    #raising this threshold will make the algorithm more aggresive
-    Cloudmask *= ((Band4/Band3) < Filter5Thresh)
-    Amb *= ((Band4/Band3) > Filter5Thresh)
-
-    #Filter 6 - Band 4/2 Ratio (eliminates vegetation)--------------------------
-    #bright cloud tops are sometimes cut out by this filter. original threshold was
-    #raising this threshold will make the algorithm more aggresive
-    Cloudmask *= ((Band4/Band2) < Filter6Thresh)
-    Amb *= ((Band4/Band2) > Filter6Thresh)
-
-    #Filter 7 - Band 4/5 Ratio (Eliminates desert features)---------------------
-    #   DesertIndex recorded
-    DesertIndMask = ((Band4/Band5) > 1.0)
-    Cloudmask *= DesertIndMask
-    Amb *= ((Band4/Band5) < 1.0)
-
-    #Filter 8  Band 5/6 Composite (Seperates warm and cold clouds)--------------
-    WarmCloud = (((1 - Band5) * Band6) > 210) * Cloudmask
-    ColdCloud = (((1 - Band5) * Band6) < 210) * Cloudmask
-
-    #Calculating percentage of the scene that is classified as Desert
-    DesertGap = (DesertIndMask + 1) * GapMask
-    try:
-        arcpy.CalculateStatistics_management(DesertGap,ignore_values = "0")
-        DesertIndex = DesertGap.mean - 1
-    except:
-        DesertGap.save(os.path.join(outdir, "Desert.tif"))
-        arcpy.CalculateStatistics_management(DesertGap,ignore_values = "0")
-        DesertIndex = DesertGap.mean - 1
-        os.remove(os.path.join(outdir, "Desert.tif"))
-    del DesertIndMask, DesertGap, NDSI
-
-    #Calculating percentage of the scene that is classified as Snow
-    ColdCloudGap = (ColdCloud + 1) * GapMask
-    try:
-        arcpy.CalculateStatistics_management(ColdCloudGap,ignore_values = "0")
-        ColdCloudMean = ColdCloudGap.mean - 1
-        del ColdCloudGap
-    except:
-        ColdCloudGap.save(os.path.join(outdir, "ColdCloud.tif"))
-        arcpy.CalculateStatistics_management(ColdCloudGap,ignore_values = "0")
-        ColdCloudMean = ColdCloudGap.mean - 1
-        os.remove(os.path.join(outdir, "ColdCloud.tif"))
-        del ColdCloudGap
-
-    del Band2, Band3, Band4, Band5
-
-    SnowGap = (Snow + 1) * GapMask
-    try:
-        arcpy.CalculateStatistics_management(SnowGap,ignore_values = "0")
-        SnowPerc = SnowGap.mean - 1
-        del SnowGap
-    except:
-        SnowGap.save(os.path.join(outdir, "Snow.tif"))
-        arcpy.CalculateStatistics_management(SnowGap,ignore_values = "0")
-        SnowPerc = SnowGap.mean - 1
-        os.remove(os.path.join(outdir, "Snow.tif"))
-        del SnowGap
-    del Snow
-    del GapMask
-    
     #Determining whether or not snow is present and adjusting the Cloudmask
     #accordinging. If snow is present the Warm Clouds are reclassfied as ambigious
     if SnowPerc > .01:
         SnowPresent = True
-        Cloudmask = ColdCloud
-        Amb = Amb + WarmCloud
+        cloud_flags = _COLD_CLOUD
+        amb_flags   = _AMB | _WARM_CLOUD
+        tempclouds  = cold_temps
     else:
         SnowPresent = False
-    del ColdCloud, WarmCloud, SnowPerc
-
-    #Collecting statistics for Cloud pixel Temperature values. These will be used in later conditionals
-    Tempclouds = Cloudmask * Band6
-    Tempclouds.save(os.path.join(outdir, "TempClouds.tif"))
-    del Tempclouds
-
-    #Converting TempClouds to a text file and writing its non-zero/NAN values to a list
-    outtxt = os.path.join(outdir, "tempclouds.txt")
-    arcpy.RasterToASCII_conversion(os.path.join(outdir, "TempClouds.tif"), outtxt)
-
-    f = open(outtxt)
-    alist = []
-    lines = f.readlines()[6:]
-    for line in lines:
-        for x in line.split(' '):
-            try:
-                x = float(x)
-                if x > 0:
-                    alist.append(x)
-            except ValueError:
-                pass
-    f.close()
-
-    #Band6clouds = Band6array[np.where(Band6array > 0)]
-    #del Band6array
-    TempMin = min(alist)
-    TempMax = max(alist)
-    TempMean = numpy.mean(alist)
-    TempStd = numpy.std(alist)
-    TempSkew = stats.skew(alist)
-    Temp98perc = numpy.percentile(alist, 98.75)
-    Temp97perc = numpy.percentile(alist, 97.50)
-    Temp82perc = numpy.percentile(alist, 82.50)
-    del alist
-
-    #delete all intermediary files in the output directory
-    for file in os.listdir(outdir):
-        if "GapMask" in file:
-            os.remove("{0}\\{1}".format(outdir, file))
-        elif "TempClouds" in file:
-            os.remove("{0}\\{1}".format(outdir, file))
-        elif "tempclouds" in file:
-            os.remove("{0}\\{1}".format(outdir, file))
-            
+        cloud_flags = _CLOUD
+        amb_flags   = _AMB
+        tempclouds  = cold_temps.merge(warm_temps)
+
     #Pass 2 is run if the following conditionals are met
-    if ColdCloudMean > .004 and DesertIndex > .5 and TempMean < 295:
+    if tempclouds.count > 0:
+        TempMean   = tempclouds.mean()
+        TempStd    = tempclouds.std()
+        TempSkew   = tempclouds.skew()
+        Temp98perc = tempclouds.percentile(98.75)
+        Temp97perc = tempclouds.percentile(97.50)
+        Temp82perc = tempclouds.percentile(82.50)
+    else:
+        TempMean = None
+
+    if ColdCloudMean > .004 and DesertIndex > .5 and TempMean is not None and TempMean < 295:
         #Pass 2
-        arcpy.AddMessage("Second Pass underway")
+        print("Second Pass underway")
 
         #Adjusting Temperature thresholds based on skew
         if TempSkew > 0:
@@ -256,70 +300,170 @@ def make_cloud_mask_457(B2_TOA_Ref, outdir = None, Filter5Thresh = 2.0, Filter6T
             Temp82perc = Temp82perc -(Temp97perc - Temp98perc)
             Temp97perc = Temp98perc
 
-        warmAmbmask = ((Band6 * Amb) < Temp97perc)
-        warmAmbmask = warmAmbmask * ((Amb * Band6) > Temp82perc)
+        warm_count = 0
+        warm_sum   = 0.0
+        cold_count = 0
+        cold_sum   = 0.0
 
-        coldAmbmask = (Band6 * Amb ) < Temp82perc
-        coldAmbmask = coldAmbmask * ((Amb * Band6) > 0)
+        for xoff, yoff, wx, wy in windows:
+            Band6 = read(4, xoff, yoff, wx, wy)
+            flags = classes[yoff:yoff + wy, xoff:xoff + wx]
+            Amb   = (flags & amb_flags) > 0
 
-        warmAmb = warmAmbmask * Band6
-        coldAmb = coldAmbmask * Band6
+            with numpy.errstate(invalid = "ignore"):
+                warmAmbmask = Amb & (Band6 < Temp97perc) & (Band6 > Temp82perc)
+                coldAmbmask = Amb & (Band6 < Temp82perc) & (Band6 > 0)
 
-        ThermEffect1 = warmAmbmask.mean
-        ThermEffect2 = coldAmbmask.mean
+            flags[warmAmbmask] |= _WARM_AMB
+            flags[coldAmbmask] |= _COLD_AMB
 
-        arcpy.CalculateStatistics_management(warmAmb, ignore_values = "0")
-        arcpy.CalculateStatistics_management(coldAmb, ignore_values = "0")
+            warm_count += numpy.count_nonzero(warmAmbmask)
+            warm_sum   += Band6[warmAmbmask].sum(dtype = "float64")
+            cold_count += numpy.count_nonzero(coldAmbmask)
+            cold_sum   += Band6[coldAmbmask].sum(dtype = "float64")
 
-        if ThermEffect1 < .4 and warmAmb.mean < 295 and SnowPresent == False:
-            Cloudmask = Cloudmask + warmAmbmask + coldAmbmask
-            arcpy.AddMessage("Upper Threshold Used")
-        elif ThermEffect2 < .4 and coldAmb.mean < 295:
-            Cloudmask += coldAmbmask
-            arcpy.AddMessage("Lower Threshold Used")
+        ThermEffect1 = float(warm_count) / max(data_count, 1)
+        ThermEffect2 = float(cold_count) / max(data_count, 1)
+        warmAmbMean  = warm_sum / warm_count if warm_count else 0.0
+        coldAmbMean  = cold_sum / cold_count if cold_count else 0.0
 
-    #switch legend to 1=good data 0 = cloud pixel
-    remap = arcpy.sa.RemapValue([[1,0],[0,1],["NODATA",1]])
-    Cloud_Mask = arcpy.sa.Reclassify(Cloudmask, "Value", remap)
+        if ThermEffect1 < .4 and warmAmbMean < 295 and SnowPresent == False:
+            cloud_flags |= _WARM_AMB | _COLD_AMB
+            print("Upper Threshold Used")
+        elif ThermEffect2 < .4 and coldAmbMean < 295:
+            cloud_flags |= _COLD_AMB
+            print("Lower Threshold Used")
 
-    #create output name
-    mask_path = name.replace("_B2_TOA_Ref.tif", "")
-    if outdir:
-        outdir = os.path.abspath(outdir)
-        outname = core.create_outname(outdir, mask_path, "Mask", "tif")
-    else:
-        folder = B2_TOA_Ref.replace(name, "")
-        outname = core.create_outname(folder, mask_path, "Mask", "tif")
+    return classes, cloud_flags
 
-    print "Cloud mask saved at {0}".format(outname)
-    Cloud_Mask.save(outname)
-    cloud_mask_path = arcpy.Raster(outname)
 
-    del name, mask_path, Cloud_Mask, remap
-    
-    return cloud_mask_path
+def _read_window(band, xoff, yoff, wx, wy):
+    """ reads a window of a band as float32, with NaN at NoData and any gdal scale applied """
+
+    values = band.ReadAsArray(xoff, yoff, wx, wy).astype("float32")
+
+    nodata = band.GetNoDataValue()
+    if nodata is not None:
+        values[values == nodata] = numpy.nan
 
+    scale = band.GetScale()
+    if scale not in (None, 1.0):
+        values *= scale
 
+    return values
 
-def apply_cloud_mask(mask_path, folder, outdir = None):
+
+class _temp_stats():
+    """
+    accumulates the count, moments and a fine histogram of temperatures in Kelvin,
+    so their mean, standard deviation, skew and percentiles can be found without
+    keeping every value.
+    """
+
+    def __init__(self):
+
+        self.count = 0
+        self.sums  = numpy.zeros(3, dtype = "float64")  # sums of powers of (temp - TEMP_SHIFT)
+        self.hist  = numpy.zeros(int(TEMP_MAX * TEMP_BINS_PER_K) + 1, dtype = "int64")
+        return
+
+
+    def add(self, temps):
+        """ adds a 1d array of temperatures """
+
+        if temps.size == 0:
+            return
+
+        shifted = temps.astype("float64") - TEMP_SHIFT
+        self.count += temps.size
+        self.sums  += [shifted.sum(), (shifted ** 2).sum(), (shifted ** 3).sum()]
+
+        bins = numpy.clip((temps * TEMP_BINS_PER_K).astype("int64"), 0, self.hist.size - 1)
+        self.hist += numpy.bincount(bins, minlength = self.hist.size)
+        return
+
+
+    def merge(self, other):
+        """ returns a new _temp_stats holding the values of both """
+
+        merged = _temp_stats()
+        merged.count = self.count + other.count
+        merged.sums  = self.sums + other.sums
+        merged.hist  = self.hist + other.hist
+        return merged
+
+
+    def _central_moments(self):
+        """ returns the mean and the 2nd and 3rd central moments """
+
+        m1, m2, m3 = self.sums / self.count
+        var  = m2 - m1 ** 2
+        mom3 = m3 - 3 * m1 * m2 + 2 * m1 ** 3
+        return m1 + TEMP_SHIFT, max(var, 0.0), mom3
+
+
+    def mean(self):
+        return self._central_moments()[0]
+
+
+    def std(self):
+        return self._central_moments()[1] ** 0.5
+
+
+    def skew(self):
+        """ biased sample skewness, as from scipy.stats.skew """
+
+        mean, var, mom3 = self._central_moments()
+        if var == 0:
+            return 0.0
+        return mom3 / var ** 1.5
+
+
+    def percentile(self, q):
+        """
+        percentile with linear interpolation between ranks, as ``numpy.percentile``,
+        where values within each histogram bin are assumed to be evenly spread.
+        """
+
+        rank = (self.count - 1) * q / 100.0
+        low  = int(rank)
+        high = min(low + 1, self.count - 1)
+
+        cumulative = numpy.cumsum(self.hist)
+
+        def value(k):
+            b = numpy.searchsorted(cumulative, k, side = "right")
+            before = cumulative[b] - self.hist[b]
+            return (b + (k - before + 0.5) / float(self.hist[b])) / TEMP_BINS_PER_K
+
+        return value(low) + (value(high) - value(low)) * (rank - low)
+
+
+def apply_cloud_mask(mask_path, folder, outdir = None, window_pixels = WINDOW_PIXELS):
     """
     Removal of cloud-covered pixels in Landsat 4, 5, 7, or 8 bands using the mask created with
     landsat.make_cloud_mask_8 or landsat.make_cloud_mask_457.
 
+    A Landsat 8 BQA file may be given in place of a mask, in which case it is decoded with the
+    default rules of ``landsat.bqa_mask``. Each window of the mask is read once and applied to
+    every band before moving on. Bands of a different resolution than the mask, such as
+    panchromatic band 8, use the nearest mask pixel.
+
     :param folder:        The folder containing the raw or processed band tiffs to remove clouds from
-    :param mask_path:     The full filepath to the mask file created by make_cloud_mask_8 or make_cloud_mask_457
+    :param mask_path:     The full filepath to the mask file created by make_cloud_mask_8 or make_cloud_mask_457,
+                          or to the BQA file of a Landsat 8 scene.
     :param outdir:        Output directory to save cloudless band tiffs, default is same as "folder"
+    :param window_pixels: approximate number of pixels to process at a time
 
     :return no_clouds_list: List of files created by this function with cloud mask applied.
     """
 
-    no_clouds_list = []
-
     #enforce the input band numbers as a list of strings
     mpath = os.path.abspath(mask_path)
     mask_split = os.path.split(mpath)[1]
     name = os.path.splitext(mask_split)[0]
-    tilename = name.replace("_Mask", "")
+    is_bqa = name.endswith("_BQA")
+    tilename = name.replace("_Mask", "").replace("_BQA", "")
     folder = os.path.abspath(folder)
 
     #loop through each file in folder
@@ -336,17 +480,63 @@ def apply_cloud_mask(mask_path, folder, outdir = None):
                 outname = core.create_outname(outdir, name, "NoClds", "tif")
             else:
                 outname = core.create_outname(folder, name, "NoClds", "tif")
-            inlist.append("{0}\\{1}".format(folder, band))
+            inlist.append(os.path.join(folder, band))
             outlist.append(outname)
 
-    #loop through the input list and apply the con to each file, saving to the corresponding path in the output list
-    y = 0
-    for afile in inlist:
-        outcon = arcpy.sa.Con(mask_path, afile, "", "VALUE = 1")
-        outcon.save(outlist[y])
-        no_clouds_list.append(outlist[y])
-        y += 1
-        if y > (len(inlist) - 1):
-            break
-
-    return no_clouds_list
+    mask_dataset = gdal.Open(mpath)
+    if mask_dataset is None:
+        raise Exception("Could not open mask '{0}'".format(mpath))
+    mask_band = mask_dataset.GetRasterBand(1)
+
+    # bands are grouped by size, so that each window of the mask is read once per group
+    groups = {}
+    for inpath, outpath in zip(inlist, outlist):
+        meta = raster.metadata(inpath, backend = "gdal")
+        groups.setdefault((meta.Xsize, meta.Ysize), []).append((inpath, outpath, meta))
+
+    for (xs, ys), group in groups.items():
+        datasets = [gdal.Open(inpath) for inpath, outpath, meta in group]
+        bands    = [dataset.GetRasterBand(1) for dataset in datasets]
+        writers  = []
+
+        # raw landsat bands have no NoData value set, but use 0 as fill
+        for inpath, outpath, meta in group:
+            if meta.NoData_Value is None:
+                meta.NoData_Value = 0
+            writers.append(raster.block_writer(outpath, meta))
+
+        try:
+            for xoff, yoff, wx, wy in _block_windows(bands[0], window_pixels):
+                mask = _mask_window(mask_band, xoff, yoff, wx, wy, xs, ys)
+                if is_bqa:
+                    mask = bqa_mask(mask)
+                clear = (mask == 1)
+
+                for band, writer, (inpath, outpath, meta) in zip(bands, writers, group):
+                    values = band.ReadAsArray(xoff, yoff, wx, wy)
+                    values[~clear] = meta.NoData_Value
+                    writer.write(values, meta.window(xoff, yoff, wx, wy))
+        finally:
+            for writer in writers:
+                writer.close()
+
+    return outlist
+
+
+def _mask_window(mask_band, xoff, yoff, wx, wy, xs, ys):
+    """
+    reads the window of a mask that covers a window of a band of size (xs, ys), taking
+    the nearest mask pixel when the band and mask are of different resolutions.
+    """
+
+    mxs = mask_band.XSize
+    mys = mask_band.YSize
+
+    if (mxs, mys) == (xs, ys):
+        return mask_band.ReadAsArray(xoff, yoff, wx, wy)
+
+    cols = (numpy.arange(xoff, xoff + wx) * mxs) // xs
+    rows = (numpy.arange(yoff, yoff + wy) * mys) // ys
+    mask = mask_band.ReadAsArray(int(cols[0]), int(rows[0]),
+                                 int(cols[-1] - cols[0] + 1), int(rows[-1] - rows[0] + 1))
+    return mask[numpy.ix_(rows - rows[0], cols - cols[0])]
@@ -0,0 +1,149 @@
+__author__ = 'jwely'
+__all__ = ["decode_bqa", "bqa_mask"]
+
+import numpy
+
+
+# bit fields of the Landsat 8 quality assessment band (BQA), as (first bit, number of bits)
+# see [http://landsat.usgs.gov/L8QualityAssessmentBand.php]
+BQA_FIELDS = {"fill":              (0, 1),      # designated fill
+              "dropped_frame":     (1, 1),
+              "terrain_occlusion": (2, 1),
+              "water":             (4, 2),      # water confidence
+              "snow":              (10, 2),     # snow/ice confidence
+              "cirrus":            (12, 2),     # cirrus confidence
+              "cloud":             (14, 2)}     # cloud confidence
+
+# values of the two bit confidence fields
+CONFIDENCE = {"none":   0,      # not determined
+              "low":    1,      # 0 to 33 percent confidence
+              "medium": 2,      # 34 to 66 percent confidence
+              "high":   3}      # 67 to 100 percent confidence
+
+# value of fill pixels in the output of bqa_mask
+MASK_NODATA = 255
+
+# lookup tables that have already been built, by field or by masking rules
+_tables = {}
+
+
+def decode_bqa(bqa, fields = None):
+    """
+    Unpacks the bit fields of a Landsat 8 quality assessment band into separate arrays.
+
+    Single bit fields, such as "fill", are returned as boolean arrays, and two bit confidence
+    fields, such as "cloud", are returned as uint8 arrays of values 0 to 3, which are the
+    "none", "low", "medium" and "high" levels of ``CONFIDENCE``. Each field is decoded with a
+    lookup table over all 65536 possible BQA values, so a whole array is decoded with one
+    numpy indexing operation per field rather than with per pixel arithmetic.
+
+    :param bqa:         numpy array of BQA values, as read from a ``_BQA.tif`` file
+    :param fields:      list of field names in ``BQA_FIELDS`` to decode, defaults to all of them
+
+    :return decoded:    dict of {field name: numpy array} of the same shape as bqa
+    """
+
+    if fields is None:
+        fields = sorted(BQA_FIELDS.keys())
+    elif isinstance(fields, basestring):
+        fields = [fields]
+
+    bqa = _as_uint16(bqa)
+
+    decoded = {}
+    for field in fields:
+        if field not in BQA_FIELDS:
+            raise Exception("Unknown BQA field '{0}', use any of {1}".format(field, sorted(BQA_FIELDS)))
+
+        decoded[field] = _field_table(field)[bqa]
+
+    return decoded
+
+
+def bqa_mask(bqa, cloud = "high", cirrus = "high", snow = None, water = None,
+             terrain_occlusion = False):
+    """
+    Builds a mask from a Landsat 8 quality assessment band, where 1 is good data, 0 is a
+    masked pixel, and ``MASK_NODATA`` (255) is fill. This is the legend of the masks made
+    by ``make_cloud_mask_8``.
+
+    Each confidence argument is the lowest confidence level at which a pixel is masked,
+    one of "low", "medium" or "high" (or 1, 2 or 3), or None to ignore that field. All of
+    the rules are combined into a single lookup table over every possible BQA value, so
+    the mask is made with one pass over the array, however many rules are used.
+
+    :param bqa:                 numpy array of BQA values, as read from a ``_BQA.tif`` file
+    :param cloud:               lowest cloud confidence to mask, default "high"
+    :param cirrus:              lowest cirrus confidence to mask, default "high"
+    :param snow:                lowest snow/ice confidence to mask, default None
+    :param water:               lowest water confidence to mask, default None
+    :param terrain_occlusion:   set True to mask pixels flagged as terrain occlusion
+
+    :return mask:               uint8 numpy array of the same shape as bqa
+    """
+
+    rules = (("cloud",  _confidence(cloud)),
+             ("cirrus", _confidence(cirrus)),
+             ("snow",   _confidence(snow)),
+             ("water",  _confidence(water)),
+             ("terrain_occlusion", 1 if terrain_occlusion else None))
+
+    return _mask_table(rules)[_as_uint16(bqa)]
+
+
+def _as_uint16(bqa):
+    """ returns BQA values as a uint16 array that can index the lookup tables """
+
+    if isinstance(bqa, numpy.ma.core.MaskedArray):
+        bqa = bqa.filled(1)         # value of a fill pixel
+
+    bqa = numpy.asarray(bqa)
+    if bqa.dtype != numpy.uint16:
+        bqa = bqa.astype("uint16")
+    return bqa
+
+
+def _field_table(field):
+    """ returns the lookup table from every BQA value to the value of one field """
+
+    if field not in _tables:
+        first_bit, bits = BQA_FIELDS[field]
+        table = (numpy.arange(2 ** 16, dtype = "uint32") >> first_bit) & (2 ** bits - 1)
+
+        if bits == 1:
+            _tables[field] = table.astype("bool")
+        else:
+            _tables[field] = table.astype("uint8")
+
+    return _tables[field]
+
+
+def _mask_table(rules):
+    """ returns the lookup table from every BQA value to the mask value under a set of rules """
+
+    if rules not in _tables:
+        masked = numpy.zeros(2 ** 16, dtype = "bool")
+        for field, level in rules:
+            if level is not None:
+                masked |= _field_table(field) >= level
+
+        table = numpy.where(masked, 0, 1).astype("uint8")
+        table[_field_table("fill")] = MASK_NODATA
+        _tables[rules] = table
+
+    return _tables[rules]
+
+
+def _confidence(level):
+    """ translates a confidence level name into its value """
+
+    if level is None:
+        return None
+    if isinstance(level, basestring):
+        if level not in CONFIDENCE:
+            raise Exception("Unknown confidence level '{0}', use any of {1}".format(level, CONFIDENCE.keys()))
+        level = CONFIDENCE[level]
+
+    if not 1 <= level <= 3:
+        raise Exception("Confidence levels to mask must be from 1 to 3, not {0}".format(level))
+    return level
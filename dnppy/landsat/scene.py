@@ -1,22 +1,31 @@
 # local imports
 from landsat_metadata import landsat_metadata
-
+from toa_products import _scene_coefficients, _product, THERMAL_BANDS, NDVI_BANDS
+from cloud_mask import _acca_457, _read_window
+from decode_bqa import decode_bqa, bqa_mask
+from surface_reflectance import _surface_reflectance, _atmosphere_constants, _dem_tile, SR_BANDS
+
+from collections import OrderedDict
+import hashlib
+import numpy
+import gdal
 import os
-import arcpy
-if arcpy.CheckExtension('Spatial')=='Available':
-    arcpy.CheckOutExtension('Spatial')
-    arcpy.env.overwriteOutput = True
 
 __author__ = ["Jwely"]
 
 
+# number of rows of a scene to cloud mask at a time
+ACCA_ROWS = 256
+
+
 class scene:
     """
     Defines a landsat scene object. Used to track band filepaths
-    and pass raster objects to functions.
+    and to compute products from the bands on demand.
 
     band filepaths are read from the MTL file and stored as a dict.
-    you may access them with
+    Bands are read into numpy arrays only when they are first used,
+    and you may access them with
 
         from dnppy import landsat
         s = landsat.scene(MTL_path)
@@ -25,45 +34,71 @@ class scene:
         s[2]        # the second band of scene "s"
         s["QA"]     # the QA band of scene "s"
 
+    Derived products are computed from the bands with the same formulas as
+    ``landsat.toa_products``, and are float32 arrays with NaN at NoData.
+    Every band and product is kept in a cache once computed, and products
+    that depend on one another share it, so for example
+
+        ref4 = s.get_toa_reflectance(4)
+        ndvi = s.get_ndvi()                 # reuses the band 4 reflectance
+        mask = s.get_cloud_mask()
+
+    reads each band only once. The cache holds at most ``cache_mb`` of arrays,
+    dropping the least recently used arrays when it is full, which are read or
+    computed again if they are needed later. Arrays from the cache are read only.
+
+    If a ``cache_dir`` is given, products are also saved there as ".npy" files
+    named by the scene ID, product and parameters, so later runs (and other scene
+    objects of the same scene) load them as memory maps instead of computing
+    them again. Delete the files to force them to be recomputed.
+
     Development Note:
-        1) This is arcpy dependent, but in the future it should utilize
-             custom functions that emulate RasterToNumPyArray and the dnppy metadata
-             objects for all returns, thus eliminating all non-open source
-             dependencies
-        2) for good interchangability between landsat versions, it might be better
+        1) for good interchangability between landsat versions, it might be better
             to construct a dict whos keys are color codes or even wavelength values
             instead of band index numbers (which are do not correspond to similar colors
             between landsat missions)
     """
 
-    def __init__(self, MTL_path, tif_dir = None):
+    def __init__(self, MTL_path, tif_dir = None, cache_mb = 1024, cache_dir = None):
         """
         builds the scene.
 
         In some cases, users may have their MTL file located somewhere other than
         their landsat data. In this instance, users should input the path to
         the landsat images as tif_dir.
+
+        :param MTL_path:    filepath to the MTL file of the scene
+        :param tif_dir:     directory of the band tifs, if not that of the MTL file
+        :param cache_mb:    maximum size in MB of the arrays kept in memory
+        :param cache_dir:   optional directory in which to save products between runs
         """
 
-        self.mtl_dir    = os.path.dirname(MTL_path)     # directory of MTL file
+        self.mtl_dir    = os.path.dirname(os.path.abspath(MTL_path))    # directory of MTL file
         self.meta       = landsat_metadata(MTL_path)    # dnppy landsat_metadata object
         self.in_paths   = {}                            # dict of filepaths to tifs
-        self.rasts      = {}                            # dict of arcpy raster objects
+        self.coefs      = None                          # conversion coefficients, see toa_products
+        self.cache      = _array_cache(cache_mb, cache_dir, self.meta.LANDSAT_SCENE_ID)
 
-        if not tif_dir:
+        if tif_dir:
+            self.tif_dir = tif_dir
+        else:
             self.tif_dir = self.mtl_dir
 
-        self._find_bands()   
+        self._find_bands()
         return
-    
+
 
     def __getitem__(self, index):
-        """ returns arcpy.raster objects from getitem indices """
+        """ returns numpy arrays of raw bands from getitem indices """
 
-        if not "B{0}".format(index) in self.rasts:
-            self.rasts["B{0}".format(index)] = arcpy.Raster(self.in_paths["B{0}".format(index)])
+        key = ("DN", "B{0}".format(index))
+        if key not in self.cache:
+            dataset = gdal.Open(self.in_paths[key[1]])
+            if dataset is None:
+                raise Exception("Could not open {0}".format(self.in_paths[key[1]]))
+            self.cache[key] = dataset.GetRasterBand(1).ReadAsArray()
 
-        return self.rasts["B{0}".format(index)]
+        return self.cache[key]
 
 
     def __iter__(self):
@@ -111,33 +146,248 @@ class scene:
         return
 
 
-    def get_cloud_mask(self):
-        """ wraps dnppy.landsat.cloud_mask functions and applies them to this scene"""
-        pass
+    def get_bqa_flags(self, fields = None):
+        """
+        decodes the bit fields of the QA band of a landsat 8 scene with
+        dnppy.landsat.decode_bqa, returning a dict of numpy arrays
+        """
+
+        if not "BQA" in self.in_paths:
+            raise Exception("Only Landsat 8 scenes have a QA band")
+
+        return decode_bqa(self["QA"], fields)
+
+
+    def get_cloud_mask(self, **kwargs):
+        """
+        wraps dnppy.landsat.cloud_mask functions and applies them to this scene, returning
+        a uint8 array with 1 for good data and 0 for cloud. Landsat 8 masks are made from the
+        QA band, with keyword arguments such as ``snow = "medium"`` passed to bqa_mask.
+        Landsat 4, 5 and 7 masks are made with the ACCA of make_cloud_mask_457 from the TOA
+        reflectance and brightness temperature of this scene, with keyword arguments
+        Filter5Thresh and Filter6Thresh.
+        """
+
+        key = ("Mask", _params_id(kwargs))
+        if key in self.cache:
+            return self.cache[key]
+
+        if "BQA" in self.in_paths:
+            mask = bqa_mask(self["QA"], **kwargs)
+
+        else:
+            arrays = [self.get_toa_reflectance(band) for band in [2, 3, 4, 5]]
+            arrays.append(self.get_atsat_bright_temp())
+
+            rows, cols = arrays[0].shape
+            windows = [(0, yoff, cols, min(ACCA_ROWS, rows - yoff)) for yoff in range(0, rows, ACCA_ROWS)]
 
+            def read(i, xoff, yoff, wx, wy):
+                return arrays[i][yoff:yoff + wy, xoff:xoff + wx]
 
-    def get_surface_reflectance(self):
-        """ wraps dnppy.landsat.surface_reflecance functions and applies them to this scene"""
+            classes, cloud_flags = _acca_457(read, windows, (rows, cols), **kwargs)
+            mask = ((classes & cloud_flags) == 0).astype("uint8")
 
-        pass
+        self.cache[key] = mask
+        return self.cache[key]
 
 
-    def get_toa_reflectance(self):
-        """ wraps dnppy.landsat.toa_reflectance functions and applies them to this scene"""
+    def get_surface_reflectance(self, band, dem_path, dew_point, kt = 1.0, dem_cache_dir = None):
+        """
+        returns the surface reflectance of a band, see landsat.surface_reflectance.
+        The DEM is resampled to the scene grid as a cached DEM tile if needed, and all
+        six corrected bands are computed together and cached, so the pressure and water
+        terms of the DEM are only computed once per scene and set of parameters.
+        """
+
+        band   = str(band)
+        sensor = self._get_coefs()["sensor"]
+        bands  = SR_BANDS[sensor]
+
+        if band not in bands:
+            raise Exception("Cannot make surface reflectance for band {0} of this scene".format(band))
+
+        dem_path = os.path.abspath(dem_path)
+        params   = _params_id({"dem": dem_path, "dew_point": dew_point, "kt": kt})
+
+        key = ("Surf", band, params)
+        if key in self.cache:
+            return self.cache[key]
+
+        toa = numpy.array([self.get_toa_reflectance(b) for b in bands])
+        rows, cols = toa.shape[1:]
+
+        tile_path, xoff, yoff = _dem_tile(dem_path, self.in_paths["B{0}".format(bands[0])],
+                                          self.meta, dem_cache_dir)
+        dem = _read_window(gdal.Open(tile_path).GetRasterBand(1), xoff, yoff, cols, rows)
+
+        svp, cth = _atmosphere_constants(self.meta, dew_point)
+        for b, values in zip(bands, _surface_reflectance(toa, dem, svp, cth, kt)):
+            self.cache[("Surf", b, params)] = values
+            if b == band:
+                result = values
+
+        # the cache may not hold all six bands, so the requested one is not read back from it
+        return result
+
 
-        pass
+    def get_toa_radiance(self, band):
+        """ returns the top-of-atmosphere radiance of a band, see landsat.toa_radiance """
+
+        return self._get_product("TOA_Rad", band)
+
+
+    def get_toa_reflectance(self, band):
+        """ returns the top-of-atmosphere reflectance of a band, see landsat.toa_reflectance """
+
+        return self._get_product("TOA_Ref", band)
 
 
     def get_ndvi(self):
-        """ wraps dnppy.landsat.ndvi functions and applies them to this scene"""
+        """ returns the NDVI of the scene, computed from TOA reflectance """
+
+        nir, red = NDVI_BANDS[self._get_coefs()["sensor"]]
+        return self._get_product("NDVI", nir)
+
+
+    def get_atsat_bright_temp(self, band = None):
+        """
+        returns the at-satellite brightness temperature of a thermal band in Kelvin,
+        see landsat.atsat_bright_temp. Defaults to band 10, 6_VCID_1 or 6.
+        """
+
+        if band is None:
+            band = THERMAL_BANDS[self._get_coefs()["sensor"]][0]
+        return self._get_product("ASBTemp", band)
+
+
+    def _get_coefs(self):
+        """ reads the conversion coefficients of the scene the first time they are needed """
+
+        if self.coefs is None:
+            self.coefs = _scene_coefficients(self.meta)
+        return self.coefs
+
+
+    def _get_product(self, product, band):
+        """ returns a product of a band, computing it and any products it needs only once """
+
+        band  = str(band)
+        coefs = self._get_coefs()
+
+        if product != "NDVI" and band not in coefs[product]:
+            raise Exception("Cannot make {0} for band {1} of this scene".format(product, band))
+
+        # the scene itself maps band numbers to raw arrays for _product
+        return _product(product, band, self, coefs, self.cache)
+
+
+
+class _array_cache():
+    """
+    least recently used cache of numpy arrays, holding at most max_mb of arrays in
+    memory. If cache_dir is given, every array except raw bands (keys starting with
+    "DN") is also saved in it as a ".npy" file, and loaded as a memory map when it
+    is not in memory.
+    """
+
+    def __init__(self, max_mb, cache_dir = None, prefix = ""):
+
+        self.max_bytes = max_mb * 2 ** 20
+        self.cache_dir = cache_dir
+        self.prefix    = prefix
+        self.arrays    = OrderedDict()
+        self.nbytes    = 0
+
+        if cache_dir is not None and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        return
+
+
+    def __contains__(self, key):
+
+        if key in self.arrays:
+            return True
+
+        path = self._path(key)
+        return path is not None and os.path.isfile(path)
+
+
+    def __getitem__(self, key):
+
+        if key in self.arrays:
+            value = self.arrays.pop(key)
+            self.arrays[key] = value
+            return value
+
+        path = self._path(key)
+        if path is None or not os.path.isfile(path):
+            raise KeyError(key)
+
+        value = numpy.load(path, mmap_mode = "r")
+        self._store(key, value)
+        return value
+
+
+    def __setitem__(self, key, value):
+
+        path = self._path(key)
+        if path is not None:
+            part = path + ".part"
+            with open(part, "wb") as f:
+                numpy.save(f, value)
+
+            # windows will not rename over an existing file
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(part, path)
+
+        self._store(key, value)
+        return
+
+
+    def _store(self, key, value):
+        """ keeps an array in memory, dropping the least recently used arrays if full """
+
+        if isinstance(value, numpy.ndarray):
+            value.flags.writeable = False
+
+        if key in self.arrays:
+            self.nbytes -= _nbytes(self.arrays.pop(key))
+
+        self.arrays[key] = value
+        self.nbytes += _nbytes(value)
+
+        while self.nbytes > self.max_bytes and len(self.arrays) > 1:
+            oldest, dropped = self.arrays.popitem(last = False)
+            self.nbytes -= _nbytes(dropped)
+        return
+
+
+    def _path(self, key):
+        """ returns the filepath of the saved copy of an array, or None """
+
+        if self.cache_dir is None or key[0] == "DN":
+            return None
+
+        name = "_".join([self.prefix] + [str(part) for part in key if part is not None])
+        return os.path.join(self.cache_dir, name + ".npy")
+
+
+def _nbytes(value):
+    """ memory used by an array in the cache, memory maps are read from disk as needed """
 
-        pass
+    if isinstance(value, numpy.memmap):
+        return 0
+    return value.nbytes
 
 
-    def get_atsat_bright_temp(self):
-        """ wraps dnppy.atsat_bright_temp functions and applies them to this scene"""
+def _params_id(params):
+    """ returns a short id of a dict of parameters, for use in cache keys """
 
-        pass
+    if not params:
+        return None
+    return hashlib.md5(repr(sorted(params.items()))).hexdigest()[:8]
 
 
 
@@ -1,17 +1,49 @@
-
 # standard imports
 from landsat_metadata import landsat_metadata
+from toa_products import NODATA
+from cloud_mask import _read_window
 from dnppy import solar
-import arcpy
+from dnppy import raster
+from dnppy.raster.to_numpy_blocks import _block_windows, WINDOW_PIXELS
+from dnppy.raster._gdal_io import GTIFF_OPTIONS
 import datetime
+import hashlib
 import numpy as np
 import math
+import gdal
 import os
 
 __all__ = ['surface_reflectance']
 
 
-def surface_reflectance(meta_path, toa_folder, dem_path, dew_point, outdir = False, kt = 1.0):
+# default folder of DEM tiles resampled to the grids of landsat scenes
+DEM_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".dnppy", "dem_tiles")
+
+# distance in meters by which a DEM tile extends past the scene it is made for, so that
+# other scenes of the same path/row, which are never perfectly aligned, can reuse it
+DEM_TILE_MARGIN = 15000
+
+# bands of each sensor that are corrected, in the order of the constants below
+SR_BANDS = {"8": ['2', '3', '4', '5', '6', '7'],
+            "7": ['1', '2', '3', '4', '5', '7'],
+            "5": ['1', '2', '3', '4', '5', '7'],
+            "4": ['1', '2', '3', '4', '5', '7']}
+
+# constants c1 to c5 of each band for effective narrowband transmissivity. The same constants
+# are used for incoming solar radiation and for shortwave radiation reflected from the surface
+ENBT_CONSTANTS = np.array([[0.987, -0.00071, 0.000036, 0.0880, 0.0789],
+                           [2.319, -0.00016, 0.000105, 0.0437, -1.2697],
+                           [0.951, -0.00033, 0.000280, 0.0875, 0.1014],
+                           [0.375, -0.00048, 0.005018, 0.1355, 0.6621],
+                           [0.234, -0.00101, 0.004336, 0.0560, 0.7757],
+                           [0.365, -0.00097, 0.004296, 0.0155, 0.6390]], dtype = "float32")
+
+# path reflectance constants of each band
+PR_CONSTANTS = np.array([0.254, 0.149, 0.147, 0.311, 0.103, 0.036], dtype = "float32")
+
+
+def surface_reflectance(meta_path, toa_folder, dem_path, dew_point, outdir = False, kt = 1.0,
+                        dem_cache_dir = None, window_pixels = WINDOW_PIXELS):
     """
     This function will estimate surface reflectance for Landsat 4 TM, 5 TM, 7 ETM+, or 8 OLI data.
 
@@ -21,7 +53,19 @@ def surface_reflectance(meta_path, toa_folder, dem_path, dew_point, outdir = Fal
 
     The Landsat 8 Coastal Aerosol band (1) and Cirrus band (9) will not be calculated as they do not
     have a corresponding band in TM or ETM+. To be performed on Top-of-Atmosphere Reflectance data
-    processed with the landsat.toa_reflectance_457 or the landsat.toa_reflectance_8 function.
+    processed with the landsat.toa_reflectance_457, landsat.toa_reflectance_8 or
+    landsat.toa_products functions.
+
+    The correction is computed with numpy and gdal, one window at a time. The atmospheric
+    pressure and precipitable water fields are computed from each window of the DEM once,
+    then used for all six bands at once, and every output is written in the same pass.
+
+    The DEM does not need to match the landsat grid. Unless it already has the same size and
+    geotransform as the TOA_Ref tiffs, it is resampled (bilinear) once into a DEM tile that is
+    aligned with the scene grid and extends ``DEM_TILE_MARGIN`` meters past the scene. Tiles
+    are kept in dem_cache_dir, named by the DEM, the WRS path/row and the grid, so other scenes
+    of the same path/row, such as a time stack, read windows of the same tile instead of
+    resampling the DEM again. Delete the tiles to force them to be made again.
 
     Resources
         - DEM
@@ -42,172 +86,261 @@ def surface_reflectance(meta_path, toa_folder, dem_path, dew_point, outdir = Fal
 
     :param meta_path:       The full filepath to the metadata file (ending in MTL.txt) for the dataset
     :param toa_folder:      The filepath to the folder containing the TOA_Ref tiffs to be processed
-    :param dem_path:        The full filepath to a DEM tif that covers the desired Landsat scene
-                            Note that the DEM should be resampled to the Landsat bands' resolution (30m)
-                            and pixel alignment. Also ensure there are no gaps in the dataset.
+    :param dem_path:        The full filepath to a DEM tif that covers the desired Landsat scene,
+                            in meters. Pixels with no elevation are NoData in every output.
     :param dew_point:       The number (e.g. 57.7) for the dew point at the time and place of scene acquisition
     :param outdir:          Output directory to save converted files. If left False it will save
                             output files in the toa_folder directory.
     :param kt:              Unitless turbidity coefficient. Default set at 1.0 for clean air.
                             Set at 0.5 for extremely turbid, dusty, or polluted air.
-                            
-    :return output_filelist:  A list of all files created by this function                        
+    :param dem_cache_dir:   folder in which to keep resampled DEM tiles. defaults to a
+                            "dem_tiles" folder in a ".dnppy" folder in the users home directory.
+    :param window_pixels:   approximate number of pixels to process at a time
+
+    :return output_filelist:  A list of all files created by this function
     """
 
-    meta_path = os.path.abspath(meta_path)
+    meta_path  = os.path.abspath(meta_path)
     toa_folder = os.path.abspath(toa_folder)
-    dem_path = os.path.abspath(dem_path)
-    output_filelist = []
-
-    #define the list of constants for effective narrowband transmissivity for incoming solar radiation
-    constants_enbt1 = [[0.987, -0.00071, 0.000036, 0.0880, 0.0789],
-                         [2.319, -0.00016, 0.000105, 0.0437, -1.2697],
-                         [0.951, -0.00033, 0.000280, 0.0875, 0.1014],
-                         [0.375, -0.00048, 0.005018, 0.1355, 0.6621],
-                         [0.234, -0.00101, 0.004336, 0.0560, 0.7757],
-                         [0.365, -0.00097, 0.004296, 0.0155, 0.6390]]
-
-    #define the list of constants for effective narrowband transmissivity for shortwave radiation
-    #reflected from the surface
-    constants_enbt2 = [[0.987, -0.00071, 0.000036, 0.0880, 0.0789],
-                         [2.319, -0.00016, 0.000105, 0.0437, -1.2697],
-                         [0.951, -0.00033, 0.000280, 0.0875, 0.1014],
-                         [0.375, -0.00048, 0.005018, 0.1355, 0.6621],
-                         [0.234, -0.00101, 0.004336, 0.0560, 0.7757],
-                         [0.365, -0.00097, 0.004296, 0.0155, 0.6390]]
-
-    #enforce the list of band numbers, grab metadata from the MTL file, and define the band numbers needed from each sensor
+    dem_path   = os.path.abspath(dem_path)
+
+    if outdir:
+        outdir = os.path.abspath(outdir)
+    else:
+        outdir = toa_folder
+
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+
     meta = landsat_metadata(meta_path)
-    OLI_bands = ['2','3','4','5','6','7']
-    TM_ETM_bands = ['1','2','3','4','5','7']
+    toa_list = _find_toa_bands(meta, meta_path, toa_folder)
+    out_list = [os.path.join(outdir, os.path.basename(path).replace("TOA", "Surf")) for path in toa_list]
 
-    #define the tile name for the landsat scene based on the metadata file's name
+    svp, cth = _atmosphere_constants(meta, dew_point)
+    dem_tile, dem_xoff, dem_yoff = _dem_tile(dem_path, toa_list[0], meta, dem_cache_dir)
 
-    #Open the metadata text file and read to set the scene's tilename
-    f = open(meta_path)
-    MText = f.read()
+    datasets = [gdal.Open(path) for path in toa_list + [dem_tile]]
+    for path, dataset in zip(toa_list + [dem_tile], datasets):
+        if dataset is None:
+            raise Exception("Could not open {0}".format(path))
 
-    if "PRODUCT_CREATION_TIME" in MText:
-            tilename = getattr(meta, "BAND1_FILE_NAME")
-    else:
-            tilename = getattr(meta, "LANDSAT_SCENE_ID")
+    toa_bands = [dataset.GetRasterBand(1) for dataset in datasets[:-1]]
+    dem_band  = datasets[-1].GetRasterBand(1)
 
-    #construct the list of TOA reflectance band tiffs and populate it based on the above definitions
-    toa_list = []
-    out_list = []
-    n = 0
-    for file in os.listdir(toa_folder):
-            if ("TOA_Ref" in file) and (file[-4:] == ".tif" or file[-4:] == ".TIF"):
-                    if "LC8" in meta_path:
-                            tile = "{0}_B{1}".format(tilename, OLI_bands[n])
-                            if tile in file:
-                                    path = "{0}\\{1}".format(toa_folder, file)
-                                    out_file = file.replace("TOA", "Surf")
-                                    toa_list.append(path)
-                                    out_list.append(out_file)
-                                    n = n + 1
-                                    if n > 5:
-                                            break
-                    elif ("LE7" in file) or ("LT5" in file) or ("LT4" in file):
-                            tile = "{0}_B{1}".format(tilename, TM_ETM_bands[n])
-                            if tile in file:
-                                    path = "{0}\\{1}".format(toa_folder, file)
-                                    out_file = file.replace("TOA", "Surf")
-                                    toa_list.append(path)
-                                    out_list.append(out_file)
-                                    n = n + 1
-                                    if n > 5:
-                                            break
+    sizes = set((band.XSize, band.YSize) for band in toa_bands)
+    if len(sizes) > 1:
+        raise Exception("The TOA_Ref tiffs in {0} are not the same size".format(toa_folder))
+
+    raster_meta = raster.metadata(toa_list[0], backend = "gdal")
+    nodata  = NODATA["float32"]
+    writers = [raster.block_writer(outpath, raster_meta, "float32", nodata) for outpath in out_list]
+
+    try:
+        for xoff, yoff, wx, wy in _block_windows(toa_bands[0], window_pixels):
+            wmeta = raster_meta.window(xoff, yoff, wx, wy)
+            toa   = np.array([_read_window(band, xoff, yoff, wx, wy) for band in toa_bands])
+            dem   = _read_window(dem_band, dem_xoff + xoff, dem_yoff + yoff, wx, wy)
+
+            surf = _surface_reflectance(toa, dem, svp, cth, kt)
+            for values, writer in zip(surf, writers):
+                writer.write(np.where(np.isnan(values), nodata, values).astype("float32"), wmeta)
+
+    finally:
+        for writer in writers:
+            writer.close()
+
+    return out_list
+
+
+def _surface_reflectance(toa, dem, svp, cth, kt = 1.0, rows = None):
+    """
+    Computes surface reflectance from a stack of TOA reflectance arrays of shape
+    (bands, rows, cols) and a DEM array of shape (rows, cols). The pressure and water
+    fields are computed from the DEM once and broadcast across every band. rows are the
+    indices of the bands in ``SR_BANDS`` and default to all six bands, in order.
+    Returns a float32 stack with NaN wherever the TOA or DEM values are NaN.
+    """
+
+    if rows is None:
+        rows = range(len(PR_CONSTANTS))
+
+    # constants with shape (bands, 1, 1), to broadcast over the pixels of each band
+    c1, c2, c3, c4, c5 = [ENBT_CONSTANTS[rows, i][:, None, None] for i in range(5)]
+    prc = PR_CONSTANTS[rows][:, None, None]
+
+    # cos_n always 1 for sensor pointing straight nadir
+    cos_n = 1.0
+
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+
+        #Atmospheric Pressure and Water in Atmosphere, once for all bands
+        ap  = (101.3 * ((293 - 0.0065 * dem) / 293) ** 5.26).astype("float32")
+        wia = 0.14 * svp * ap + 2.1
+
+        #Effective Narrowband Transmittance for incoming solar radiation
+        enbt1 = c1 * (np.exp((c2 * ap) / (kt * cth)) - ((c3 * wia) + c4) / cth) + c5
+
+        #Effective Narrowband Transmittance for shortwave radiation reflected from surface
+        enbt2 = c1 * (np.exp((c2 * ap) / (kt * cos_n)) - ((c3 * wia) + c4)) + c5
+
+        #Per Band Path Reflectance
+        pr = prc * (1 - enbt1)
+
+        surf = (toa - pr) / (enbt1 * enbt2)
+
+    return surf.astype("float32")
+
+
+def _atmosphere_constants(meta, dew_point):
+    """
+    returns the saturation vapor pressure at the dew point, and the cosine of the
+    solar zenith angle at the scene center at the time of acquisition.
+    """
 
     #grab the corner lat/lon coordinates to calculate the approximate scene center lat/lon
-    ul_lat = getattr(meta, "CORNER_UL_LAT_PRODUCT")
-    ul_lon = getattr(meta, "CORNER_UL_LON_PRODUCT")
-    ur_lat = getattr(meta, "CORNER_UR_LAT_PRODUCT")
-    ur_lon = getattr(meta, "CORNER_UR_LON_PRODUCT")
-    ll_lat = getattr(meta, "CORNER_LL_LAT_PRODUCT")
-    ll_lon = getattr(meta, "CORNER_LL_LON_PRODUCT")
-    lr_lat = getattr(meta, "CORNER_LR_LAT_PRODUCT")
-    lr_lon = getattr(meta, "CORNER_LR_LON_PRODUCT")
-
-    u_lon_avg = np.mean([ul_lon, ur_lon])
-    l_lon_avg = np.mean([ll_lon, lr_lon])
-    l_lat_avg = np.mean([ul_lat, ll_lat])
-    r_lat_avg = np.mean([ur_lat, lr_lat])
-
-    center_lat = np.mean([l_lat_avg, r_lat_avg])
-    center_lon = np.mean([u_lon_avg, l_lon_avg])
+    center_lat = np.mean([getattr(meta, "CORNER_{0}_LAT_PRODUCT".format(c)) for c in ["UL", "UR", "LL", "LR"]])
+    center_lon = np.mean([getattr(meta, "CORNER_{0}_LON_PRODUCT".format(c)) for c in ["UL", "UR", "LL", "LR"]])
 
     #construct the datetime object from the date acquired and scene center time attributes
-    date = getattr(meta, "DATE_ACQUIRED")
-    dl = date.split("-")
-    time = getattr(meta, "SCENE_CENTER_TIME")
-    tl = time.split(":")
+    dl = getattr(meta, "DATE_ACQUIRED").split("-")
+    tl = getattr(meta, "SCENE_CENTER_TIME").split(":")
 
     dt = datetime.datetime(int(dl[0]), int(dl[1]), int(dl[2]), int(tl[0]), int(tl[1]), int(tl[2][0:2]))
 
-    #use the dnppy.solar module to calculate the solar characteristics at the scene center at the time of acquisition
+    #Cosine of Solar Zenith over horizontal surface, from the dnppy.solar module
     sc = solar.solar(center_lat, center_lon, dt, 0)
-    sc.compute_all()
-
-    #Cosine of Solar Zenith over horizontal surface
-    declination = math.degrees(sc.get_declination())
-    hour_angle = math.degrees(sc.get_hour_angle())
-    lat = math.degrees(center_lat)
-
-    cth = (math.sin(declination) * math.sin(lat)) + (math.cos(declination) * math.cos(center_lat) * math.cos(hour_angle))
+    cth = math.cos(math.radians(sc.get_zenith()))
 
     #Saturation Vapor Pressure
     svp = 0.6108 * math.exp((17.27 * dew_point) / (dew_point + 237.3))
 
-    #Atmospheric Pressure
-    DEM = arcpy.sa.Raster(dem_path)
-    ap = 101.3 * ((( 293 - (0.0065 * DEM))/ 293) ** 5.26)
-
-    #Water in Atmosphere
-    wia = (0.14 * svp * ap) + 2.1
-
-    #Effective Narrowband Transmittance for incoming solar radiation
-    entisr_bands = []
-    for i in xrange(6):
-            c1 = constants_enbt1[i][0]
-            c2 = constants_enbt1[i][1]
-            c3 = constants_enbt1[i][2]
-            c4 = constants_enbt1[i][3]
-            c5 = constants_enbt1[i][4]
-            enbt1 = c1 * ((arcpy.sa.Exp((c2 * ap)/(kt * cth))) - (((c3 * wia) + c4)/cth)) + c5
-            entisr_bands.append(enbt1)
-
-    #Effective Narrowband Transmittance for shortwave radiation reflected from surface
-    entsrrs_bands = []
-
-    #cos_n always 1 for sensor pointing straight nadir
-    cos_n = 1
-
-    for i in xrange(6):
-            c1 = constants_enbt2[i][0]
-            c2 = constants_enbt2[i][1]
-            c3 = constants_enbt2[i][2]
-            c4 = constants_enbt2[i][3]
-            c5 = constants_enbt2[i][4]
-            enbt2 = c1 * ((arcpy.sa.Exp((c2 * ap)/(kt * cos_n))) - (((c3 * wia) + c4))) + c5
-            entsrrs_bands.append(enbt2)
-
-    #Per Band Path Reflectance
-    pr_bands = []
-    pr_constants = [0.254, 0.149, 0.147, 0.311, 0.103, 0.036]
-    for j in xrange(6):
-            pr = pr_constants[j] * (1 - entisr_bands[j])
-            pr_bands.append(pr)
-
-    #Calculate and save At-Surface Reflectance band tiffs
-    for k in xrange(6):
-            if outdir:
-                    outdir = os.path.abspath(outdir)
-                    asr_path = "{0}\\{1}".format(outdir, out_list[k])
-            else:
-                    asr_path = "{0}\\{1}".format(toa_folder, out_list[k])
-            refl_surf = (toa_list[k] - pr_bands[k])/(entisr_bands[k] * entsrrs_bands[k])
-            refl_surf.save(asr_path)
-            output_filelist.append(asr_path)
-
-    return output_filelist
\ No newline at end of file
+    return svp, cth
+
+
+def _find_toa_bands(meta, meta_path, toa_folder):
+    """
+    returns the filepaths of the six TOA_Ref tiffs of a scene, in the order of SR_BANDS.
+    TOA_Ref tiffs are named after the raw bands, which share their names with the MTL file.
+    """
+
+    #metadata format was changed August 29, 2012, old metadata has a PRODUCT_CREATION_TIME
+    if hasattr(meta, "PRODUCT_CREATION_TIME"):
+        tilename = getattr(meta, "BAND1_FILE_NAME").split("_B")[0]
+    else:
+        tilename = getattr(meta, "LANDSAT_SCENE_ID")
+
+    sensor = None
+    for number in ["8", "7", "5", "4"]:
+        if number in getattr(meta, "SPACECRAFT_ID"):
+            sensor = number
+            break
+    if sensor is None:
+        raise Exception("This tool only works for Landsat 4, 5, 7 or 8")
+
+    mtl_prefix = os.path.basename(meta_path).replace("MTL.txt", "")
+    files = sorted(os.listdir(toa_folder))
+
+    toa_list = []
+    for band in SR_BANDS[sensor]:
+        tiles = ("{0}B{1}_".format(mtl_prefix, band), "{0}_B{1}_".format(tilename, band))
+        matches = [name for name in files if name.startswith(tiles) and "TOA_Ref" in name
+                   and name[-4:] in (".tif", ".TIF")]
+
+        if not matches:
+            raise Exception("Could not find the TOA_Ref tiff of band {0} in {1}".format(band, toa_folder))
+        toa_list.append(os.path.join(toa_folder, matches[0]))
+
+    return toa_list
+
+
+def _dem_tile(dem_path, ref_path, meta, cache_dir = None):
+    """
+    returns (tile_path, xoff, yoff) for a DEM aligned with the grid of the raster at ref_path,
+    where xoff and yoff are the pixel offsets of the reference raster within the tile. The DEM
+    is used as it is if it already matches the reference grid, otherwise a cached tile that
+    covers the reference raster is used, or one is made by resampling the DEM.
+    """
+
+    ref = gdal.Open(ref_path)
+    dem = gdal.Open(dem_path)
+    if dem is None:
+        raise Exception("Could not open the DEM {0}".format(dem_path))
+
+    gt = ref.GetGeoTransform()
+    xs, ys = ref.RasterXSize, ref.RasterYSize
+
+    offsets = _grid_offsets(dem, gt, xs, ys)
+    if offsets == (0, 0) and (dem.RasterXSize, dem.RasterYSize) == (xs, ys):
+        return dem_path, 0, 0
+
+    if cache_dir is None:
+        cache_dir = DEM_CACHE_DIR
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    # tiles are reused by any scene with the same projection, cell size and pixel alignment
+    projection = ref.GetProjection()
+    grid = [dem_path, os.path.getmtime(dem_path), projection, gt[1], gt[5],
+            round(gt[0] % gt[1], 3), round(gt[3] % gt[5], 3)]
+    grid_id = hashlib.md5(repr(grid)).hexdigest()[:8]
+
+    dem_name  = os.path.splitext(os.path.basename(dem_path))[0]
+    tile_path = os.path.join(cache_dir, "{0}_p{1:03d}r{2:03d}_{3}.tif".format(
+        dem_name, int(getattr(meta, "WRS_PATH")), int(getattr(meta, "WRS_ROW")), grid_id))
+
+    if os.path.isfile(tile_path):
+        tile = gdal.Open(tile_path)
+        if tile is not None:
+            offsets = _grid_offsets(tile, gt, xs, ys)
+            if offsets is not None:
+                return tile_path, offsets[0], offsets[1]
+
+    print("Resampling {0} to the scene grid in {1}".format(dem_path, tile_path))
+    margin = int(DEM_TILE_MARGIN / abs(gt[1]))
+    tile_gt = (gt[0] - margin * gt[1], gt[1], 0.0, gt[3] - margin * gt[5], 0.0, gt[5])
+
+    part = tile_path + ".part"
+    tile = gdal.GetDriverByName("GTiff").Create(part, xs + 2 * margin, ys + 2 * margin, 1,
+                                                gdal.GDT_Float32, GTIFF_OPTIONS)
+    tile.SetGeoTransform(tile_gt)
+    tile.SetProjection(projection)
+
+    tile_band = tile.GetRasterBand(1)
+    tile_band.SetNoDataValue(NODATA["float32"])
+    tile_band.Fill(NODATA["float32"])
+
+    gdal.ReprojectImage(dem, tile, dem.GetProjection(), projection, gdal.GRA_Bilinear)
+    tile_band.FlushCache()
+    tile = None
+
+    # windows will not rename over an existing file
+    if os.path.exists(tile_path):
+        os.remove(tile_path)
+    os.rename(part, tile_path)
+
+    return tile_path, margin, margin
+
+
+def _grid_offsets(dataset, gt, xs, ys):
+    """
+    returns the (xoff, yoff) pixel offsets of a grid with geotransform gt and size xs, ys
+    within a gdal dataset, or None if the dataset does not share its cells or cover it.
+    """
+
+    dgt = dataset.GetGeoTransform()
+    if dgt[2] or dgt[4] or gt[2] or gt[4]:
+        return None
+
+    if abs(dgt[1] - gt[1]) > 1e-6 * abs(gt[1]) or abs(dgt[5] - gt[5]) > 1e-6 * abs(gt[5]):
+        return None
+
+    xoff = (gt[0] - dgt[0]) / gt[1]
+    yoff = (gt[3] - dgt[3]) / gt[5]
+    if abs(xoff - round(xoff)) > 1e-3 or abs(yoff - round(yoff)) > 1e-3:
+        return None
+
+    xoff, yoff = int(round(xoff)), int(round(yoff))
+    if xoff < 0 or yoff < 0 or xoff + xs > dataset.RasterXSize or yoff + ys > dataset.RasterYSize:
+        return None
+
+    return xoff, yoff
@@ -0,0 +1,335 @@
+__author__ = 'jwely'
+__all__ = ["toa_products"]
+
+from landsat_metadata import landsat_metadata
+from dnppy import core
+from dnppy.raster import metadata, block_writer
+from dnppy.raster.to_numpy_blocks import _block_windows, WINDOW_PIXELS
+
+import numpy
+import math
+import gdal
+import os
+
+
+PRODUCTS = ["TOA_Rad", "TOA_Ref", "ASBTemp", "NDVI"]
+
+# multipliers used to store each product as int16, chosen to fit the range of each product
+INT16_SCALES = {"TOA_Rad": 10.0,        # 0.1 W/(m^2 sr um)
+                "TOA_Ref": 10000.0,     # 0.0001 reflectance
+                "ASBTemp": 10.0,        # 0.1 Kelvin
+                "NDVI":    10000.0}     # 0.0001 NDVI
+
+NODATA = {"float32": -9999.0,
+          "int16":   -32768}
+
+# bands of each sensor, and the (nir, red) bands used for NDVI
+REFLECTIVE_BANDS = {"8": ["1", "2", "3", "4", "5", "6", "7", "8", "9"],
+                    "7": ["1", "2", "3", "4", "5", "7", "8"],
+                    "5": ["1", "2", "3", "4", "5", "7"],
+                    "4": ["1", "2", "3", "4", "5", "7"]}
+
+THERMAL_BANDS    = {"8": ["10", "11"],
+                    "7": ["6_VCID_1", "6_VCID_2"],
+                    "5": ["6"],
+                    "4": ["6"]}
+
+NDVI_BANDS       = {"8": ("5", "4"),
+                    "7": ("4", "3"),
+                    "5": ("4", "3"),
+                    "4": ("4", "3")}
+
+# solar exoatmospheric irradiance of landsat 4, 5 and 7 bands
+ESUN = {"7": (1969.0, 1840.0, 1551.0, 1044.0, 255.700, 0., 82.07, 1368.00),
+        "5": (1957.0, 1826.0, 1554.0, 1036.0, 215.0, 0., 80.67),
+        "4": (1957.0, 1825.0, 1557.0, 1033.0, 214.9, 0., 80.72)}
+
+# thermal conversion constants (K1, K2) of landsat 4, 5 and 7 band 6
+THERMAL_K = {"7": (666.09, 1282.71),
+             "5": (607.76, 1260.56),
+             "4": (607.76, 1260.56)}
+
+
+def toa_products(meta_path, products = None, band_nums = None, outdir = None,
+                 int16 = False, window_pixels = WINDOW_PIXELS):
+    """
+    Computes top-of-atmosphere radiance, reflectance, at-satellite brightness temperature
+    and NDVI for a Landsat 4, 5, 7 or 8 scene in a single pass, without arcpy.
+
+    The functions ``toa_radiance``, ``toa_reflectance``, ``atsat_bright_temp`` and ``ndvi``
+    each read their input bands and save intermediate rasters separately. This function
+    instead reads each raw band of the scene once, one window at a time, and computes every
+    requested product from that window before moving on, so brightness temperature never
+    re-reads a band for its radiance, and NDVI is built from the same reflectance values
+    that are saved as TOA_Ref. Coefficients are read from the MTL file with
+    ``landsat_metadata``, with the same formulas and the same output names as the
+    individual functions. Pixels with a raw value of 0 are NoData in every output.
+
+    Note that NDVI here is computed from TOA reflectance, while ``ndvi_8`` and ``ndvi_457``
+    use whichever rasters they are given, which are usually the raw bands.
+
+    :param meta_path:       The full filepath to the MTL file of the scene, which must be
+                            in the same folder as the bands.
+    :param products:        list of products to make, any of "TOA_Rad", "TOA_Ref",
+                            "ASBTemp" and "NDVI". defaults to ["TOA_Ref", "ASBTemp", "NDVI"]
+    :param band_nums:       list of bands for which to make TOA_Rad and TOA_Ref, such as
+                            [1,2,3,4,5,7]. Defaults to all reflective bands of the sensor.
+                            Thermal bands may be included for TOA_Rad. ASBTemp is always
+                            made for every thermal band.
+    :param outdir:          Output directory to save converted files. If left None it will
+                            save output files in the same directory as input files.
+    :param int16:           set True to save outputs as int16 rather than float32. Values
+                            are multiplied by the scale factors in ``INT16_SCALES``, and the
+                            inverse factor is stored as the gdal scale of each output.
+    :param window_pixels:   approximate number of pixels to process at a time
+
+    :return output_filelist:    List of files created by this function
+    """
+
+    if products is None:
+        products = ["TOA_Ref", "ASBTemp", "NDVI"]
+    products = core.enf_list(products)
+
+    for product in products:
+        if product not in PRODUCTS:
+            raise Exception("Unknown product '{0}', use any of {1}".format(product, PRODUCTS))
+
+    meta_path = os.path.abspath(meta_path)
+    coefs     = _scene_coefficients(landsat_metadata(meta_path))
+    sensor    = coefs["sensor"]
+
+    if outdir is None:
+        outdir = os.path.dirname(meta_path)
+    outdir = os.path.abspath(outdir)
+
+    if band_nums is None:
+        band_nums = REFLECTIVE_BANDS[sensor]
+    band_nums = map(str, core.enf_list(band_nums))
+
+    # list every output as (product, band, outpath), along with the raw bands it needs
+    outputs = []
+    for product in products:
+        if product == "NDVI":
+            nir, red = NDVI_BANDS[sensor]
+            nir_path = _band_path(meta_path, nir)
+            tail     = os.path.basename(nir_path).replace("_B{0}".format(nir), "_NDVI")
+            outputs.append((product, nir, os.path.join(outdir, tail), [nir, red]))
+
+        elif product == "ASBTemp":
+            for band in THERMAL_BANDS[sensor]:
+                outpath = core.create_outname(outdir, _band_path(meta_path, band), product, "tif")
+                outputs.append((product, band, outpath, [band]))
+
+        else:
+            valid = REFLECTIVE_BANDS[sensor]
+            if product == "TOA_Rad":
+                valid = valid + THERMAL_BANDS[sensor]
+
+            for band in band_nums:
+                if band not in valid:
+                    print("Cannot make {0} for band {1} of Landsat {2}, skipping it".format(
+                        product, band, sensor))
+                    continue
+
+                outpath = core.create_outname(outdir, _band_path(meta_path, band), product, "tif")
+                outputs.append((product, band, outpath, [band]))
+
+    # bands of different resolutions (such as panchromatic band 8) are processed separately
+    datasets = {}
+    groups   = {}
+    for product, band, outpath, needs in outputs:
+        for need in needs:
+            if need not in datasets:
+                datasets[need] = gdal.Open(_band_path(meta_path, need))
+                if datasets[need] is None:
+                    raise Exception("Could not open band {0} of the scene".format(need))
+
+        sizes = set((datasets[need].RasterXSize, datasets[need].RasterYSize) for need in needs)
+        if len(sizes) > 1:
+            raise Exception("Bands {0} of the scene are not the same size".format(needs))
+
+        groups.setdefault(sizes.pop(), []).append((product, band, outpath, needs))
+
+    if int16:
+        numpy_datatype = "int16"
+    else:
+        numpy_datatype = "float32"
+
+    for group in groups.values():
+        _process_group(meta_path, coefs, group, datasets, numpy_datatype, window_pixels)
+
+    output_filelist = [outpath for product, band, outpath, needs in outputs]
+    return output_filelist
+
+
+def _process_group(meta_path, coefs, group, datasets, numpy_datatype, window_pixels):
+    """
+    computes one group of outputs that share the same raster grid, reading each
+    window of each raw band once and writing each window of each output once.
+    """
+
+    first_band = group[0][3][0]
+    meta    = metadata(_band_path(meta_path, first_band), backend = "gdal")
+    nodata  = NODATA[numpy_datatype]
+    bands   = {}
+    writers = []
+
+    for product, band, outpath, needs in group:
+        for need in needs:
+            bands[need] = datasets[need].GetRasterBand(1)
+
+        writer = block_writer(outpath, meta, numpy_datatype, nodata)
+        if numpy_datatype == "int16":
+            writer.band.SetScale(1.0 / INT16_SCALES[product])
+        writers.append(writer)
+
+    try:
+        for xoff, yoff, wx, wy in _block_windows(bands[first_band], window_pixels):
+            wmeta = meta.window(xoff, yoff, wx, wy)
+            raw   = dict((band, bands[band].ReadAsArray(xoff, yoff, wx, wy)) for band in bands)
+            cache = {}
+
+            for (product, band, outpath, needs), writer in zip(group, writers):
+                values = _product(product, band, raw, coefs, cache)
+                writer.write(_to_output(values, product, numpy_datatype, nodata), wmeta)
+
+    finally:
+        for writer in writers:
+            writer.close()
+    return
+
+
+def _product(product, band, raw, coefs, cache):
+    """
+    returns a float32 array of one product for one window, with NaN at NoData pixels.
+    intermediate products are kept in the cache, so radiance and reflectance are only
+    computed once per band and window no matter how many outputs use them.
+    """
+
+    key = (product, band)
+    if key in cache:
+        return cache[key]
+
+    with numpy.errstate(divide = "ignore", invalid = "ignore"):
+        if product in ("TOA_Rad", "TOA_Ref"):
+            gain, bias = coefs[product][band]
+            dn     = raw[band]
+            values = dn.astype("float32")
+            values *= gain
+            values += bias
+            values[dn == 0] = numpy.nan
+
+        elif product == "ASBTemp":
+            k1, k2 = coefs["ASBTemp"][band]
+            values = k2 / numpy.log(k1 / _product("TOA_Rad", band, raw, coefs, cache) + 1)
+
+        elif product == "NDVI":
+            nir, red = NDVI_BANDS[coefs["sensor"]]
+            nir = _product("TOA_Ref", nir, raw, coefs, cache)
+            red = _product("TOA_Ref", red, raw, coefs, cache)
+            values = (nir - red) / (nir + red)
+            values[~numpy.isfinite(values)] = numpy.nan
+
+    cache[key] = values
+    return values
+
+
+def _to_output(values, product, numpy_datatype, nodata):
+    """ converts a float32 window with NaN at NoData pixels to the output datatype """
+
+    missing = numpy.isnan(values)
+
+    if numpy_datatype == "int16":
+        values = numpy.clip(numpy.round(values * INT16_SCALES[product]), -32767, 32767)
+
+    # values may be cached for use by other outputs, so they are not changed in place
+    return numpy.where(missing, nodata, values).astype(numpy_datatype)
+
+
+def _band_path(meta_path, band):
+    """ returns the filepath of a raw band, which shares its name with the MTL file """
+
+    return meta_path.replace("MTL.txt", "B{0}.tif".format(band))
+
+
+def _scene_coefficients(meta):
+    """
+    reads the landsat_metadata object of a scene and returns a dict with the sensor number
+    as "sensor", (gain, bias) tuples that convert raw values of each band to "TOA_Rad" and
+    "TOA_Ref", and (K1, K2) thermal constants of each thermal band as "ASBTemp".
+    """
+
+    spacecraft = getattr(meta, "SPACECRAFT_ID")
+
+    sensor = None
+    for number in ["8", "7", "5", "4"]:
+        if number in spacecraft:
+            sensor = number
+            break
+    if sensor is None:
+        raise Exception("This tool only works for Landsat 4, 5, 7 or 8, not '{0}'".format(spacecraft))
+
+    coefs = {"sensor": sensor, "TOA_Rad": {}, "TOA_Ref": {}, "ASBTemp": {}}
+
+    if sensor == "8":
+        sin_sea = math.sin(getattr(meta, "SUN_ELEVATION") * (math.pi / 180))
+
+        for band in REFLECTIVE_BANDS[sensor] + THERMAL_BANDS[sensor]:
+            coefs["TOA_Rad"][band] = (getattr(meta, "RADIANCE_MULT_BAND_{0}".format(band)),
+                                      getattr(meta, "RADIANCE_ADD_BAND_{0}".format(band)))
+
+        for band in REFLECTIVE_BANDS[sensor]:
+            coefs["TOA_Ref"][band] = (getattr(meta, "REFLECTANCE_MULT_BAND_{0}".format(band)) / sin_sea,
+                                      getattr(meta, "REFLECTANCE_ADD_BAND_{0}".format(band)) / sin_sea)
+
+        for band in THERMAL_BANDS[sensor]:
+            coefs["ASBTemp"][band] = (getattr(meta, "K1_CONSTANT_BAND_{0}".format(band)),
+                                      getattr(meta, "K2_CONSTANT_BAND_{0}".format(band)))
+        return coefs
+
+    # metadata format was changed August 29, 2012, old metadata has a PRODUCT_CREATION_TIME
+    old_meta = hasattr(meta, "PRODUCT_CREATION_TIME")
+
+    if old_meta:
+        TileName = getattr(meta, "BAND1_FILE_NAME")
+        year = TileName[13:17]
+        jday = TileName[17:20]
+    else:
+        TileName = getattr(meta, "LANDSAT_SCENE_ID")
+        year = TileName[9:13]
+        jday = TileName[13:16]
+
+    # using the date to determine the distance from the sun
+    if float(year) % 4 == 0: DIY = 366.
+    else: DIY = 365.
+
+    theta = 2 * math.pi * float(jday) / DIY
+    dSun2 = (1.00011 + 0.034221 * math.cos(theta) + 0.001280 * math.sin(theta) +
+             0.000719 * math.cos(2 * theta) + 0.000077 * math.sin(2 * theta))
+    cos_sza = math.cos((90. - float(getattr(meta, "SUN_ELEVATION"))) * (math.pi / 180))
+
+    for band in REFLECTIVE_BANDS[sensor] + THERMAL_BANDS[sensor]:
+        if old_meta:
+            old_band = band.replace("6_VCID_", "6")
+            LMax    = getattr(meta, "LMAX_BAND{0}".format(old_band))
+            LMin    = getattr(meta, "LMIN_BAND{0}".format(old_band))
+            QCalMax = getattr(meta, "QCALMAX_BAND{0}".format(old_band))
+            QCalMin = getattr(meta, "QCALMIN_BAND{0}".format(old_band))
+        else:
+            LMax    = getattr(meta, "RADIANCE_MAXIMUM_BAND_{0}".format(band))
+            LMin    = getattr(meta, "RADIANCE_MINIMUM_BAND_{0}".format(band))
+            QCalMax = getattr(meta, "QUANTIZE_CAL_MAX_BAND_{0}".format(band))
+            QCalMin = getattr(meta, "QUANTIZE_CAL_MIN_BAND_{0}".format(band))
+
+        gain = (LMax - LMin) / (QCalMax - QCalMin)
+        coefs["TOA_Rad"][band] = (gain, LMin - gain * QCalMin)
+
+    for band in REFLECTIVE_BANDS[sensor]:
+        gain, bias = coefs["TOA_Rad"][band]
+        factor = (math.pi * dSun2) / (ESUN[sensor][int(band) - 1] * cos_sza)
+        coefs["TOA_Ref"][band] = (gain * factor, bias * factor)
+
+    for band in THERMAL_BANDS[sensor]:
+        coefs["ASBTemp"][band] = THERMAL_K[sensor]
+
+    return coefs
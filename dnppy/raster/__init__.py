@@ -5,7 +5,8 @@ for use with functions in the raster module. The modules capabilities include st
 generation, subsetting, reprojecting, null data management, correction functions, and others.
 Top level functions in the raster module should all have batch processing capabilities bult in.
 
-Requires ``arcpy``
+Requires ``arcpy``. ``to_numpy`` and ``from_numpy`` (and the numpy based functions built
+upon them) may instead use ``gdal``, see ``raster.set_io_backend``.
 """
 
 __author__ = ["Jwely",
@@ -13,6 +14,7 @@ __author__ = ["Jwely",
 
 
 from apply_linear_correction import *
+from block_writer import *
 from clip_and_snap import *
 from clip_to_shape import *
 from degree_days import *
@@ -22,6 +24,7 @@ from from_numpy import *
 from gap_fill_temporal import *
 from gap_fill_interpolate import *
 from in_dir import *
+from io_backend import *
 from is_rast import *
 from many_stats import *
 from metadata import *
@@ -32,7 +35,9 @@ from project_resample import *
 from raster_fig import *
 from raster_overlap import *
 from spatially_match import *
+from stats_accumulator import *
 from to_numpy import *
+from to_numpy_blocks import *
 
 
 
@@ -0,0 +1,150 @@
+__author__ = 'jwely'
+__all__ = ["_gdal_to_numpy", "_gdal_from_numpy", "_gdal_create_gtiff"]
+
+from metadata import metadata
+
+import os
+
+try:
+    import gdal
+except ImportError:
+    gdal = None
+
+
+# translates numpy dtype strings into the names of gdal data types for output rasters
+NUMPY_TO_GDAL_TYPES = {"bool":      "GDT_Byte",
+                       "uint8":     "GDT_Byte",
+                       "int8":      "GDT_Int16",
+                       "uint16":    "GDT_UInt16",
+                       "int16":     "GDT_Int16",
+                       "uint32":    "GDT_UInt32",
+                       "int32":     "GDT_Int32",
+                       "float32":   "GDT_Float32",
+                       "float64":   "GDT_Float64"}
+
+# default creation options for all GeoTIFFs written with gdal
+GTIFF_OPTIONS = ["TILED=YES", "COMPRESS=LZW", "BIGTIFF=IF_SAFER"]
+
+
+def _gdal_to_numpy(raster, window = None):
+    """
+    Reads a raster with gdal and returns its pixel values along with
+    metadata in the same format as the arcpy based ``to_numpy`` workflow.
+    Multi band rasters are returned as a 3d array with band as the first
+    axis and a list of metadata objects, one for each band.
+
+    :param raster:          filepath to any raster readable by gdal
+    :param window:          optional (xoff, yoff, xsize, ysize) pixel window to read
+    :return numpy_rast:     numpy array of raw pixel values
+    :return meta:           a metadata object, or list of them for multiband rasters
+    """
+
+    _require_gdal()
+    dataset = gdal.Open(raster)
+    if dataset is None:
+        raise Exception("Raster '{0}' could not be opened with gdal".format(raster))
+
+    xs = dataset.RasterXSize
+    ys = dataset.RasterYSize
+    zs = dataset.RasterCount
+
+    if window is None:
+        numpy_rast = dataset.ReadAsArray()
+    else:
+        numpy_rast = dataset.ReadAsArray(*window)
+    del dataset
+
+    if zs > 1:
+        meta = [metadata(raster, xs, ys, zs, backend = "gdal", band = i + 1) for i in range(zs)]
+        if window is not None:
+            meta = [band_meta.window(*window) for band_meta in meta]
+    else:
+        meta = metadata(raster, xs, ys, backend = "gdal")
+        if window is not None:
+            meta = meta.window(*window)
+
+    return numpy_rast, meta
+
+
+def _gdal_from_numpy(numpy_rast, meta, outpath, NoData_Value,
+                     calc_stats = False, build_pyramids = False):
+    """
+    Writes a 2d numpy array to a GeoTIFF with gdal using the spatial referencing
+    information in a metadata object. The array should already be of the
+    desired output datatype with NoData pixels set to NoData_Value.
+
+    :param numpy_rast:      2d numpy array (not masked) to save
+    :param meta:            metadata object as output from ``to_numpy``
+    :param outpath:         output filepath of the GeoTIFF
+    :param NoData_Value:    the NoData value of the output raster
+    :param calc_stats:      set True to compute and store band statistics
+    :param build_pyramids:  set True to build internal overviews
+
+    :return outpath:        filepath to created file
+    """
+
+    ys, xs = numpy_rast.shape
+    outdata = _gdal_create_gtiff(outpath, meta, xs, ys, numpy_rast.dtype, NoData_Value)
+
+    outband = outdata.GetRasterBand(1)
+    outband.WriteArray(numpy_rast, 0, 0)
+
+    if calc_stats:
+        outband.ComputeStatistics(False)
+    if build_pyramids:
+        outdata.BuildOverviews("NEAREST", [2, 4, 8, 16])
+
+    outband.FlushCache()
+    del outband
+    del outdata
+
+    return outpath
+
+
+def _gdal_create_gtiff(outpath, meta, xs, ys, numpy_datatype, NoData_Value):
+    """
+    Creates an empty single band GeoTIFF with gdal that is spatially referenced
+    according to a metadata object, ready to have arrays written into it.
+
+    :param outpath:         output filepath of the GeoTIFF
+    :param meta:            metadata object as output from ``to_numpy``
+    :param xs:              number of columns in the output raster
+    :param ys:              number of rows in the output raster
+    :param numpy_datatype:  numpy datatype of the output raster
+    :param NoData_Value:    the NoData value of the output raster
+
+    :return outdata:        an open gdal.Dataset object
+    """
+
+    if os.path.dirname(outpath) and not os.path.exists(os.path.dirname(outpath)):
+        os.makedirs(os.path.dirname(outpath))
+
+    _require_gdal()
+    gdal_type = getattr(gdal, NUMPY_TO_GDAL_TYPES.get(str(numpy_datatype), "GDT_Float64"))
+
+    # arcpy spatial reference objects must be converted to WKT
+    projection = meta.projection
+    if hasattr(projection, "exportToString"):
+        projection = projection.exportToString()
+
+    geotransform = (meta.Xmin, meta.cellWidth, 0.0,
+                    meta.Ymin + (ys * meta.cellHeight), 0.0, -meta.cellHeight)
+
+    gtiff = gdal.GetDriverByName("GTiff")
+    outdata = gtiff.Create(outpath, xs, ys, 1, gdal_type, GTIFF_OPTIONS)
+    outdata.SetGeoTransform(geotransform)
+    if projection:
+        outdata.SetProjection(str(projection))
+
+    if NoData_Value is not None:
+        outdata.GetRasterBand(1).SetNoDataValue(float(NoData_Value))
+
+    return outdata
+
+
+def _require_gdal():
+    """ raises an exception if gdal could not be imported """
+
+    if gdal is None:
+        raise ImportError("This function requires gdal, which could not be imported")
+    return
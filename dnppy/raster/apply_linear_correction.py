@@ -3,6 +3,10 @@
 from enf_rastlist import *
 from from_numpy import *
 from to_numpy import *
+from to_numpy_blocks import *
+from block_writer import *
+from metadata import metadata
+from io_backend import get_io_backend
 from dnppy import core
 import os
 
@@ -55,15 +59,29 @@ def apply_linear_correction(rasterlist, factor, offset, suffix = 'lc',
 
     for raster in rasterlist:
         print("applying a linear correction to " + raster)
-        image, metadata = to_numpy(raster, "float32")
         new_NoData = floor
-        
-        output = image * factor + offset
-        low_value_indices = output < new_NoData
-        output[low_value_indices] = new_NoData
-
         outname = core.create_outname(outdir,raster,suffix)
-        from_numpy(output, metadata, outname, new_NoData)
+
+        if get_io_backend() == "gdal":
+            meta = metadata(raster, backend = "gdal")
+            writer = block_writer(outname, meta, "float32", new_NoData)
+
+            for image, block_meta in to_numpy_blocks(raster, "float32"):
+                output = image * factor + offset
+                output[output < new_NoData] = new_NoData
+                writer.write(output, block_meta)
+
+            writer.close()
+
+        else:
+            image, meta = to_numpy(raster, "float32")
+
+            output = image * factor + offset
+            low_value_indices = output < new_NoData
+            output[low_value_indices] = new_NoData
+
+            from_numpy(output, meta, outname, new_NoData)
+
         output_filelist.append(outname)
 
     print("Finished! \n ")
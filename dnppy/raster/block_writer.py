@@ -0,0 +1,98 @@
+__author__ = "jwely"
+__all__ = ["block_writer"]
+
+
+from _gdal_io import _gdal_create_gtiff
+
+import numpy
+
+
+class block_writer():
+    """
+    Streaming version of ``from_numpy`` that saves a raster one window at a time
+
+    A block_writer creates an empty GeoTIFF with the full size and spatial referencing
+    of the input metadata, then writes windows of data into it as they are produced,
+    so an output raster never has to be held in memory all at once. It is meant to
+    pair with ``raster.to_numpy_blocks``, whose window metadata objects carry the
+    ``xoff`` and ``yoff`` pixel offsets used to place each window. Requires ``gdal``.
+
+    :param outpath:         output filepath of the GeoTIFF
+    :param metadata:        metadata object describing the ENTIRE output raster,
+                            such as ``raster.metadata(inpath, backend = "gdal")``
+    :param numpy_datatype:  numpy datatype of the output raster, defaults to that
+                            of the metadata object.
+    :param NoData_Value:    the NoData value of the output raster, defaults to that
+                            of the metadata object.
+    :param calc_stats:      set True to calculate statistics when the writer is closed.
+    :param build_pyramids:  set True to build pyramids when the writer is closed.
+    """
+
+    def __init__(self, outpath, metadata, numpy_datatype = None, NoData_Value = None,
+                 calc_stats = False, build_pyramids = False):
+
+        if numpy_datatype is None:
+            numpy_datatype = metadata.numpy_datatype
+
+        if NoData_Value is None:
+            NoData_Value = metadata.NoData_Value
+
+        self.outpath        = outpath
+        self.numpy_datatype = numpy_datatype
+        self.NoData_Value   = NoData_Value
+        self.calc_stats     = calc_stats
+        self.build_pyramids = build_pyramids
+
+        self.dataset = _gdal_create_gtiff(outpath, metadata, metadata.Xsize, metadata.Ysize,
+                                          numpy_datatype, NoData_Value)
+        self.band = self.dataset.GetRasterBand(1)
+        return
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return
+
+
+    def write(self, numpy_rast, metadata):
+        """
+        Writes one window of data into the output raster
+
+        :param numpy_rast:  2d numpy array or masked array of window data.
+                            masked pixels are saved as NoData_Value.
+        :param metadata:    window metadata object, as yielded by ``to_numpy_blocks``
+        """
+
+        if isinstance(numpy_rast, numpy.ma.core.MaskedArray):
+            numpy_rast = numpy_rast.filled(self.NoData_Value)
+
+        numpy_rast = numpy_rast.astype(self.numpy_datatype)
+        self.band.WriteArray(numpy_rast, metadata.xoff, metadata.yoff)
+        return
+
+
+    def close(self):
+        """
+        Finishes the output raster, building statistics and pyramids if requested
+
+        :return outpath:    filepath to created file
+        """
+
+        if self.dataset is None:
+            return self.outpath
+
+        if self.calc_stats:
+            self.band.ComputeStatistics(False)
+        if self.build_pyramids:
+            self.dataset.BuildOverviews("NEAREST", [2, 4, 8, 16])
+
+        self.band.FlushCache()
+        self.band = None
+        self.dataset = None
+
+        print("Saved output file as {0}".format(self.outpath))
+        return self.outpath
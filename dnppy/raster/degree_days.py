@@ -6,6 +6,11 @@ from from_numpy import from_numpy
 
 import numpy
 
+
+# approximate number of pixels to process at a time
+CHUNK_PIXELS = 2 ** 20
+
+
 def degree_days(T_base, Max, Min, NoData_Value, outpath = False, roof = False, floor = False):
     """
     Inputs rasters for maximum and minimum temperatures, calculates Growing Degree Days
@@ -15,7 +20,8 @@ def degree_days(T_base, Max, Min, NoData_Value, outpath = False, roof = False, f
     temperature value, a minimum temperature value, and a base temperature. This
     equation could also be used to calculate Chill hours or anything similar.
 
-    The equation is ``[(Max+Min)/2 + T_base]``
+    The equation is ``[(Max+Min)/2 + T_base]``, and it is computed with numpy
+    array operations on chunks of rows at a time.
 
     where values in Max which are greater than roof are set equal to roof
     where values in Min which are less than floor are set equal to floor
@@ -70,37 +76,23 @@ def degree_days(T_base, Max, Min, NoData_Value, outpath = False, roof = False, f
     else:
         raise Exception("invalid inputs!")
             
-    # Begin to perform the degree day calculations
-
-    # apply roof and floor corrections if they have been specified
-    if roof:
-        highs[highs >= roof] = roof
-    if floor:
-        lows[lows <=floor] = floor
-
-    # find the shapes of high and low arrays
-    xsh, ysh = highs.shape
-    xsl, ysl = lows.shape
-
     # only continue if min and max arrays have the same shape
-    if xsh == xsl and ysh == ysl:
-        
-        # set empty degree day matrix
-        deg_days = numpy.zeros((xsh,ysh))
-        
-        # perform the calculation
-        for x in range(xsh):
-            for y in range(ysh):
-                if round(highs[x,y]/NoData_Value,10) !=1 and round(lows[x,y]/NoData_Value,10) != 1:
-                    deg_days[x,y] =((highs[x,y] + lows[x,y])/2) + T_base
-                else:
-                    deg_days[x,y] = NoData_Value
-                
-    # print error if the arrays are not the same size
-    else:
+    if highs.shape != lows.shape:
         print('Images are not the same size!, Check inputs!')
         return False
 
+    # masked pixels (from raster inputs) are output as nan
+    masked = numpy.ma.getmaskarray(highs) | numpy.ma.getmaskarray(lows)
+    highs  = numpy.ma.getdata(highs)
+    lows   = numpy.ma.getdata(lows)
+
+    # perform the calculation one chunk of rows at a time
+    deg_days = numpy.zeros(highs.shape)
+    for rows in _row_chunks(*highs.shape):
+        deg_days[rows] = _degree_days_chunk(T_base, highs[rows], lows[rows],
+                                            NoData_Value, roof, floor)
+    deg_days[masked] = numpy.nan
+
     # if an output path was specified, save it with the spatial referencing information.
     if outpath and type(Max) is str and type(Min) is str:
         from_numpy(deg_days, meta, outpath)
@@ -109,4 +101,43 @@ def degree_days(T_base, Max, Min, NoData_Value, outpath = False, roof = False, f
     return deg_days
 
 
+def _degree_days_chunk(T_base, highs, lows, NoData_Value, roof = False, floor = False):
+    """
+    Computes degree days for matching chunks of maximum and minimum temperatures.
+    The roof and floor are applied before NoData values are found, and the inputs
+    are not modified.
+    """
+
+    if roof:
+        highs = numpy.minimum(highs, roof).astype(highs.dtype)
+    if floor:
+        lows = numpy.maximum(lows, floor).astype(lows.dtype)
+
+    deg_days = ((highs + lows) / 2).astype("float64") + T_base
+
+    nodata = _is_nodata(highs, NoData_Value) | _is_nodata(lows, NoData_Value)
+    deg_days[nodata] = NoData_Value
+
+    return deg_days
+
+
+def _is_nodata(values, NoData_Value):
+    """
+    Returns a boolean array, True where values are equal to NoData_Value
+    to ten decimal places of their ratio.
+    """
+
+    if values.dtype.kind == "f":
+        values = values.astype("float64")
+
+    with numpy.errstate(divide = "ignore", invalid = "ignore"):
+        return numpy.round(values / NoData_Value, 10) == 1
+
+
+def _row_chunks(ys, xs, chunk_pixels = CHUNK_PIXELS):
+    """
+    Returns a list of slices that split ys rows into chunks of about chunk_pixels
+    """
 
+    step = max(1, chunk_pixels // max(xs, 1))
+    return [slice(y, min(y + step, ys)) for y in range(0, ys, step)]
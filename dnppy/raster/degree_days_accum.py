@@ -4,6 +4,7 @@ from dnppy import core
 from enf_rastlist import enf_rastlist
 from to_numpy import to_numpy
 from from_numpy import from_numpy
+from degree_days import _row_chunks
 
 import os
 import numpy
@@ -38,12 +39,17 @@ def degree_days_accum(rasterlist, critical_values = None, outdir = None):
 
     if critical_values:
         critical_values = core.enf_list(critical_values)
+    else:
+        critical_values = []
 
     # critical values of zero are problematic, so replace it with a small value.
     if 0 in critical_values:
         critical_values.remove(0)
         critical_values.append(0.000001)
 
+    # float32 thresholds equivalent to comparing the float32 sums with each critical value
+    thresholds = [_float32_threshold(critical_value) for critical_value in critical_values]
+
     if outdir is not None and not os.path.exists(outdir):
         os.makedirs(outdir)
 
@@ -53,27 +59,28 @@ def degree_days_accum(rasterlist, critical_values = None, outdir = None):
         xs, ys = image.shape
 
         if i == 0:
-            Sum  = numpy.zeros((xs,ys))
-            Crit = numpy.zeros((len(critical_values),xs,ys))
+            Sum  = numpy.zeros((xs,ys), dtype = "float32")
+            Crit = numpy.zeros((len(critical_values),xs,ys), dtype = "int16")
 
         if image.shape == Sum.shape:
 
+            with numpy.errstate(invalid = "ignore"):
+                positive = ~numpy.ma.getmaskarray(image) & (numpy.ma.getdata(image) >= 0)
+
             # only bother to proceed if at least one pixel is positive
-            if numpy.max(image) >= 0:
-                for x in range(xs):
-                    for y in range(ys):
+            if positive.any():
 
-                        if image[x,y] >= 0:
-                            Sum[x,y] = Sum[x,y]+image[x,y]
+                # add positive values to the sum, and find where each critical value
+                # is first reached, one chunk of rows at a time.
+                for rows in _row_chunks(xs, ys):
+                    Sum[rows] += numpy.where(positive[rows], image.data[rows], 0)
 
-                        if critical_values is not None:
-                            for z,critical_value in enumerate(critical_values):
-                                if Sum[x,y] >= critical_value and Crit[z,x,y]==0:
-                                    Crit[z,x,y] = i
+                    for z, threshold in enumerate(thresholds):
+                        crit = Crit[z, rows]
+                        crit[(Sum[rows] >= threshold) & (crit == 0)] = i
         else:
             print "Encountered an image of incorrect size! Skipping it!"
 
-        Sum     = Sum.astype('float32')
         outname = core.create_outname(outdir, rast, "Accum")
         from_numpy(Sum, meta, outname)
         output_filelist.append(outname)
@@ -81,7 +88,6 @@ def degree_days_accum(rasterlist, critical_values = None, outdir = None):
         del image
 
     # output critical accumulation rasters using some data from the last raster in previous loop
-    Crit = Crit.astype('int16')
     crit_meta = meta
     crit_meta.NoData_Value = 0
     head , tail = os.path.split(outname)        # place these in the last raster output location
@@ -90,4 +96,16 @@ def degree_days_accum(rasterlist, critical_values = None, outdir = None):
         print("Saving {0}".format(outname))
         from_numpy(Crit[z,:,:], crit_meta, outname)
 
-    return output_filelist
\ No newline at end of file
+    return output_filelist
+
+
+def _float32_threshold(value):
+    """
+    Returns the smallest float32 value that is not less than value, so float32 arrays
+    may be compared against it exactly as if each element were compared with value.
+    """
+
+    threshold = numpy.float32(value)
+    if threshold < value:
+        threshold = numpy.nextafter(threshold, numpy.float32(numpy.inf))
+    return threshold
@@ -1,12 +1,19 @@
 __author__ = "jwely"
 __all__ = ["from_numpy"]
 
-import arcpy
-arcpy.env.overwriteOutput = True
+from io_backend import get_io_backend
+
 import numpy
 
+try:
+    import arcpy
+    arcpy.env.overwriteOutput = True
+except ImportError:
+    arcpy = None
+
 
-def from_numpy(numpy_rast, metadata, outpath, NoData_Value = None):
+def from_numpy(numpy_rast, metadata, outpath, NoData_Value = None,
+               calc_stats = False, build_pyramids = False, backend = None):
     """
     Wrapper for arcpy.NumPyArrayToRaster function with better metadata handling
 
@@ -15,10 +22,19 @@ def from_numpy(numpy_rast, metadata, outpath, NoData_Value = None):
     arrays. It also ensures that all spatial referencing and projection info is preserved
     between input and outputs of numpy manipulations.
 
+    When the "gdal" io backend is in use, the output is written directly as a GeoTIFF
+    with gdal instead, and no ArcGIS licence is required. See ``raster.set_io_backend``.
+
     :param numpy_rast:      The numpy array version of the input raster
     :param metadata:        The variable exactly as output from "to_numpy"
     :param outpath:         Output filepath of the individual raster
     :param NoData_Value:    The no data value of the output raster
+    :param calc_stats:      Set True to calculate statistics on the output raster.
+                            This can take a while on large rasters, so defaults to False.
+    :param build_pyramids:  Set True to build pyramids on the output raster. This can
+                            take a while on large rasters, so defaults to False.
+    :param backend:         either "arcpy" or "gdal" to override the default io backend
+                            set with ``raster.set_io_backend``
 
     :return outpath:        Same as input outpath, filepath to created file.
 
@@ -32,7 +48,19 @@ def from_numpy(numpy_rast, metadata, outpath, NoData_Value = None):
 
     if NoData_Value is None:
         NoData_Value = metadata.NoData_Value
-            
+
+    if get_io_backend(backend) == "gdal":
+        from _gdal_io import _gdal_from_numpy
+
+        if isinstance(numpy_rast, numpy.ma.core.MaskedArray):
+            numpy_rast = numpy_rast.filled(NoData_Value)
+
+        _gdal_from_numpy(numpy_rast, metadata, outpath, NoData_Value,
+                         calc_stats = calc_stats, build_pyramids = build_pyramids)
+
+        print("Saved output file as {0}".format(outpath))
+        return outpath
+
     llcorner = arcpy.Point(metadata.Xmin, metadata.Ymin)
     
     # save the output.
@@ -67,8 +95,10 @@ def from_numpy(numpy_rast, metadata, outpath, NoData_Value = None):
         Warning("Unable to establish NoData profile on {0}".format(outpath))
     
     # calculate statistics and pyramids
-    arcpy.CalculateStatistics_management(outpath)
-    arcpy.BuildPyramids_management(outpath)
+    if calc_stats:
+        arcpy.CalculateStatistics_management(outpath)
+    if build_pyramids:
+        arcpy.BuildPyramids_management(outpath)
     
     print("Saved output file as {0}".format(outpath))
 
@@ -0,0 +1,60 @@
+__author__ = 'jwely'
+__all__ = ["set_io_backend", "get_io_backend"]
+
+
+IO_BACKENDS = ["arcpy", "gdal"]
+
+_io_backend = None
+
+
+def set_io_backend(backend):
+    """
+    Sets the library used by ``to_numpy`` and ``from_numpy`` (and every function
+    built upon them, such as ``many_stats`` and ``gap_fill_temporal``) to read and
+    write raster data.
+
+    The "arcpy" backend wraps ``arcpy.RasterToNumPyArray`` and ``arcpy.NumPyArrayToRaster``
+    and requires an ArcGIS licence. The "gdal" backend reads and writes GeoTIFFs
+    directly through GDAL, and is useful on machines without ArcGIS installed, or
+    when raw disk speed is important for large batches of rasters.
+
+    :param backend:     either "arcpy" or "gdal"
+    """
+
+    global _io_backend
+
+    if backend not in IO_BACKENDS:
+        raise Exception("Unknown raster io backend '{0}', use one of {1}".format(backend, IO_BACKENDS))
+
+    _io_backend = backend
+    return
+
+
+def get_io_backend(backend = None):
+    """
+    Returns the name of the raster io backend in use. If no backend has been set
+    with ``set_io_backend``, "arcpy" is used if it can be imported, and "gdal"
+    is used otherwise.
+
+    :param backend:     an explicit backend choice, which is returned as is if
+                        it is not None. This allows functions to accept a
+                        "backend" argument that overrides the default.
+
+    :return backend:    either "arcpy" or "gdal"
+    """
+
+    global _io_backend
+
+    if backend is not None:
+        if backend not in IO_BACKENDS:
+            raise Exception("Unknown raster io backend '{0}', use one of {1}".format(backend, IO_BACKENDS))
+        return backend
+
+    if _io_backend is None:
+        try:
+            import arcpy
+            _io_backend = "arcpy"
+        except ImportError:
+            _io_backend = "gdal"
+
+    return _io_backend
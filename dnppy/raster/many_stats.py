@@ -1,133 +1,257 @@
 __author__ = "Jwely"
-__all__ = ["many_stats"]
+__all__ = ["many_stats",
+           "_many_stats_jobs"]      # special member
 
 from dnppy import core
 from enf_rastlist import enf_rastlist
 from to_numpy import to_numpy
 from from_numpy import from_numpy
+from metadata import metadata
+from io_backend import get_io_backend
 from raster_fig import raster_fig
+from stats_accumulator import stats_accumulator
 
 # other imports
 import numpy
 import os
+import multiprocessing
+
+
+# approximate bytes of working memory used per pixel of a tile in parallel mode
+TILE_BYTES_PER_PIXEL = 96
 
-# FIXME: this function has an outstanding bug report against it. check issues
 
 def many_stats(rasterlist, outdir, outname, saves = None, low_thresh = None,
-                    high_thresh = None, numtype = 'float32', NoData_Value = -9999):
+                    high_thresh = None, numtype = 'float32', NoData_Value = -9999,
+                    workers = 1, worker_mb = 512):
     """
     Take statistics across many input rasters. This function is used to take
     statistics on large groups of rasters with identical spatial extents.
 
+    Rasters are read one at a time and folded into a ``raster.stats_accumulator``,
+    so memory use is on the order of a single raster regardless of how many
+    rasters are in the input list.
+
     :param rasterlist:      list of raster filepaths for which to take statistics
     :param outdir:          directory where output should be stored.
     :param outname:         output name filename string that will be used in output filenames
-    :param saves:           which statistics to save in a raster. Defaults to all
-                            three ['AVG','NUM','STD'].
+    :param saves:           which statistics to save in a raster. Defaults to
+                            ['AVG','NUM','STD','SUM'], "MIN" and "MAX" are also available.
     :param low_thresh:      values below low_thresh are assumed erroneous and set to NoData
     :param high_thresh:     values above high_thresh are assumed erroneous and set to NoData.
     :param numtype:         type of numerical value. defaults to 32bit float.
+    :param NoData_Value:    the NoData value of output rasters.
+    :param workers:         number of processes to use. If greater than 1, the rasters are
+                            split into tiles of rows that are processed in parallel, and
+                            no figures are displayed. Outputs are identical either way.
+    :param worker_mb:       approximate memory limit in MB for each worker process,
+                            used to pick the tile size when workers is greater than 1.
 
     This function does not return anything.
     """
 
     if saves is None:
         saves = ['AVG','NUM','STD','SUM']
+
+    rasterlist = enf_rastlist(rasterlist)
+
+    if workers > 1:
+        _many_stats_jobs([(rasterlist, outname)], outdir, saves, low_thresh, high_thresh,
+                         numtype, NoData_Value, workers, worker_mb)
+        return
+
     if not os.path.isdir(outdir):
         os.makedirs(outdir)
-    
-    rasterlist = enf_rastlist(rasterlist)
 
-    # build the empty numpy array based on size of first raster
-    temp_rast, metadata = to_numpy(rasterlist[0])
+    # build the accumulator based on size of first raster
+    temp_rast, meta     = to_numpy(rasterlist[0])
     xs, ys              = temp_rast.shape
-    zs                  = len(rasterlist)
-    rast_3d             = numpy.zeros((xs,ys,zs))
+    accum               = stats_accumulator((xs, ys))
 
-    metadata.NoData_Value = numpy.nan
+    meta.NoData_Value   = NoData_Value
+    meta.numpy_datatype = numtype
 
     # open up the initial figure
     rastfig = raster_fig(temp_rast)
+    del temp_rast
 
-    # populate the 3d matrix with values from all rasters
+    # add each raster to the running statistics one at a time
     for i, raster in enumerate(rasterlist):
 
         # print a status and open a figure
         print('working on file {0}'.format(os.path.basename(raster)))
         new_rast, new_meta  = to_numpy(raster, numtype)
 
-        new_rast = new_rast.data
-
         if not new_rast.shape == (xs, ys):
-            print new_rast.shape
-
-        # set rasters to have 'nan' NoData_Value
-        if new_meta.NoData_Value != metadata.NoData_Value:
-            new_rast[new_rast == new_meta.NoData_Value] = metadata.NoData_Value
-            
-        # set values outside thresholds to nodata values
-        if not low_thresh is None:
-            new_rast[new_rast < low_thresh] = metadata.NoData_Value
-        if not high_thresh is None:
-            new_rast[new_rast > high_thresh] = metadata.NoData_Value
+            print("Skipping {0}, its shape {1} does not match {2}".format(
+                os.path.basename(raster), new_rast.shape, (xs, ys)))
+            continue
 
-        new_rast = numpy.ma.masked_array(new_rast, numpy.isnan(new_rast))
+        new_rast = _threshold(new_rast, low_thresh, high_thresh)
 
         # display a figure
         rastfig.update_fig(new_rast)
 
-        rast_3d[:,:,i] = new_rast
+        accum.add(new_rast)
+        del new_rast
 
-    # build up our statistics by masking nan values and performing matrix operations
-    rastfig.close_fig()
-    rast_3d_masked  = numpy.ma.masked_array(rast_3d, numpy.isnan(rast_3d))
-
-    if "AVG" in saves:
-        avg_rast        = numpy.mean(rast_3d_masked, axis = 2)
-        avg_rast        = numpy.array(avg_rast)
-        rastfig         = raster_fig(avg_rast, title = "Average")
-
-        avg_name = core.create_outname(outdir, outname, 'AVG', 'tif')
-        print("Saving AVERAGE output raster as {0}".format(avg_name))
-        from_numpy(avg_rast, metadata, avg_name, NoData_Value = NoData_Value)
-        rastfig.close_fig()
-        del avg_rast
-
-    if "STD" in saves:
-        std_rast        = numpy.std(rast_3d_masked, axis = 2)
-        std_rast        = numpy.array(std_rast)
-        rastfig         = raster_fig(std_rast, title = "Standard Deviation")
-
-        std_name = core.create_outname(outdir, outname, 'STD', 'tif')
-        print("Saving STANDARD DEVIATION output raster as {0}".format(std_name))
-        from_numpy(std_rast, metadata, std_name, NoData_Value = NoData_Value)
-        rastfig.close_fig()
-        del std_rast
-        
-    if "NUM" in saves:
-        num_rast        = (numpy.zeros((xs,ys)) + zs) - numpy.sum(rast_3d_masked.mask, axis = 2)
-        num_rast        = numpy.array(num_rast)
-        rastfig         = raster_fig(num_rast, title =  "Good pixel count (NUM)")
-        rastfig.close_fig()
-
-        num_name = core.create_outname(outdir, outname, 'NUM', 'tif')
-        print("Saving NUMBER output raster as {0}".format(num_name))
-        from_numpy(num_rast, metadata, num_name, NoData_Value = NoData_Value)
-        rastfig.close_fig()
-        del num_rast
-
-    if "SUM" in saves:
-        sum_rast        = numpy.sum(rast_3d_masked, axis = 2)
-        sum_rast        = numpy.array(sum_rast)
-        rastfig         = raster_fig(sum_rast, title = "Sum Total")
-        rastfig.close_fig()
-
-        sum_name = core.create_outname(outdir, outname, 'SUM', 'tif')
-        print("Saving SUM output raster as {0}".format(sum_name))
-        from_numpy(sum_rast, metadata, sum_name, NoData_Value = NoData_Value)
-        rastfig.close_fig()
-        del sum_rast
-                   
     rastfig.close_fig()
 
+    _save_stats(accum, meta, outdir, outname, saves, NoData_Value)
+    return
+
+
+def _many_stats_jobs(jobs, outdir, saves, low_thresh = None, high_thresh = None,
+                     numtype = 'float32', NoData_Value = -9999, workers = None, worker_mb = 512):
+    """
+    Parallel engine behind ``many_stats`` for one or more lists of rasters.
+
+    Every job is split into tiles of whole rows small enough to fit within worker_mb,
+    and all tiles of all jobs are processed by a single pool of worker processes.
+    Tiles are reassembled in order and each job is saved as soon as all of its tiles
+    are finished, so results are identical to calling ``many_stats`` serially on each
+    job. On windows, calling scripts must be protected by ``if __name__ == "__main__":``
+
+    :param jobs:            list of (rasterlist, outname) tuples, one for each set of
+                            output statistics rasters to create.
+    :param workers:         number of worker processes, defaults to the number of cpus.
+    :param worker_mb:       approximate memory limit in MB for each worker process
+
+    see ``many_stats`` for all other parameters.
+    """
+
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+
+    # child processes on windows do not inherit the io backend setting
+    backend = get_io_backend()
+
+    # verify raster shapes and split every job into tiles
+    tasks     = []
+    job_metas = []
+    for job_index, (rasterlist, outname) in enumerate(jobs):
+
+        rasterlist = enf_rastlist(rasterlist)
+        meta = metadata(rasterlist[0], backend = backend)
+        xs, ys = meta.Xsize, meta.Ysize
+
+        good_rasters = []
+        for raster in rasterlist:
+            rmeta = metadata(raster, backend = backend)
+            if (rmeta.Ysize, rmeta.Xsize) == (ys, xs):
+                good_rasters.append(raster)
+            else:
+                print("Skipping {0}, its shape {1} does not match {2}".format(
+                    os.path.basename(raster), (rmeta.Ysize, rmeta.Xsize), (ys, xs)))
+
+        meta.NoData_Value   = NoData_Value
+        meta.numpy_datatype = numtype
+        job_metas.append(meta)
+
+        tile_rows = max(1, int(worker_mb * 2 ** 20) // (xs * TILE_BYTES_PER_PIXEL))
+        tile_offsets = range(0, ys, tile_rows)
+
+        for tile_index, yoff in enumerate(tile_offsets):
+            window = (0, yoff, xs, min(tile_rows, ys - yoff))
+            tasks.append((job_index, outname, good_rasters, window, numtype,
+                          low_thresh, high_thresh, backend,
+                          "{0}/{1}".format(tile_index + 1, len(tile_offsets))))
+
+    print("Processing {0} tiles for {1} jobs with {2} workers".format(len(tasks), len(jobs), workers))
+
+    # reassemble tiles in order, saving each job when its last tile arrives
+    pool = multiprocessing.Pool(workers)
+    try:
+        current_job = None
+        accum = None
+
+        for job_index, window, tile_accum in pool.imap(_many_stats_tile, tasks):
+
+            if job_index != current_job:
+                if accum is not None:
+                    _save_stats(accum, job_metas[current_job], outdir, jobs[current_job][1],
+                                saves, NoData_Value, show_figs = False)
+
+                current_job = job_index
+                meta = job_metas[job_index]
+                accum = stats_accumulator((meta.Ysize, meta.Xsize))
+
+            accum.paste(tile_accum, window[1], window[0])
+            del tile_accum
+
+        if accum is not None:
+            _save_stats(accum, job_metas[current_job], outdir, jobs[current_job][1],
+                        saves, NoData_Value, show_figs = False)
+    finally:
+        pool.close()
+        pool.join()
+
+    return
+
+
+def _many_stats_tile(task):
+    """
+    Worker function for ``_many_stats_jobs``, accumulates statistics over one
+    tile of one job, and returns (job_index, window, stats_accumulator)
+    """
+
+    job_index, outname, rasterlist, window, numtype, low_thresh, high_thresh, backend, tile_name = task
+
+    pid = os.getpid()
+    print("worker {0}: {1} tile {2}, {3} rasters".format(pid, outname, tile_name, len(rasterlist)))
+
+    accum = stats_accumulator((window[3], window[2]))
+    for raster in rasterlist:
+        new_rast, new_meta = to_numpy(raster, numtype, backend = backend, window = window)
+        accum.add(_threshold(new_rast, low_thresh, high_thresh))
+        del new_rast
+
+    print("worker {0}: {1} tile {2} finished".format(pid, outname, tile_name))
+    return job_index, window, accum
+
+
+def _threshold(numpy_rast, low_thresh = None, high_thresh = None):
+    """
+    masks values outside the thresholds of a masked array from ``to_numpy``
+    """
+
+    numpy_rast = numpy.ma.masked_array(numpy_rast.data, numpy.ma.getmaskarray(numpy_rast))
+
+    # set values outside thresholds to nodata values
+    if not low_thresh is None:
+        numpy_rast[numpy_rast.data < low_thresh] = numpy.ma.masked
+    if not high_thresh is None:
+        numpy_rast[numpy_rast.data > high_thresh] = numpy.ma.masked
+
+    return numpy_rast
+
+
+def _save_stats(accum, meta, outdir, outname, saves, NoData_Value, show_figs = True):
+    """
+    saves the requested statistics from a stats_accumulator to rasters in outdir
+    """
+
+    titles = {"AVG": ("AVERAGE", "Average"),
+              "STD": ("STANDARD DEVIATION", "Standard Deviation"),
+              "NUM": ("NUMBER", "Good pixel count (NUM)"),
+              "SUM": ("SUM", "Sum Total"),
+              "MIN": ("MINIMUM", "Minimum"),
+              "MAX": ("MAXIMUM", "Maximum")}
+
+    for stat in stats_accumulator.STATISTICS:
+        if stat in saves:
+            stat_rast   = accum.get_stat(stat)
+            if show_figs:
+                rastfig = raster_fig(stat_rast, title = titles[stat][1])
+
+            stat_name = core.create_outname(outdir, outname, stat, 'tif')
+            print("Saving {0} output raster as {1}".format(titles[stat][0], stat_name))
+            from_numpy(stat_rast, meta, stat_name, NoData_Value = NoData_Value)
+            if show_figs:
+                rastfig.close_fig()
+            del stat_rast
+
     return
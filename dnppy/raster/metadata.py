@@ -1,7 +1,30 @@
 __author__ = 'jwely'
 __all__ = ["metadata"]
 
-import arcpy
+from io_backend import get_io_backend
+
+import copy
+
+try:
+    import arcpy
+except ImportError:
+    arcpy = None
+
+try:
+    import gdal
+except ImportError:
+    gdal = None
+
+
+# translates gdal band data types into arcpy.Describe() style "pixelType" strings
+GDAL_PIXEL_TYPES = {"Byte":     "U8",
+                    "UInt16":   "U16",
+                    "Int16":    "S16",
+                    "UInt32":   "U32",
+                    "Int32":    "S32",
+                    "Float32":  "F32",
+                    "Float64":  "F64"}
+
 
 class metadata():
     """
@@ -10,6 +33,10 @@ class metadata():
     arrays for data manipulation.
 
     :param raster:  filepath to raster existing on disk
+    :param backend: library used to read the metadata, either "arcpy" or "gdal".
+                    defaults to the setting of ``raster.set_io_backend``
+    :param band:    band number to read the NoData_Value from with the "gdal"
+                    backend. Defaults to 1.
 
     typical attributes include the following
 
@@ -31,10 +58,12 @@ class metadata():
     numpy_datatype  numpy accepted pixel type string. (ex "float32")
     projection      the projection of the raster (long string)
     NoData_Value    the value representing no data
+    geotransform    gdal style geotransform tuple (gdal backend only)
     =============== ===========================================================
     """
 
-    def __init__(self, raster = None, xs = None, ys = None, zs = None):
+    def __init__(self, raster = None, xs = None, ys = None, zs = None,
+                 backend = None, band = 1):
 
         # sets geometry information
         if zs is None:
@@ -46,7 +75,10 @@ class metadata():
 
         # if a filepath to existing raster is input, build metadata from it
         if raster is not None:
-            self._get_atts_from_raster(raster)
+            if get_io_backend(backend) == "gdal":
+                self._get_atts_from_gdal(raster, band)
+            else:
+                self._get_atts_from_raster(raster)
         return
 
 
@@ -56,6 +88,12 @@ class metadata():
         """
 
         desc = arcpy.Describe(raster)
+
+        if self.Xsize is None:
+            self.Xsize = desc.width
+        if self.Ysize is None:
+            self.Ysize = desc.height
+
         self.cellWidth      = desc.meanCellWidth
         self.cellHeight     = desc.meanCellHeight
         self.Xmin           = desc.Extent.XMin
@@ -77,6 +115,88 @@ class metadata():
         return
 
 
+    def _get_atts_from_gdal(self, raster, band = 1):
+        """
+        sets all required metadata attributes from an existing raster image
+        using gdal instead of arcpy. Attributes are stored in the same format
+        as those created by ``_get_atts_from_raster``, except for projection,
+        which is stored as a WKT string.
+        """
+
+        if gdal is None:
+            raise ImportError("Reading raster metadata with gdal requires gdal, which could not be imported")
+
+        dataset = gdal.Open(raster)
+        if dataset is None:
+            raise Exception("gdal could not open raster '{0}'".format(raster))
+
+        gdal_band = dataset.GetRasterBand(band)
+        gt = dataset.GetGeoTransform()
+
+        if self.Xsize is None:
+            self.Xsize = dataset.RasterXSize
+        if self.Ysize is None:
+            self.Ysize = dataset.RasterYSize
+
+        self.geotransform   = gt
+        self.cellWidth      = gt[1]
+        self.cellHeight     = abs(gt[5])
+        self.Xmin           = gt[0]
+        self.Ymax           = gt[3]
+        self.Xmax           = self.Xmin + (self.Xsize * self.cellWidth)
+        self.Ymin           = self.Ymax - (self.Ysize * self.cellHeight)
+
+        gdal_type           = gdal.GetDataTypeName(gdal_band.DataType)
+        self.desc_pixelType = GDAL_PIXEL_TYPES.get(gdal_type, gdal_type)
+        self.pixel_type     = self._get_pixel_type
+        self.numpy_datatype = self._get_numpy_datatype
+
+        self.rectangle      = ' '.join([str(self.Xmin),
+                                        str(self.Ymin),
+                                        str(self.Xmax),
+                                        str(self.Ymax)])
+
+        self.projection     = dataset.GetProjection()
+        self.NoData_Value   = gdal_band.GetNoDataValue()
+
+        del dataset
+        return
+
+
+    def window(self, xoff, yoff, xs, ys):
+        """
+        Returns a copy of this metadata object that describes only a window of
+        the raster, with updated geometry attributes and the pixel offsets of the
+        window stored in "xoff" and "yoff".
+
+        :param xoff:    column offset of the window from the upper left corner
+        :param yoff:    row offset of the window from the upper left corner
+        :param xs:      number of columns in the window
+        :param ys:      number of rows in the window
+
+        :return wmeta:  a new metadata object for the window
+        """
+
+        wmeta = copy.copy(self)
+
+        wmeta.xoff  = xoff
+        wmeta.yoff  = yoff
+        wmeta.Xsize = xs
+        wmeta.Ysize = ys
+
+        wmeta.Xmin  = self.Xmin + (xoff * self.cellWidth)
+        wmeta.Ymax  = self.Ymax - (yoff * self.cellHeight)
+        wmeta.Xmax  = wmeta.Xmin + (xs * self.cellWidth)
+        wmeta.Ymin  = wmeta.Ymax - (ys * self.cellHeight)
+
+        wmeta.geotransform = (wmeta.Xmin, self.cellWidth, 0.0, wmeta.Ymax, 0.0, -self.cellHeight)
+        wmeta.rectangle    = ' '.join([str(wmeta.Xmin),
+                                       str(wmeta.Ymin),
+                                       str(wmeta.Xmax),
+                                       str(wmeta.Ymax)])
+        return wmeta
+
+
     @property
     def _get_pixel_type(self):
         """
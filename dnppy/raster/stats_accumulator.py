@@ -0,0 +1,158 @@
+__author__ = "jwely"
+__all__ = ["stats_accumulator"]
+
+import numpy
+
+
+class stats_accumulator():
+    """
+    Single pass, per pixel statistics across many rasters of identical shape
+
+    A stats_accumulator keeps running per pixel count, sum, mean, M2 (sum of squared
+    differences from the mean), minimum and maximum values as rasters are added to it
+    one at a time. Means and standard deviations are updated with Welford's method,
+    so only a handful of arrays the size of one raster are ever held in memory, no
+    matter how many rasters are added. Accumulators built on different subsets of
+    rasters (for example by separate worker processes) may be combined with ``merge``,
+    and accumulators built on spatial tiles of the same rasters assembled with ``paste``.
+
+    :param shape:   (rows, columns) shape of the rasters to accumulate.
+
+    ============ ======================================================
+    Statistic    Description
+    ============ ======================================================
+    AVG          mean of all valid values
+    STD          population standard deviation of all valid values
+    NUM          number of valid values
+    SUM          sum of all valid values
+    MIN          minimum valid value
+    MAX          maximum valid value
+    ============ ======================================================
+    """
+
+    STATISTICS = ["AVG", "STD", "NUM", "SUM", "MIN", "MAX"]
+
+    def __init__(self, shape):
+
+        self.shape = tuple(shape)
+        self.count = numpy.zeros(self.shape, dtype = "int32")
+        self.sum   = numpy.zeros(self.shape, dtype = "float64")
+        self.mean  = numpy.zeros(self.shape, dtype = "float64")
+        self.M2    = numpy.zeros(self.shape, dtype = "float64")
+        self.min   = numpy.full(self.shape, numpy.inf, dtype = "float64")
+        self.max   = numpy.full(self.shape, -numpy.inf, dtype = "float64")
+        return
+
+
+    def add(self, numpy_rast):
+        """
+        Adds one raster to the running statistics
+
+        :param numpy_rast:  a numpy array or masked numpy array. Masked pixels
+                            and pixels equal to numpy.nan are ignored.
+        """
+
+        if numpy_rast.shape != self.shape:
+            raise Exception("Cannot add raster of shape {0} to accumulator of shape {1}".format(
+                numpy_rast.shape, self.shape))
+
+        if isinstance(numpy_rast, numpy.ma.core.MaskedArray):
+            valid = ~numpy.ma.getmaskarray(numpy_rast)
+            values = numpy_rast.data.astype("float64")
+        else:
+            valid = numpy.ones(self.shape, dtype = "bool")
+            values = numpy_rast.astype("float64")
+
+        valid &= ~numpy.isnan(values)
+        values[~valid] = 0.0
+
+        self.count += valid
+
+        delta = values - self.mean
+        self.mean += numpy.where(valid, delta / numpy.maximum(self.count, 1), 0.0)
+        self.M2   += numpy.where(valid, delta * (values - self.mean), 0.0)
+        self.sum  += values
+
+        numpy.minimum(self.min, numpy.where(valid, values, numpy.inf), out = self.min)
+        numpy.maximum(self.max, numpy.where(valid, values, -numpy.inf), out = self.max)
+        return
+
+
+    def merge(self, other):
+        """
+        Merges the running statistics of another stats_accumulator into this one,
+        as if every raster added to "other" had also been added to this one.
+
+        :param other:   another stats_accumulator of the same shape
+        """
+
+        if other.shape != self.shape:
+            raise Exception("Cannot merge accumulator of shape {0} into shape {1}".format(
+                other.shape, self.shape))
+
+        count = self.count + other.count
+        safe_count = numpy.maximum(count, 1).astype("float64")
+
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.count / safe_count)
+        self.M2   = self.M2 + other.M2 + (delta ** 2) * (self.count * (other.count / safe_count))
+        self.sum  = self.sum + other.sum
+        self.count = count
+
+        numpy.minimum(self.min, other.min, out = self.min)
+        numpy.maximum(self.max, other.max, out = self.max)
+        return
+
+
+    def paste(self, other, yoff, xoff = 0):
+        """
+        Copies the running statistics of a smaller stats_accumulator, built on a
+        spatial tile of the same rasters, into this accumulator at a pixel offset.
+
+        :param other:   a stats_accumulator built on a window of the rasters
+        :param yoff:    row offset of the tile within this accumulator
+        :param xoff:    column offset of the tile within this accumulator
+        """
+
+        ys, xs = other.shape
+        tile = (slice(yoff, yoff + ys), slice(xoff, xoff + xs))
+
+        self.count[tile] = other.count
+        self.sum[tile]   = other.sum
+        self.mean[tile]  = other.mean
+        self.M2[tile]    = other.M2
+        self.min[tile]   = other.min
+        self.max[tile]   = other.max
+        return
+
+
+    def get_stat(self, statistic):
+        """
+        Returns one of the accumulated statistics as a masked numpy array, where
+        pixels that never held a valid value are masked (except in "NUM").
+
+        :param statistic:   one of "AVG", "STD", "NUM", "SUM", "MIN" or "MAX"
+        :return numpy_rast: masked numpy array of the statistic
+        """
+
+        statistic = statistic.upper()
+        empty = (self.count == 0)
+
+        if statistic == "NUM":
+            return numpy.ma.masked_array(self.count.astype("float64"),
+                                         numpy.zeros(self.shape, dtype = "bool"))
+        elif statistic == "AVG":
+            stat = self.mean
+        elif statistic == "STD":
+            stat = numpy.sqrt(self.M2 / numpy.maximum(self.count, 1))
+        elif statistic == "SUM":
+            stat = self.sum
+        elif statistic == "MIN":
+            stat = self.min
+        elif statistic == "MAX":
+            stat = self.max
+        else:
+            raise Exception("Unknown statistic '{0}', use one of {1}".format(
+                statistic, self.STATISTICS))
+
+        return numpy.ma.masked_array(numpy.where(empty, 0.0, stat), empty)
@@ -4,12 +4,18 @@ __all__ = ["to_numpy"]
 
 from is_rast import is_rast
 from metadata import metadata
+from io_backend import get_io_backend
 
 import os
-import arcpy
 import numpy
 
-def to_numpy(raster, numpy_datatype = None):
+try:
+    import arcpy
+except ImportError:
+    arcpy = None
+
+
+def to_numpy(raster, numpy_datatype = None, backend = None, window = None):
 
     """
     Wrapper for arcpy.RasterToNumpyArray with better metadata handling
@@ -19,15 +25,69 @@ def to_numpy(raster, numpy_datatype = None):
     to save the raster after desired manipulations have been performed.
     also see raster.from_numpy function in this module.
 
+    When the "gdal" io backend is in use, the raster is read directly with gdal
+    instead, and no ArcGIS licence is required. See ``raster.set_io_backend``.
+
     :param raster:         Any raster supported by the arcpy.RasterToNumPyArray function
     :param numpy_datatype: must be a string equal to any of the types listed at the following
                            address [http://docs.scipy.org/doc/numpy/user/basics.types.html]
                            for example: 'uint8' or 'int32' or 'float32'
+    :param backend:        either "arcpy" or "gdal" to override the default io backend
+                           set with ``raster.set_io_backend``
+    :param window:         optional (xoff, yoff, xsize, ysize) tuple of pixel offsets from the
+                           upper left corner and size of a window to read instead of
+                           the whole raster. The returned metadata describes just that window.
 
     :return numpy_rast:   the numpy array version of the input raster
     :return Metadata:     a metadata object. see ``raster.metadata``
     """
 
+    if get_io_backend(backend) == "gdal":
+        from _gdal_io import _gdal_to_numpy
+        numpy_rast, meta = _gdal_to_numpy(raster, window)
+    else:
+        numpy_rast, meta = _arcpy_to_numpy(raster, window)
+
+    if isinstance(meta, list):
+        NoData_Value = meta[0].NoData_Value
+        if numpy_datatype is None:
+            numpy_datatype = meta[0].numpy_datatype
+    else:
+        NoData_Value = meta.NoData_Value
+        if numpy_datatype is None:
+            numpy_datatype = meta.numpy_datatype
+
+    numpy_rast = _mask_nodata(numpy_rast, NoData_Value, numpy_datatype)
+
+    return numpy_rast, meta
+
+
+def _mask_nodata(numpy_rast, NoData_Value, numpy_datatype):
+    """
+    converts a raw array to a masked array of numpy_datatype with NoData_Value masked
+    """
+
+    numpy_rast = numpy_rast.astype(numpy_datatype)
+
+    # mask NoData values from the array
+    if 'float' in numpy_datatype:
+        numpy_rast[numpy_rast == NoData_Value] = numpy.nan
+        numpy_rast = numpy.ma.masked_array(numpy_rast, numpy.isnan(numpy_rast),
+                                           dtype = numpy_datatype)
+
+    elif 'int' in numpy_datatype: # (numpy.nan not supported by ints)
+        mask = (numpy_rast == NoData_Value)
+        numpy_rast = numpy.ma.masked_array(numpy_rast, mask,
+                                           dtype = numpy_datatype)
+
+    return numpy_rast
+
+
+def _arcpy_to_numpy(raster, window = None):
+    """
+    reads a raster and its metadata with arcpy, see ``to_numpy``
+    """
+
     # perform some checks to convert to supported data format
     if not is_rast(raster):
         try:
@@ -41,8 +101,16 @@ def to_numpy(raster, numpy_datatype = None):
             raise Exception("Raster type could not be recognized")
 
 
-    # read in the raster as a numpy array
-    numpy_rast  = arcpy.RasterToNumPyArray(raster)
+    # read in the raster as a numpy array, or just a window of it
+    if window is None:
+        numpy_rast  = arcpy.RasterToNumPyArray(raster)
+    else:
+        xoff, yoff, wx, wy = window
+        full_meta = metadata(raster, backend = "arcpy")
+        # nudge the corner half a pixel inward so it falls clearly within the window
+        llcorner  = arcpy.Point(full_meta.Xmin + ((xoff + 0.5) * full_meta.cellWidth),
+                                full_meta.Ymax - ((yoff + wy - 0.5) * full_meta.cellHeight))
+        numpy_rast  = arcpy.RasterToNumPyArray(raster, llcorner, wx, wy)
 
     # build metadata for multi band raster
     if len(numpy_rast.shape) == 3:
@@ -51,34 +119,18 @@ def to_numpy(raster, numpy_datatype = None):
 
         for i in range(zs):
             bandpath = raster + "\\Band_{0}".format(i+1)
-            meta.append(metadata(bandpath, xs, ys))
-
-        if numpy_datatype is None:
-            numpy_datatype = meta[0].numpy_datatype
-
+            if window is None:
+                meta.append(metadata(bandpath, xs, ys, backend = "arcpy"))
+            else:
+                meta.append(metadata(bandpath, backend = "arcpy").window(*window))
 
     # build metadata for single band raster
     else:
         ys, xs  = numpy_rast.shape
-        meta  = metadata(raster, xs, ys)
-
-        if numpy_datatype is None:
-            numpy_datatype = meta.numpy_datatype
-
-    numpy_rast = numpy_rast.astype(numpy_datatype)
-
-    # mask NoData values from the array
-    if 'float' in numpy_datatype:
-        numpy_rast[numpy_rast == meta.NoData_Value] = numpy.nan
-        numpy_rast = numpy.ma.masked_array(numpy_rast, numpy.isnan(numpy_rast),
-                                           dtype = numpy_datatype)
-
-    elif 'int' in numpy_datatype: # (numpy.nan not supported by ints)
-        mask = numpy.zeros(numpy_rast.shape)
-        mask[numpy_rast != meta.NoData_Value] = False    # do not mask
-        mask[numpy_rast == meta.NoData_Value] = True     # mask
-        numpy_rast = numpy.ma.masked_array(numpy_rast, mask,
-                                           dtype = numpy_datatype)
+        if window is None:
+            meta  = metadata(raster, xs, ys, backend = "arcpy")
+        else:
+            meta  = full_meta.window(*window)
 
     return numpy_rast, meta
 
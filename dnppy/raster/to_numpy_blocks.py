@@ -0,0 +1,99 @@
+__author__ = "jwely"
+__all__ = ["to_numpy_blocks"]
+
+
+from metadata import metadata
+from to_numpy import _mask_nodata
+from _gdal_io import _require_gdal
+
+try:
+    import gdal
+except ImportError:
+    gdal = None
+
+
+# default approximate number of pixels to read in each window
+WINDOW_PIXELS = 2 ** 20
+
+
+def to_numpy_blocks(raster, numpy_datatype = None, window_pixels = WINDOW_PIXELS):
+    """
+    Streaming version of ``to_numpy`` that reads a raster one window at a time
+
+    Large rasters may not fit in memory all at once. This generator reads a single
+    band raster with gdal in windows that are aligned to the native block structure
+    of the file (tiles or strips), so each read touches as few blocks as possible.
+    Each window is yielded as a masked numpy array along with a metadata object
+    describing just that window, so memory use stays constant no matter how large
+    the input raster is. Use with ``raster.block_writer`` to save outputs one
+    window at a time.
+
+    :param raster:          filepath to any single band raster readable by gdal
+    :param numpy_datatype:  must be a string equal to any of the types listed at the following
+                            address [http://docs.scipy.org/doc/numpy/user/basics.types.html]
+                            for example: 'uint8' or 'int32' or 'float32'
+    :param window_pixels:   approximate number of pixels to read at a time. Windows are
+                            always a whole number of native blocks, so they may be larger.
+
+    :return generator:      yields (numpy_rast, meta) tuples, where numpy_rast is a masked
+                            array of one window, and meta is a metadata object with Xsize,
+                            Ysize, Xmin, Ymin, Xmax and Ymax for that window, plus
+                            xoff and yoff pixel offsets of the window within the raster.
+
+    Usage example
+
+    .. code-block:: python
+
+        meta = raster.metadata(inpath, backend = "gdal")
+        writer = raster.block_writer(outpath, meta, "float32")
+
+        for block, block_meta in raster.to_numpy_blocks(inpath, "float32"):
+            writer.write(block * 0.02, block_meta)
+
+        writer.close()
+    """
+
+    _require_gdal()
+    dataset = gdal.Open(raster)
+    if dataset is None:
+        raise Exception("Raster '{0}' could not be opened with gdal".format(raster))
+
+    band = dataset.GetRasterBand(1)
+    meta = metadata(raster, dataset.RasterXSize, dataset.RasterYSize, backend = "gdal")
+
+    if numpy_datatype is None:
+        numpy_datatype = meta.numpy_datatype
+
+    for xoff, yoff, wx, wy in _block_windows(band, window_pixels):
+
+        numpy_rast = band.ReadAsArray(xoff, yoff, wx, wy)
+        numpy_rast = _mask_nodata(numpy_rast, meta.NoData_Value, numpy_datatype)
+
+        yield numpy_rast, meta.window(xoff, yoff, wx, wy)
+
+    del band
+    del dataset
+
+
+def _block_windows(band, window_pixels = WINDOW_PIXELS):
+    """
+    Returns a list of (xoff, yoff, xsize, ysize) windows that cover a gdal band.
+    Windows are built from whole native blocks, first grouped along rows
+    then stacked down columns, until they hold about window_pixels.
+    """
+
+    xs = band.XSize
+    ys = band.YSize
+    bx, by = band.GetBlockSize()
+
+    blocks_across = (xs + bx - 1) // bx
+    nbx = max(1, min(blocks_across, window_pixels // (bx * by)))
+    wx = nbx * bx
+    wy = max(1, window_pixels // (wx * by)) * by
+
+    windows = []
+    for yoff in range(0, ys, wy):
+        for xoff in range(0, xs, wx):
+            windows.append((xoff, yoff, min(wx, xs - xoff), min(wy, ys - yoff)))
+
+    return windows
@@ -10,6 +10,12 @@ computation and improved accuracy when scene-center calculations are insufficien
 yet capable of ingesting digital elevation models to calculate slope and aspect dependent parameters, but
 it is a planned addition.
 
+For many datetimes at once, such as every 15 minutes of a day over a whole scene, the solar_series class
+computes the same quantities with arrays. Terms that only depend on time are computed once for all
+datetimes, terms that only depend on position are computed once for the grid, and per pixel outputs
+may be requested one datetime at a time by index to keep memory use bounded.
+
 .. _common NOAA excel calculator: http://www.esrl.noaa.gov/gmd/grad/solcalc/calcdetails.html
 """
 from solar import solar
+from solar_series import solar_series
@@ -526,7 +526,7 @@ class solar:
             return self.true_solar
         
         if self.equation_of_time is None:
-            self.get_equation_of_time
+            self.get_equation_of_time()
 
         lon = self.lon
         eot = self.equation_of_time
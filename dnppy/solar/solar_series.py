@@ -0,0 +1,490 @@
+__author__ = "Jwely"
+
+from datetime import datetime
+import numpy
+from numpy import radians, sin, cos, degrees, arctan2, arcsin, tan, arccos
+
+
+class solar_series:
+    """
+    Array native version of the ``solar`` class for many datetimes at once.
+
+    Uses the same equations as ``solar``, which follow the excel sheet at this url :
+    [http://www.esrl.noaa.gov/gmd/grad/solcalc/calcdetails.html]. Instead of one
+    object per datetime, a solar_series takes a whole list of datetimes along with
+    scalar or gridded lat/lon values, and is built around three kinds of terms.
+
+        - terms that depend only on time (declination, equation of time, ...) are
+          computed once for every datetime as 1d float64 arrays.
+        - terms that depend only on location (sin and cos of lat and lon) are
+          computed once per grid as arrays of ``dtype``.
+        - terms that depend on both (zenith, elevation, azimuth, ...) combine the
+          two with a few array operations, because the hour angle at any pixel is a
+          time term plus the pixel longitude, so cos(hour_angle) can be expanded
+          into precomputed per time and per pixel products.
+
+    Every get method memoizes its result. Methods that return gridded terms accept
+    an optional ``index`` to compute only the grid for one datetime, which keeps
+    memory use to a few grids for large scenes, for example
+
+    .. code-block:: python
+
+        ss = solar_series(lat_grid, lon_grid, datetimes, time_zone = -4)
+        for i in range(len(datetimes)):
+            zenith = ss.get_zenith(i)       # 2d float32 grid at datetimes[i]
+
+    Without an index, gridded terms for all datetimes are returned as one array
+    with time as the first axis.
+
+    :param lat:             decimal degrees latitude (float OR numpy array)
+    :param lon:             decimal degrees longitude (float OR numpy array)
+    :param date_time_objs:  a list of datetime objects or of timestamp strings following fmt,
+                            or a numpy datetime64 array. A single datetime is also accepted.
+    :param time_zone:       float of time shift from GMT (such as "-5" for EST)
+    :param fmt:             if date_time_objs are strings, fmt is required to interpret them
+    :param dtype:           numpy datetype of gridded outputs, "float32" by default
+    """
+
+    def __init__(self, lat, lon, date_time_objs, time_zone = 0, fmt = False, dtype = "float32"):
+        """
+        Initializes critical spatial and temporal information for solar_series object.
+        """
+
+        self.dtype  = numpy.dtype(dtype)
+        self.lat    = numpy.asarray(lat, dtype = self.dtype)
+        self.lon    = numpy.asarray(lon, dtype = self.dtype)
+        self.shape  = numpy.broadcast(self.lat, self.lon).shape
+        self.tz     = time_zone
+
+        # memoized terms, by name for time terms, by (name, index) for grid terms
+        self.time_terms = {}
+        self.grid_terms = {}
+
+        # Constants as attributes
+        self.sun_surf_rad       = 63156942.6    # radiation at suns surface (W/m^2)
+        self.sun_radius         = 695800000.    # radius of the sun in meters
+
+        self._set_datetimes(date_time_objs, fmt, GMT_hour_offset = time_zone)
+        return
+
+
+    def _set_datetimes(self, date_time_objs, fmt = False, GMT_hour_offset = 0):
+        """
+        sets the critical time information including absolute julian day/century
+        and the fraction of the day for every datetime.
+
+        :param date_time_objs:  list of datetime objects or strings, or datetime64 array
+        :param fmt:             if date_time_objs are strings, fmt allows them to be
+                                interpreted
+        :param GMT_hour_offset: Number of hours from GMT for timezone of calculation area.
+        """
+
+        if isinstance(date_time_objs, (datetime, str)):
+            date_time_objs = [date_time_objs]
+
+        if isinstance(date_time_objs, numpy.ndarray) and date_time_objs.dtype.kind == "M":
+            times = date_time_objs.astype("datetime64[us]")
+
+        elif all(isinstance(dto, datetime) for dto in date_time_objs):
+            times = numpy.array(date_time_objs, dtype = "datetime64[us]")
+
+        elif all(isinstance(dto, str) for dto in date_time_objs) and isinstance(fmt, str):
+            times = numpy.array([datetime.strptime(dto, fmt) for dto in date_time_objs],
+                                dtype = "datetime64[us]")
+        else:
+            raise Exception("bad datetime!")
+
+        # reference datetimes in GMT
+        self.rdt = times - numpy.timedelta64(int(round(GMT_hour_offset * 3600e6)), "us")
+
+        # uses the reference day of january 1st 2000
+        jan_1st_2000_jd   = 2451545
+        jan_1st_2000      = numpy.datetime64("2000-01-01T12:00:00", "us")
+
+        time_del = (self.rdt - jan_1st_2000).astype("int64") / 1e6
+        self.ajd = float(jan_1st_2000_jd) + time_del / 86400
+        self.ajc = (self.ajd - 2451545) / 36525.0
+
+        frac_sec = (self.rdt - self.rdt.astype("datetime64[D]")).astype("int64") / 1e6
+        self.frac_day = (frac_sec / (60 * 60) + self.tz) / 24
+        return
+
+
+    def _time_term(self, name, function):
+        """ memoizes a term that depends only on time """
+
+        if name not in self.time_terms:
+            self.time_terms[name] = function()
+        return self.time_terms[name]
+
+
+    def _grid_term(self, name, index, function):
+        """
+        memoizes a term on the lat/lon grid. Terms for a single index are only
+        kept until a term for a different index is requested.
+        """
+
+        if index is not None and (name, index) not in self.grid_terms:
+            for key in [key for key in self.grid_terms if key[1] not in (None, index)]:
+                del self.grid_terms[key]
+
+        if (name, index) not in self.grid_terms:
+            self.grid_terms[(name, index)] = function(index)
+        return self.grid_terms[(name, index)]
+
+
+    def _at(self, values, index):
+        """
+        selects time terms at one index, or shapes them to broadcast against the grid
+        with time as the first axis if index is None.
+        """
+
+        if index is not None:
+            return values[index]
+        return values.reshape(values.shape + (1,) * len(self.shape)).astype(self.dtype)
+
+
+    def get_geomean_long(self):
+        """ :return geomean_long: geometric mean longitude of the sun"""
+
+        ajc = self.ajc
+        return self._time_term("geomean_long", lambda:
+            (280.46646 + ajc * (36000.76983 + ajc * 0.0003032)) % 360)
+
+
+    def get_geomean_anom(self):
+        """ :return geomean_anom: geometric mean anomoly of the sun """
+
+        ajc = self.ajc
+        return self._time_term("geomean_anom", lambda:
+            357.52911 + ajc * (35999.05029 - 0.0001537 * ajc))
+
+
+    def get_earth_eccent(self):
+        """ :return earth_eccent: precise eccentricity of earths orbit at each datetime """
+
+        ajc = self.ajc
+        return self._time_term("earth_eccent", lambda:
+            0.016708634 - ajc * (4.2037e-5 + 1.267e-7 * ajc))
+
+
+    def get_sun_eq_of_center(self):
+        """ :return sun_eq_of_center: the suns equation of center"""
+
+        def function():
+            ajc = self.ajc
+            gma = radians(self.get_geomean_anom())
+
+            return sin(gma) * (1.914602 - ajc * (0.004817 + 0.000014 * ajc)) + \
+                   sin(2 * gma) * (0.019993 - 0.000101 * ajc) + \
+                   sin(3 * gma) * 0.000289
+
+        return self._time_term("sun_eq_of_center", function)
+
+
+    def get_true_long(self):
+        """ :return true_long: the true longitude of the sun"""
+
+        return self._time_term("true_long", lambda:
+            self.get_geomean_long() + self.get_sun_eq_of_center())
+
+
+    def get_true_anom(self):
+        """ :return true_anom: the true anomaly of the sun"""
+
+        return self._time_term("true_anom", lambda:
+            self.get_geomean_anom() + self.get_sun_eq_of_center())
+
+
+    def get_rad_vector(self):
+        """ :return rad_vector: incident radiation vector to surface at each datetime (AUs)"""
+
+        def function():
+            ec = self.get_earth_eccent()
+            ta = radians(self.get_true_anom())
+            return (1.000001018 * (1 - ec ** 2)) / (1 + ec * cos(ta))
+
+        return self._time_term("rad_vector", function)
+
+
+    def get_app_long(self):
+        """ :return app_long: apparent longitude of the sun"""
+
+        return self._time_term("app_long", lambda:
+            self.get_true_long() - 0.00569 - 0.00478 * sin(radians(125.04 - 1934.136 * self.ajc)))
+
+
+    def get_oblique_mean_elip(self):
+        """ :return oblique_mean_elip: oblique mean elliptic of earth orbit """
+
+        ajc = self.ajc
+        return self._time_term("oblique_mean_elip", lambda:
+            23 + (26 + (21.448 - ajc * (46.815 + ajc * (0.00059 - ajc * 0.001813))) / 60) / 60)
+
+
+    def get_oblique_corr(self):
+        """ :return oblique_corr:  the oblique correction """
+
+        return self._time_term("oblique_corr", lambda:
+            self.get_oblique_mean_elip() + 0.00256 * cos(radians(125.04 - 1934.136 * self.ajc)))
+
+
+    def get_right_ascension(self):
+        """ :return right_ascension: the suns right ascension angle """
+
+        def function():
+            sal = radians(self.get_app_long())
+            oc  = radians(self.get_oblique_corr())
+            return degrees(arctan2(cos(oc) * sin(sal), cos(sal)))
+
+        return self._time_term("right_ascension", function)
+
+
+    def get_declination(self):
+        """ :return declination: solar declination angle at each datetime"""
+
+        def function():
+            sal = radians(self.get_app_long())
+            oc  = radians(self.get_oblique_corr())
+            return degrees(arcsin(sin(oc) * sin(sal)))
+
+        return self._time_term("declination", function)
+
+
+    def get_equation_of_time(self):
+        """ :return equation_of_time: the equation of time in minutes """
+
+        def function():
+            oc  = radians(self.get_oblique_corr())
+            gml = radians(self.get_geomean_long())
+            gma = radians(self.get_geomean_anom())
+            ec  = self.get_earth_eccent()
+
+            vary = tan(oc / 2) ** 2
+
+            return 4 * degrees(vary * sin(2 * gml) - 2 * ec * sin(gma) +
+                               4 * ec * vary * sin(gma) * cos(2 * gml) -
+                               0.5 * vary * vary * sin(4 * gml) -
+                               1.25 * ec * ec * sin(2 * gma))
+
+        return self._time_term("equation_of_time", function)
+
+
+    def get_earth_distance(self):
+        """ :return earth_distance: distance between the earth and the sun at each datetime """
+
+        return self._time_term("earth_distance", lambda:
+            self.get_rad_vector() * 149597870700)
+
+
+    def get_norm_irradiance(self):
+        """ :return norm_irradiance: the normal irradiance in W/m^2 at each datetime """
+
+        return self._time_term("norm_irradiance", lambda:
+            self.sun_surf_rad * (self.sun_radius / self.get_earth_distance()) ** 2)
+
+
+    def _get_hour_angle_base(self):
+        """
+        the part of the hour angle (deg) that depends only on time. The hour angle
+        at any location is this value plus the longitude of that location.
+        """
+
+        return self._time_term("hour_angle_base", lambda:
+            (self.frac_day * 1440 + self.get_equation_of_time() - 60 * self.tz) / 4 - 180)
+
+
+    def _get_lat_lon_terms(self):
+        """
+        sin and cos of lat and lon on the grid, along with the products cos(lat)cos(lon)
+        and cos(lat)sin(lon) used to expand cos(hour_angle). computed once.
+        """
+
+        def function(index):
+            lat_r = radians(self.lat)
+            lon_r = radians(self.lon)
+
+            terms = {"sin_lat": sin(lat_r),
+                     "cos_lat": cos(lat_r),
+                     "sin_lon": sin(lon_r),
+                     "cos_lon": cos(lon_r)}
+
+            terms["cos_lat_cos_lon"] = terms["cos_lat"] * terms["cos_lon"]
+            terms["cos_lat_sin_lon"] = terms["cos_lat"] * terms["sin_lon"]
+            return terms
+
+        return self._grid_term("lat_lon", None, function)
+
+
+    def get_cos_zenith(self, index = None):
+        """
+        :param index:           index of a single datetime, or None for all of them
+        :return cos_zenith:     cosine of the solar zenith angle
+        """
+
+        def function(index):
+            ll  = self._get_lat_lon_terms()
+            d   = radians(self._at(self.get_declination(), index))
+            hab = radians(self._at(self._get_hour_angle_base(), index))
+
+            # with cos(hour_angle) = cos(hab)cos(lon) - sin(hab)sin(lon)
+            cos_z  = sin(d) * ll["sin_lat"]
+            cos_z += (cos(d) * cos(hab)) * ll["cos_lat_cos_lon"]
+            cos_z -= (cos(d) * sin(hab)) * ll["cos_lat_sin_lon"]
+            return numpy.clip(cos_z, -1, 1, out = cos_z).astype(self.dtype, copy = False)
+
+        return self._grid_term("cos_zenith", index, function)
+
+
+    def get_sin_zenith(self, index = None):
+        """
+        :param index:           index of a single datetime, or None for all of them
+        :return sin_zenith:     sine of the solar zenith angle
+        """
+
+        def function(index):
+            cos_z = self.get_cos_zenith(index)
+            return numpy.sqrt(1 - cos_z * cos_z).astype(self.dtype, copy = False)
+
+        return self._grid_term("sin_zenith", index, function)
+
+
+    def get_hour_angle(self, index = None):
+        """
+        :param index:           index of a single datetime, or None for all of them
+        :return hour_angle:     hour angle (deg) between -180 and 180
+        """
+
+        def function(index):
+            hab = self._at(self._get_hour_angle_base(), index)
+            return ((hab + self.lon + 180) % 360 - 180).astype(self.dtype, copy = False)
+
+        return self._grid_term("hour_angle", index, function)
+
+
+    def get_zenith(self, index = None):
+        """
+        :param index:           index of a single datetime, or None for all of them
+        :return zenith:         solar zenith angle (deg)
+        """
+
+        return self._grid_term("zenith", index, lambda index:
+            degrees(arccos(self.get_cos_zenith(index))).astype(self.dtype, copy = False))
+
+
+    def get_elevation(self, index = None):
+        """
+        solar elevation angle with an approximate atmospheric refraction correction
+
+        :param index:           index of a single datetime, or None for all of them
+        :return elevation:      solar elevation angle (deg)
+        """
+
+        def function(index):
+            e = 90 - self.get_zenith(index)
+
+            # 1 / tan(elevation) is tan(zenith)
+            with numpy.errstate(divide = "ignore", invalid = "ignore", over = "ignore"):
+                ti = self.get_sin_zenith(index) / self.get_cos_zenith(index)
+                t2 = ti * ti
+                ar = ti * (58.1 + t2 * (-0.07 + 0.000086 * t2))
+
+            ar[e > 85] = 0
+
+            low = e <= 5
+            if low.any():
+                el = e[low]
+                ar[low] = numpy.where(el > -0.575, 1735 + el * (103.4 + el * (-12.79 + el * 0.711)),
+                                      -20.772 * ti[low])
+
+            return (e + ar / 3600).astype(self.dtype, copy = False)
+
+        return self._grid_term("elevation", index, function)
+
+
+    def get_azimuth(self, index = None):
+        """
+        :param index:           index of a single datetime, or None for all of them
+        :return azimuth:        solar azimuth angle (deg), clockwise from north
+        """
+
+        def function(index):
+            ll  = self._get_lat_lon_terms()
+            d   = radians(self._at(self.get_declination(), index))
+            hab = radians(self._at(self._get_hour_angle_base(), index))
+
+            # sin(hour_angle) = sin(hab)cos(lon) + cos(hab)sin(lon)
+            sin_ha  = sin(hab) * ll["cos_lon"]
+            sin_ha += cos(hab) * ll["sin_lon"]
+
+            with numpy.errstate(divide = "ignore", invalid = "ignore"):
+                cos_az  = ll["sin_lat"] * self.get_cos_zenith(index)
+                cos_az -= sin(d)
+                cos_az /= ll["cos_lat"] * self.get_sin_zenith(index)
+            numpy.clip(cos_az, -1, 1, out = cos_az)
+
+            az = degrees(arccos(cos_az))
+            az = numpy.where(sin_ha > 0, 180 + az, 180 - az)
+            az[az >= 360] -= 360
+            return az.astype(self.dtype, copy = False)
+
+        return self._grid_term("azimuth", index, function)
+
+
+    def get_hour_angle_sunrise(self, index = None):
+        """
+        :param index:               index of a single datetime, or None for all of them
+        :return hour_angle_sunrise: the hour angle of sunrise (deg)
+        """
+
+        def function(index):
+            ll = self._get_lat_lon_terms()
+            d  = radians(self._at(self.get_declination(), index))
+
+            return degrees(arccos(cos(radians(90.833)) / (ll["cos_lat"] * cos(d)) -
+                                  (ll["sin_lat"] / ll["cos_lat"]) * tan(d))).astype(self.dtype)
+
+        return self._grid_term("hour_angle_sunrise", index, function)
+
+
+    def get_solar_noon(self, index = None):
+        """
+        :param index:           index of a single datetime, or None for all of them
+        :return solar_noon:     solar noon in fractional days (local sidereal time LST)
+        """
+
+        def function(index):
+            eot = self._at(self.get_equation_of_time(), index)
+            return ((720 - 4 * self.lon - eot + self.tz * 60) / 1440).astype(self.dtype)
+
+        return self._grid_term("solar_noon", index, function)
+
+
+    def get_sunrise(self, index = None):
+        """
+        :param index:           index of a single datetime, or None for all of them
+        :return sunrise:        time of sunrise in fractional days (LST)
+        """
+
+        return self._grid_term("sunrise", index, lambda index:
+            (self.get_solar_noon(index) - self.get_hour_angle_sunrise(index) * 4 / 1440).astype(self.dtype))
+
+
+    def get_sunset(self, index = None):
+        """
+        :param index:           index of a single datetime, or None for all of them
+        :return sunset:         time of sunset in fractional days (LST)
+        """
+
+        return self._grid_term("sunset", index, lambda index:
+            (self.get_solar_noon(index) + self.get_hour_angle_sunrise(index) * 4 / 1440).astype(self.dtype))
+
+
+    def get_sunlight(self, index = None):
+        """
+        :param index:           index of a single datetime, or None for all of them
+        :return sunlight:       amount of daily sunlight in fractional days
+        """
+
+        return self._grid_term("sunlight", index, lambda index:
+            (8 * self.get_hour_angle_sunrise(index) / (60 * 24)).astype(self.dtype))
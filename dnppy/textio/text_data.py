@@ -2,6 +2,103 @@
 __author__ = ["Jwely"]
 
 import json
+import numpy
+
+
+def typed_columns(headers, row_data):
+    """
+    Converts row wise text data into typed numpy columns with a shared validity mask.
+
+    Each column is stored as an int64 array if its values are integers, a float64
+    array if they are other numbers, or a string array otherwise. A column is
+    considered numeric if more than half of its entries can be read as numbers.
+    Entries in numeric columns that cannot be read as numbers (such as "***") are
+    set to zero and marked invalid in the mask. Columns with numbers that would not be
+    written back the same way, such as "0054" or "1.50", are kept as strings, so that
+    they can still be read as times and are saved unchanged by ``to_csv``.
+
+    :param headers:     list of column headers
+    :param row_data:    list of rows, where each row is a list of strings
+
+    :return col_data:   dict of {header: numpy array}
+    :return col_valid:  2d numpy boolean array with one row for each data row and
+                        one column for each header, in header order. True where
+                        the entry is a valid value.
+    """
+
+    num_rows = len(row_data)
+    col_data = {}
+    col_valid = numpy.ones((num_rows, len(headers)), dtype = "bool")
+
+    for i, header in enumerate(headers):
+        values = [row[i] for row in row_data]
+        col_data[header], col_valid[:, i] = _typed_column(values)
+
+    return col_data, col_valid
+
+
+def _typed_column(values):
+    """
+    converts a list of strings to a typed numpy array and a validity mask,
+    see ``typed_columns``
+    """
+
+    ints   = numpy.zeros(len(values), dtype = "int64")
+    floats = numpy.zeros(len(values), dtype = "float64")
+    valid  = numpy.zeros(len(values), dtype = "bool")
+    is_int = True
+    padded = False      # an integer string that does not survive a round trip, such as "0054"
+    inexact = False     # a number string that is not written the same way as a float, such as "1.50"
+
+    for j, value in enumerate(values):
+        if not isinstance(value, str):
+            value = str(value)
+        try:
+            floats[j] = float(value)
+            valid[j] = True
+        except ValueError:
+            continue
+
+        inexact = inexact or str(float(value)) != value.strip()
+        try:
+            integer = int(value)
+            if is_int:
+                ints[j] = integer
+            padded = padded or str(integer) != value.strip()
+        except ValueError:
+            is_int = False
+
+    # columns which are mostly not numbers, or have numbers that would be written back
+    # differently, are left as text
+    if valid.sum() * 2 <= len(values) or padded or (inexact and not is_int):
+        return numpy.array([str(value) for value in values]), numpy.ones(len(values), dtype = "bool")
+
+    if is_int:
+        return ints, valid
+    else:
+        return floats, valid
+
+
+def columnar_row(headers, col_data, col_valid, index):
+    """
+    Builds a single row list out of typed columns, the reverse of ``typed_columns``
+    for one row. Values that are not valid are returned as empty strings.
+
+    :param headers:     list of column headers
+    :param col_data:    dict of {header: numpy array}
+    :param col_valid:   2d numpy boolean validity mask, see ``typed_columns``
+    :param index:       integer index of the row to build
+
+    :return row:        list of values in header order
+    """
+
+    row = []
+    for i, header in enumerate(headers):
+        if col_valid[index, i]:
+            row.append(col_data[header][index].item())
+        else:
+            row.append("")
+    return row
 
 
 class text_data():
@@ -9,24 +106,96 @@ class text_data():
     A text data object is a very simple template structure for passing
     text type data (usually lists of weather or climate data entries)
     around between functions.
+
+    Text data is normally stored as a list of rows in ``row_data``. Large datasets
+    may instead be stored in columnar mode (see ``to_columnar``), where each header
+    in ``col_data`` maps to a typed numpy array, and ``col_valid`` is a shared mask
+    of valid entries. In columnar mode ``row_data`` is None, but rows may still
+    be accessed with ``text_data_object[index]``.
+
+    :param headers:     list of column headers
+    :param row_data:    list of rows, where each row is a list of values
+    :param columnar:    set True to store the data in columnar mode
     """
 
-    def __init__(self, headers = None, row_data = None):
+    columnar    = False     # class level defaults for subclasses with their own __init__
+    col_valid   = None
+
+    def __init__(self, headers = None, row_data = None, columnar = False):
 
         self.headers        = headers           # headers   (1d list)
         self.row_data       = row_data          # data      (2d list)
         self.col_data       = {}                # column wise data (dict)
+        self.col_valid      = None              # validity mask in columnar mode (2d numpy bool)
+        self.columnar       = False             # True if data is stored in columnar mode
 
         if row_data is not None:
             self._build_col_data()
 
+            if columnar:
+                self.to_columnar()
+
 
     def __getitem__(self, index):
         """ used to return row data when using __getitem__ on this object type """
 
+        if self.columnar:
+            if isinstance(index, slice):
+                return [self._row(i) for i in range(*index.indices(self._num_rows()))]
+            return self._row(index)
+
         return self.row_data[index]
 
 
+    def _num_rows(self):
+        """ returns the number of rows of data """
+
+        if self.columnar:
+            if not self.headers:
+                return 0
+            return len(self.col_data[self.headers[0]])
+
+        return len(self.row_data)
+
+
+    def _row(self, index):
+        """
+        builds a single row list out of columnar data, with values that are
+        not valid returned as empty strings
+        """
+
+        return columnar_row(self.headers, self.col_data, self.col_valid, index)
+
+
+    def to_columnar(self):
+        """
+        Converts this text data object to columnar mode. Each column is converted to
+        a typed numpy array, and invalid entries are tracked with a shared mask in
+        ``col_valid``, see ``typed_columns``. The list of row lists is discarded to
+        save memory. Invalid entries in numeric columns (such as "***") will be written
+        as empty strings by ``write_csv``.
+        """
+
+        if not self.columnar:
+            self.col_data, self.col_valid = typed_columns(self.headers, self.row_data)
+            self.row_data = None
+            self.columnar = True
+        return
+
+
+    def to_rows(self):
+        """
+        Converts this text data object from columnar mode back to a list of row lists
+        """
+
+        if self.columnar:
+            self._build_row_data()
+            self.columnar = False
+            self.col_valid = None
+            self._build_col_data()
+        return
+
+
     @staticmethod
     def _enf_unique_headers(headers):
         """ Appends digits to duplicate items in a list. Used to ensure each
@@ -63,6 +232,9 @@ class text_data():
         in that column from the top down.
         """
 
+        if self.columnar:
+            return self.col_data
+
         temp_col = zip(*self.row_data)
 
         self.col_data = {}
@@ -79,6 +251,10 @@ class text_data():
 
         num_rows = len(self.col_data[self.headers[0]])
 
+        if self.columnar:
+            self.row_data = [self._row(i) for i in range(num_rows)]
+            return
+
         temp_rows = []
         for i in range(num_rows):
             temp_rows.append([self.col_data[header][i] for header in self.headers])
@@ -99,7 +275,12 @@ class text_data():
             if self.headers:
                 f.write(delim.join(self.headers) + '\n')
 
-            for row in self.row_data:
+            if self.columnar:
+                rows = (self._row(i) for i in range(self._num_rows()))
+            else:
+                rows = self.row_data
+
+            for row in rows:
                 row = map(str,row)
                 entry = delim.join(row) + '\n'
                 f.write(entry)
@@ -108,7 +289,7 @@ class text_data():
         return
 
 
-    def read_csv(self, text_filepath, delim = ',', has_headers = True):
+    def read_csv(self, text_filepath, delim = ',', has_headers = True, columnar = False):
         """
         simple default reader of a delimited file. Does not read fixed-width
 
@@ -116,6 +297,8 @@ class text_data():
         :param delim:               delimiter to use, defaults to comma
         :param has_headers:         Set "False" if csv file has no headers
                                     (this is bad, you should give your file headers)
+        :param columnar:            Set True to store the data in columnar mode,
+                                    see ``to_columnar``
         """
 
         with open(text_filepath, 'r+') as f:
@@ -136,6 +319,10 @@ class text_data():
                     entry = line.replace('\n','').split(delim)
                     self.row_data.append(entry)
         f.close()
+
+        self.columnar = False
+        if columnar:
+            self.to_columnar()
         return
 
 
@@ -154,9 +341,12 @@ class text_data():
 
         # structures json data
         if row_wise:
-            json_dict = [self.headers] + self.row_data
+            json_dict = [self.headers] + self[0:self._num_rows()]
         elif col_wise:
             json_dict = self._build_col_data()
+            if self.columnar:
+                json_dict = dict((header, [row[i] for row in self[0:self._num_rows()]])
+                                 for i, header in enumerate(self.headers))
         else:
             raise ValueError("Either 'row_wise' or 'col_wise' args must be set to True!")
 
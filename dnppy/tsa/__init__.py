@@ -12,5 +12,6 @@ __author__ = ["Jwely"]
 # local imports
 from time_series import *
 from rast_series import *
+from parse_times import *
 
 
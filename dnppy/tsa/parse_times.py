@@ -0,0 +1,176 @@
+__author__ = "Jwely"
+__all__ = ["parse_times", "time_keys"]
+
+# standard imports
+import numpy
+from datetime import datetime
+
+
+# number of characters in each zero padded directive that may be parsed in bulk
+FIXED_WIDTHS = {"%Y": 4, "%m": 2, "%d": 2, "%j": 3, "%H": 2, "%M": 2, "%S": 2}
+
+
+def parse_times(time_strings, fmt):
+    """
+    Converts a list of time strings into a numpy datetime64[us] array
+
+    Formats made up of only zero padded directives (%Y, %m, %d, %j, %H, %M, %S) and
+    literal characters, such as ``"%Y%m%d%H%M"``, ``"%Y%j"`` or ISO ``"%Y-%m-%dT%H:%M:%S"``,
+    are parsed all at once with numpy arithmetic on the characters of the strings.
+    Any other format, or any list of strings that does not exactly fit the fixed width
+    layout, is parsed with ``datetime.strptime``, calling it only once for each unique string.
+
+    :param time_strings:    list or numpy array of time strings
+    :param fmt:             the fmt string to interpret time strings into datetime objects, see
+                            [https://docs.python.org/2/library/datetime.html#strftime-strptime-behavior]
+
+    :return time_us:        numpy datetime64[us] array of times
+    """
+
+    time_us = _parse_fixed(time_strings, fmt)
+    if time_us is not None:
+        return time_us
+
+    # memoized strptime for all other formats
+    parsed  = {}
+    time_us = numpy.empty(len(time_strings), dtype = "datetime64[us]")
+
+    for i, time_string in enumerate(time_strings):
+        if time_string not in parsed:
+            parsed[time_string] = numpy.datetime64(datetime.strptime(time_string, fmt), "us")
+        time_us[i] = parsed[time_string]
+
+    return time_us
+
+
+def time_keys(time_us, fmt):
+    """
+    Returns ``int(datetime_obj.strftime(fmt))`` for every time in an array, such as
+    the year, month or julian day used to group rows together in ``time_series.group_bins``.
+    Keys for single directives are computed all at once with numpy.
+
+    :param time_us:     numpy datetime64 array, or int64 array of microseconds since 1970
+    :param fmt:         a fmt string that formats times into integers, such as "%j"
+
+    :return keys:       numpy int64 array of keys
+    """
+
+    times = numpy.asarray(time_us).astype("datetime64[us]")
+
+    if fmt == "%Y":
+        return times.astype("datetime64[Y]").astype("int64") + 1970
+    if fmt == "%m":
+        return times.astype("datetime64[M]").astype("int64") % 12 + 1
+    if fmt == "%d":
+        return (times.astype("datetime64[D]") - times.astype("datetime64[M]")).astype("int64") + 1
+    if fmt == "%j":
+        return (times.astype("datetime64[D]") - times.astype("datetime64[Y]")).astype("int64") + 1
+
+    seconds = (times - times.astype("datetime64[D]")).astype("timedelta64[s]").astype("int64")
+    if fmt == "%H":
+        return seconds // 3600
+    if fmt == "%M":
+        return (seconds // 60) % 60
+    if fmt == "%S":
+        return seconds % 60
+
+    # memoized strftime for all other formats
+    formatted = {}
+    keys = numpy.empty(len(times), dtype = "int64")
+
+    for i, time in enumerate(times.astype("int64")):
+        if time not in formatted:
+            dto = numpy.datetime64(time, "us").astype(datetime)
+            formatted[time] = int(dto.strftime(fmt))
+        keys[i] = formatted[time]
+
+    return keys
+
+
+def _fixed_layout(fmt):
+    """
+    Splits a fmt string into (directive or literal, offset, width) fields, or
+    returns None if the fmt contains directives that are not of fixed width.
+    """
+
+    layout = []
+    offset = 0
+    i = 0
+
+    while i < len(fmt):
+        if fmt[i] == "%":
+            directive = fmt[i:i + 2]
+
+            if directive == "%%":
+                layout.append(("%", offset, 1))
+                offset += 1
+            elif directive in FIXED_WIDTHS and directive not in [field[0] for field in layout]:
+                layout.append((directive, offset, FIXED_WIDTHS[directive]))
+                offset += FIXED_WIDTHS[directive]
+            else:
+                return None
+            i += 2
+
+        else:
+            layout.append((fmt[i], offset, 1))
+            offset += 1
+            i += 1
+
+    return layout, offset
+
+
+def _parse_fixed(time_strings, fmt):
+    """
+    Parses time strings of a fixed width layout with numpy, or returns None if the
+    strings do not fit the layout, or hold values that strptime should judge.
+    """
+
+    layout = _fixed_layout(fmt)
+    if layout is None or len(time_strings) == 0:
+        return None
+    layout, width = layout
+
+    directives = [field[0] for field in layout]
+    if "%j" in directives and ("%m" in directives or "%d" in directives):
+        return None
+
+    try:
+        strings = numpy.ascontiguousarray(numpy.asarray(time_strings).astype("S"))
+    except (UnicodeError, ValueError):
+        return None
+
+    if strings.ndim != 1 or strings.dtype.itemsize != width:
+        return None
+
+    chars = strings.view("uint8").reshape(len(strings), width)
+
+    values = {"%Y": 1900, "%m": 1, "%d": 1, "%j": None, "%H": 0, "%M": 0, "%S": 0}
+    for field, offset, size in layout:
+
+        if field in FIXED_WIDTHS:
+            digits = chars[:, offset:offset + size].astype("int64") - ord("0")
+            if ((digits < 0) | (digits > 9)).any():
+                return None
+            values[field] = digits.dot(10 ** numpy.arange(size - 1, -1, -1))
+
+        elif not (chars[:, offset] == ord(field)).all():
+            return None
+
+    year   = values["%Y"] * numpy.ones(len(strings), dtype = "int64")
+    years  = (year - 1970).astype("datetime64[Y]")
+
+    if values["%j"] is not None:
+        days = years.astype("datetime64[D]") + (values["%j"] - 1).astype("timedelta64[D]")
+        valid = (values["%j"] >= 1) & (days.astype("datetime64[Y]") == years)
+    else:
+        months = years.astype("datetime64[M]") + numpy.asarray(values["%m"] - 1).astype("timedelta64[M]")
+        days   = months.astype("datetime64[D]") + numpy.asarray(values["%d"] - 1).astype("timedelta64[D]")
+        valid  = ((values["%m"] >= 1) & (values["%m"] <= 12) &
+                  (values["%d"] >= 1) & (days.astype("datetime64[M]") == months))
+
+    valid &= (year >= 1) & (values["%H"] < 24) & (values["%M"] < 60) & (values["%S"] < 60)
+    if not numpy.all(valid):
+        return None
+
+    seconds = (values["%H"] * 60 + values["%M"]) * 60 + values["%S"]
+    return days.astype("datetime64[us]") + numpy.asarray(seconds * 1000000).astype("timedelta64[us]")
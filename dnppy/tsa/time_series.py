@@ -2,6 +2,7 @@ __author__ = "Jwely"
 
 # local imports
 from dnppy import textio
+from parse_times import parse_times, time_keys
 
 # standard imports
 import numpy
@@ -32,9 +33,22 @@ class time_series():
     time series, where the steps of the method depend on weather the time
     series is at its smallest subset or not.
 
-    MEMORY WARNING. The entirety of the dataset is represented in every layer
-    of subsetting, so watch out for exploding memory consumption by
-    excessive subsetting of gigantic datasets.
+    Subsets are lightweight views of their parent. Each one holds only a reference
+    to its parent and the indices of its rows there, and builds its data and time
+    attributes from the parent the first time they are accessed, so deeply nested
+    subsetting costs little more than the index arrays. Time strings are never
+    re-parsed for subsets. A subset copies its rows from the parent only when it
+    is modified on its own, such as by ``normalize``.
+
+    Earlier versions copied the row lists of subsets, but shared each row with the
+    parent, so ``normalize`` and ``merge_cols`` on a subsetted time_series changed
+    the rows of subsets a second time. Each row is now changed once, so results of
+    these methods on subsets differ from those versions.
+
+    Large datasets may be stored in columnar mode with ``to_columnar``, where each
+    header in ``col_data`` maps to a typed numpy array and ``col_valid`` is a shared
+    mask of valid entries. Column operations then run on numpy arrays instead of
+    lists of rows. Rows are still available with ``time_series_object[index]``.
     """
 
     def __init__(self, name = "name", units = None, subsetted = False,
@@ -54,15 +68,22 @@ class time_series():
             self.time_col       # index of data column with time info
             self.time           # separate copy of data[time_col]
             self.time_dom       # self.time converted to list of datetime objs
+            self.time_us        # self.time_dom as sorted int64 array of microseconds since 1970
             self.time_dec_days  # self.time converted to mono rising decimal days
             self.time_seconds   # self.time converted to mono rising seconds
             self.center_time    # time around which data in a subset it centered
             self.start_dto      # datetime_object that mono rising times start from
+            self.mono_start     # start_dto of the top level time_series, for "decimal_days"
+            self.bin_keys       # cache of integer time keys used by group_bins, by fmt
 
             self.subsets        # object list containing constituent time_seires
+            self.parent         # the time_series this one is a subset of
+            self.row_index      # slice or index array of rows in parent, if a subset view
 
             self.row_data       # row wise dataset
             self.col_data       # column wise dataset, built as dict
+            self.col_valid      # validity mask of col_data in columnar mode
+            self.columnar       # True if data is stored in columnar mode
 
             self.bad_rows       # subset from data attribute with "bad rows"
 
@@ -81,16 +102,23 @@ class time_series():
         self.time_col       = 0           # index of data column with time info (int)
         self.time           = []          # separate copy of data[time_col] (list of strings)
         self.time_dom       = False       # self.time converted to (list of datetime objs)
+        self.time_us        = None        # self.time_dom as (sorted numpy int64 microseconds since 1970)
         self.time_dec_days  = []          # self.time converted to (mono rising decimal days floats)
         self.time_seconds   = []          # self.time converted to (mono rising seconds floats)
         self.center_time    = []          # time around which data in a subset it centered (dto)
         self.start_dto      = []          # datetime_object that mono rising times start from (dto)
+        self.mono_start     = None        # start_dto of the top level time_series, for "decimal_days" (dto)
+        self.bin_keys       = {}          # cache of integer time keys used by group_bins (dict of numpy arrays)
         self.mean_interval  = 0           # average number of seconds between data points (float)
 
         self.subsets        = []          # object list containing constituent time_series
+        self.parent         = parent      # the time_series this one is a subset of
+        self.row_index      = None        # rows of parent in this subset view (slice or numpy int array)
 
         self.row_data       = []          # row wise dataset
         self.col_data       = []          # column wise dataset, built as dict
+        self.col_valid      = None        # validity mask of col_data in columnar mode (2d numpy bool)
+        self.columnar       = False       # True if data is stored in columnar mode (bool)
 
         self.bad_rows       = []          # subset from data attribute with "bad rows"
 
@@ -104,6 +132,25 @@ class time_series():
         return
 
 
+    # attributes of subset views that are built from the parent when first accessed
+    VIEW_DATA_ATTS = ["row_data", "col_data", "col_valid"]
+    VIEW_TIME_ATTS = ["time", "time_dom", "time_us", "time_seconds", "time_dec_days"]
+
+    def __getattr__(self, name):
+        """ resolves the data and time attributes of subset views from their parent """
+
+        if self.__dict__.get("row_index") is not None:
+            if name in self.VIEW_DATA_ATTS:
+                self._resolve_data()
+                return self.__dict__[name]
+
+            if name in self.VIEW_TIME_ATTS:
+                self._resolve_time()
+                return self.__dict__[name]
+
+        raise AttributeError(name)
+
+
     def __getitem__(self, arg):
         """
         allows subsets of the time series to be accessed as follows, for example:
@@ -139,9 +186,9 @@ class time_series():
                 return [self.subsets[x] for x in range(a,b)]
 
             else:
-                if b > len(self.row_data):
-                    b = len(self.row_data)
-                return [self.row_data[x] for x in range(a,b)]
+                if b > self._num_rows():
+                    b = self._num_rows()
+                return [self._row(x) for x in range(a,b)]
 
         # allows finding subsets or rows by index.
         elif isinstance(arg, int):
@@ -149,7 +196,7 @@ class time_series():
                 return self.subsets[arg]
 
             else:
-                return list(self.row_data[arg])
+                return self._row(arg)
 
         # allows finding subsets by name.
         elif isinstance(arg, str):
@@ -179,6 +226,7 @@ class time_series():
         self.time_col       = parent_time_series.time_col
         self.time_header    = parent_time_series.time_header
         self.disc_level     = parent_time_series.disc_level + 1
+        self.columnar       = parent_time_series.columnar
         return
 
 
@@ -233,11 +281,17 @@ class time_series():
         """  special case of "extract_column" method for time domain. """
 
         self.time_header = time_header
+
+        # subset views take their time strings from the parent
+        if self._is_view():
+            self._drop_cache(time_only = True)
+            return self.time
+
         self.build_col_data()
 
         if time_header in self.headers:
                 self.time_col   = self.headers.index(time_header)
-                self.time       = self.col_data[time_header]
+                self.time       = self._col_strings(time_header)
         else:
             raise LookupError("Time header not in dataset!")
 
@@ -379,15 +433,23 @@ class time_series():
         :param new_header_name: new name of that header
         """
 
+        # subset views share headers with their parent, so they are copied out first
+        if self._is_view():
+            self._detach()
+
         if header_name in self.headers:
             self.headers[self.headers.index(header_name)] = new_header_name
             
             self.col_data[new_header_name] = self.col_data[header_name]
             del self.col_data[header_name]
 
+        # subset views already see the new header, and only need to forget old columns
         if self.subsetted:
             for subset in self.subsets:
-                subset.rename_header(header_name, new_header_name)
+                if subset._is_view():
+                    subset._refresh()
+                else:
+                    subset.rename_header(header_name, new_header_name)
             
         return
 
@@ -399,10 +461,15 @@ class time_series():
         :param tdo:     a dnppy.text_data_class object containing time data
         """
 
-        self.headers  = tdo.headers
-        self.enf_unique_headers()
-        
-        self.row_data = tdo.row_data
+        self.headers  = textio.text_data._enf_unique_headers(tdo.headers)
+
+        if getattr(tdo, "columnar", False):
+            self.columnar  = True
+            self.row_data  = None
+            self.col_data  = tdo.col_data
+            self.col_valid = tdo.col_valid
+        else:
+            self.row_data = tdo.row_data
 
         self.build_col_data()
         return
@@ -434,17 +501,22 @@ class time_series():
         """
 
         # disallow overwriting the csv used as input. Added by request
-        if os.path.abspath(self.infilepath) == os.path.abspath(csv_path):
+        if self.infilepath and os.path.abspath(self.infilepath) == os.path.abspath(csv_path):
             csv_path = csv_path.replace(".csv", "_out.csv")
 
-        print("Saved time series '{0}' with {1} rows and {2} columns".format(
-                                    self.name, len(self.row_data), len(self.col_data)))
+        tdo = textio.text_data(headers = self.headers)
+
+        if self.columnar:
+            tdo.columnar  = True
+            tdo.col_data  = self.col_data
+            tdo.col_valid = self.col_valid
+        else:
+            tdo.row_data  = self.row_data
 
-        tdo = textio.text_data( text_filepath   = csv_path,
-                                headers         = self.headers,
-                                row_data        = self.row_data)
+        tdo.write_csv(csv_path)
 
-        tdo.write_csv()
+        print("Saved time series '{0}' with {1} rows and {2} columns".format(
+                                    self.name, self._num_rows(), len(self.headers)))
         return
 
 
@@ -470,6 +542,10 @@ class time_series():
     def build_col_data(self):
         """ builds columnwise data matrix with an actual dict """
 
+        # columnar data is always stored column wise
+        if self.columnar:
+            return
+
         temp_col = zip(*self.row_data)
 
         self.col_data = {}
@@ -478,6 +554,328 @@ class time_series():
         return
 
 
+    def to_columnar(self):
+        """
+        Converts this time_series and all of its subsets to columnar mode, where each
+        column is stored as a typed numpy array and invalid entries (such as "***")
+        are tracked in the shared ``col_valid`` mask. see ``textio.typed_columns``.
+        """
+
+        if self._is_view() and not self.parent.columnar:
+            self._detach()
+
+        if self._is_view():
+            self.columnar = True
+            self._drop_cache()
+
+        elif not self.columnar and self.headers:
+            self.col_data, self.col_valid = textio.typed_columns(self.headers, self.row_data)
+            self.row_data = None
+            self.columnar = True
+
+        if self.subsetted:
+            for subset in self.subsets:
+                subset.to_columnar()
+        return
+
+
+    def to_rows(self):
+        """
+        Converts this time_series and all of its subsets from columnar mode back to
+        lists of rows. Invalid entries become empty strings.
+        """
+
+        if self._is_view() and self.parent.columnar:
+            self._detach()
+
+        if self._is_view():
+            self.columnar = False
+            self._drop_cache()
+
+        elif self.columnar:
+            self.row_data = [self._row(i) for i in range(self._num_rows())]
+            self.columnar = False
+            self.col_valid = None
+            self.build_col_data()
+
+        if self.subsetted:
+            for subset in self.subsets:
+                subset.to_rows()
+        return
+
+
+    def _num_rows(self):
+        """ returns the number of rows in this time_series """
+
+        if self._is_view():
+            if isinstance(self.row_index, slice):
+                return self.row_index.stop - self.row_index.start
+            return len(self.row_index)
+
+        if self.columnar:
+            return len(self.col_valid)
+        return len(self.row_data)
+
+
+    def _row(self, index):
+        """ returns a single row of data as a list """
+
+        if self._is_view():
+            return self.parent._row(self._parent_rows(index))
+
+        if self.columnar:
+            return textio.columnar_row(self.headers, self.col_data, self.col_valid, index)
+
+        return list(self.row_data[index])
+
+
+    def _col_strings(self, col_header):
+        """ returns a column as a list of strings """
+
+        if self.columnar:
+            return [str(value) for value in self.col_data[col_header].tolist()]
+        return self.col_data[col_header]
+
+
+    def _take(self, index):
+        """
+        returns the data in the rows selected by index, in the storage format of
+        this time_series, for passing to ``_put`` of a new time_series.
+
+        :param index:   a slice, or numpy array of integer row indices
+        """
+
+        if self._is_view():
+            return self.parent._take(self._parent_rows(index))
+
+        if self.columnar:
+            col_data = dict((header, self.col_data[header][index]) for header in self.headers)
+            return col_data, self.col_valid[index]
+
+        if isinstance(index, slice):
+            return self.row_data[index]
+        return [self.row_data[i] for i in index]
+
+
+    def _put(self, data):
+        """ sets the data of this time_series from the output of ``_take`` """
+
+        if self.columnar:
+            self.row_data = None
+            self.col_data, self.col_valid = data
+        else:
+            self.row_data = data
+            self.build_col_data()
+        return
+
+
+    def _select(self, index):
+        """
+        keeps only the rows selected by index, in that order. Subset views of this
+        time_series first copy their rows out of it, so they are not changed.
+
+        :param index:   a slice, or list or numpy array of integer row indices
+        """
+
+        for subset in self.subsets:
+            subset._detach()
+
+        if self._is_view():
+            self.row_index = self._parent_rows(numpy.arange(self._num_rows())[index])
+            self._drop_cache()
+        else:
+            self._put(self._take(index))
+        return
+
+
+    def _view(self, parent, row_index, start_date = False):
+        """
+        makes this time_series a subset view of the rows of a parent time_series.
+        Data and time attributes are built from the parent when first accessed.
+
+        :param parent:      the parent time_series, with time already defined
+        :param row_index:   slice or sorted numpy int array of rows in the parent
+        :param start_date:  The date to count up from.
+        """
+
+        self.parent     = parent
+        self.row_index  = row_index
+        self.columnar   = parent.columnar
+        self._drop_cache()
+        self._view_time(start_date)
+        return
+
+
+    def _is_view(self):
+        """ returns True if this time_series is a subset view of its parent """
+
+        return self.__dict__.get("row_index") is not None
+
+
+    def _parent_rows(self, index):
+        """
+        converts row indices of this subset view into row indices of its parent
+
+        :param index:   an int, slice, or list or numpy array of integer row indices
+        """
+
+        if isinstance(index, (int, numpy.integer)):
+            if index < 0:
+                index += self._num_rows()
+            if isinstance(self.row_index, slice):
+                return self.row_index.start + int(index)
+            return int(self.row_index[index])
+
+        if isinstance(self.row_index, slice):
+            if isinstance(index, slice) and index.step is None:
+                start, stop, step = index.indices(self._num_rows())
+                return slice(self.row_index.start + start, self.row_index.start + stop)
+            return numpy.arange(self.row_index.start, self.row_index.stop)[index]
+
+        return self.row_index[index]
+
+
+    def _view_time(self, start_date = False):
+        """
+        sets the start date and time span of a subset view from the time
+        domain of its parent, without parsing any time strings.
+
+        :param start_date:  The date to count up from.
+        """
+
+        time_s = self.parent.time_dom[self._parent_rows(0)]
+        time_f = self.parent.time_dom[self._parent_rows(-1)]
+
+        if isinstance(start_date, str):
+            start = datetime.strptime(start_date, self.fmt)
+        elif isinstance(start_date, datetime):
+            start = start_date
+        else:
+            start = datetime(time_s.year, time_s.month, time_s.day, 0,0,0,0)
+
+        self._drop_cache(time_only = True)
+        self.start_dto      = start
+        self.span           = time_f - time_s
+        self.mean_interval  = self.span.total_seconds()/self._num_rows()
+        return
+
+
+    def _resolve_time(self):
+        """ builds the time attributes of a subset view from those of its parent """
+
+        parent = self.parent
+        rows = self._parent_rows(slice(0, self._num_rows()))
+
+        def pick(values):
+            if isinstance(rows, slice):
+                return values[rows]
+            return [values[i] for i in rows]
+
+        offset = (parent.start_dto - self.start_dto).total_seconds()
+
+        self.time           = pick(parent.time)
+        self.time_dom       = pick(parent.time_dom)
+        self.time_us        = parent.time_us[rows]
+        self.time_seconds   = [seconds + offset for seconds in pick(parent.time_seconds)]
+        self.time_dec_days  = [float(seconds / 86400) for seconds in self.time_seconds]
+        return
+
+
+    def _resolve_data(self):
+        """ builds the data attributes of a subset view from those of its parent """
+
+        data = self.parent._take(self._parent_rows(slice(0, self._num_rows())))
+
+        if self.columnar:
+            self.row_data = None
+            self.col_data, self.col_valid = data
+        else:
+            self.row_data  = data
+            self.col_valid = None
+            self.build_col_data()
+        return
+
+
+    def _drop_cache(self, time_only = False):
+        """ forgets attributes of a subset view that were built from its parent """
+
+        names = self.VIEW_TIME_ATTS
+        if not time_only:
+            names = names + self.VIEW_DATA_ATTS
+
+        for name in names:
+            self.__dict__.pop(name, None)
+
+        self.bin_keys = {}
+        return
+
+
+    def _refresh(self):
+        """ forgets all cached attributes of this subset view and its subset views """
+
+        if self._is_view():
+            self._drop_cache()
+
+        for subset in self.subsets:
+            subset._refresh()
+        return
+
+
+    def _detach(self):
+        """
+        copies the rows and headers of a subset view out of its parent, so it may
+        be modified without affecting the parent. Subset views of this subset then
+        share its copy of the headers.
+        """
+
+        if not self._is_view():
+            return
+
+        # resolve time attributes while the parent is still available
+        for name in self.VIEW_TIME_ATTS:
+            getattr(self, name)
+
+        data = self._take(slice(0, self._num_rows()))
+        if self.parent.columnar:
+            col_data, col_valid = data
+            data = (dict((header, col.copy()) for header, col in col_data.items()), col_valid.copy())
+        else:
+            data = [list(row) for row in data]
+
+        self.columnar   = self.parent.columnar
+        self.mono_start = self.parent._mono_start()
+        self.row_index  = None
+        self._put(data)
+
+        self.headers = list(self.headers)
+        self._share_headers()
+        return
+
+
+    def _mono_start(self):
+        """
+        returns the date that the "decimal_days" column of ``add_mono_time`` counts from.
+        This is the start of the top level time_series, so that subsets agree with it
+        whether or not they have been copied out of their parent.
+        """
+
+        if self._is_view():
+            return self.parent._mono_start()
+        if self.mono_start is not None:
+            return self.mono_start
+        return self.start_dto
+
+
+    def _share_headers(self):
+        """ points the headers of subset views of this time_series at its own headers """
+
+        for subset in self.subsets:
+            if subset._is_view():
+                subset.headers = self.headers
+                subset._share_headers()
+        return
+
+
     def clean(self, col_header, high_thresh = False, low_thresh = False):
         """
         Removes rows where the specified column has an invalid number
@@ -500,29 +898,32 @@ class time_series():
                 raise LookupError("{0} header not in dataset!".format(col_header))
 
             col_index = self.headers.index(col_header)
-            temp_data = self.row_data
-            self.row_data = []
 
+            if self.columnar:
+                self._clean_columnar(col_header, high_thresh, low_thresh)
+                return
+
+            keep = []
             bad_count = 0
-            for row in temp_data:
+            for i, row in enumerate(self.row_data):
 
                 try:
                     test = float(row[col_index])
                     
                     if   high_thresh == False and low_thresh == False:
-                        self.row_data.append(row)
+                        keep.append(i)
                         
                     elif high_thresh == False and low_thresh != False:
                         if test >= low_thresh:
-                            self.row_data.append(row)
+                            keep.append(i)
 
                     elif high_thresh != False and low_thresh == False:
                         if test <= high_thresh:
-                            self.row_data.append(row)
+                            keep.append(i)
                         
                     elif high_thresh != False and low_thresh != False:
                         if test >= low_thresh and test <= high_thresh:
-                            self.row_data.append(row)
+                            keep.append(i)
                             
                 except:
                     bad_count += 1
@@ -532,10 +933,11 @@ class time_series():
             if bad_count >0:
                 print("Removed {0} rows from '{1}' with invalid '{2}'".format(
                     bad_count, self.name, col_header))
-                
 
-            # since rows have been removed, we must redefine the time domain. (sloppy, but concise)
-            self.define_time(self.time_header, self.fmt, self.start_dto)
+            # since rows have been removed, we must redefine the time domain.
+            if len(keep) < self._num_rows():
+                self._select(keep)
+                self.define_time(self.time_header, self.fmt, self.start_dto)
 
             if self.subsetted:
                 for subset in self.subsets:
@@ -543,6 +945,45 @@ class time_series():
         return
 
 
+    def _clean_columnar(self, col_header, high_thresh = False, low_thresh = False):
+        """ columnar mode version of ``clean`` """
+
+        col_index = self.headers.index(col_header)
+        keep = self.col_valid[:, col_index].copy()
+
+        # text columns can only be cleaned if they are numbers
+        values = self.col_data[col_header]
+        if values.dtype.kind in "SUa":
+            for j, value in enumerate(values):
+                try:    float(value)
+                except ValueError: keep[j] = False
+            values = numpy.where(keep, values, "0").astype("float64")
+
+        bad = numpy.nonzero(~keep)[0]
+        bad_count = len(bad)
+
+        if high_thresh != False:
+            keep &= (values <= high_thresh)
+        if low_thresh != False:
+            keep &= (values >= low_thresh)
+
+        if bad_count > 0:
+            self.bad_rows += [self._row(j) for j in bad]
+            print("Removed {0} rows from '{1}' with invalid '{2}'".format(
+                bad_count, self.name, col_header))
+
+        if not keep.all():
+            self._select(numpy.nonzero(keep)[0])
+
+            # since rows have been removed, we must redefine the time domain.
+            self.define_time(self.time_header, self.fmt, self.start_dto)
+
+        if self.subsetted:
+            for subset in self.subsets:
+                subset.clean(col_header)
+        return
+
+
     def rebuild(self, destroy_subsets = False):
         """
         Reconstructs the time series from its constituent subsets
@@ -558,12 +999,28 @@ class time_series():
                 subset.rebuild(destroy_subsets)
 
         else:
-            if self.subsetted:
+            if self.subsetted and all(subset._is_view() for subset in self.subsets):
+                rows = numpy.concatenate([numpy.arange(self._num_rows())[subset.row_index]
+                                          for subset in self.subsets])
+                if destroy_subsets:
+                    self.subsets = []
+                self._select(rows)
+
+            elif self.subsetted and self.columnar:
+                col_data = {}
+                for header in self.headers:
+                    col_data[header] = numpy.concatenate(
+                        [subset.col_data[header] for subset in self.subsets])
+                col_valid = numpy.concatenate([subset.col_valid for subset in self.subsets])
+                self._put((col_data, col_valid))
+
+            elif self.subsetted:
                 self.row_data = []
                 for subset in self.subsets:
                     for row in subset.row_data:
                         self.row_data.append(row)
 
+            if self.subsetted:
                 self.define_time(self.time_header, self.fmt)
 
         if destroy_subsets:
@@ -584,6 +1041,41 @@ class time_series():
 
         new_header  = "_".join([header1, header2])
 
+        # subset views just pick up the new column from their parent
+        if self._is_view() and new_header in self.parent.col_data:
+            self._drop_cache()
+
+        else:
+            self._detach()
+
+            if self.columnar:
+                if new_header not in self.col_data:
+                    valid1 = self.col_valid[:, self.headers.index(header1)]
+                    valid2 = self.col_valid[:, self.headers.index(header2)]
+                    first  = numpy.where(valid1, self._col_strings(header1), "")
+                    second = numpy.where(valid2, self._col_strings(header2), "")
+
+                    self.col_data[new_header] = numpy.char.add(first, second)
+                    self.col_valid = numpy.column_stack(
+                        [self.col_valid, numpy.ones(len(first), dtype = "bool")])
+
+                    if new_header not in self.headers:
+                        self.headers.append(new_header)
+
+            else:
+                self._merge_rows(header1, header2, new_header)
+
+            print("merged '{0}' and '{1}' columns into new column '{2}'".format(header1, header2, new_header))
+
+        if self.subsetted:
+            for subset in self.subsets:
+                subset.merge_cols(header1, header2)
+        return
+
+
+    def _merge_rows(self, header1, header2, new_header):
+        """ row mode version of ``merge_cols`` """
+
         for i, entry in enumerate(self.row_data):
                 new_field   = "".join([self.col_data[header1][i], self.col_data[header2][i]])
 
@@ -592,12 +1084,6 @@ class time_series():
         # updates column and row data
         self.headers.append(new_header)
         self.build_col_data()
-
-        print("merged '{0}' and '{1}' columns into new column '{2}'".format(header1, header2, new_header))
-
-        if self.subsetted:
-            for subset in self.subsets:
-                subset.merge_cols(header1, header2)
         return
 
 
@@ -625,6 +1111,20 @@ class time_series():
         if isinstance(time_header, int):
             time_header = self.headers[time_header]
 
+        # convert datestamps into datetime64 times, in bulk where possible
+        try:
+            time_us = parse_times(self.time, fmt)
+
+        # If error, give user information about the line on which the error occurs
+        except ValueError:
+            for i, datestamp in enumerate(self.time):
+                try:
+                    datetime.strptime(datestamp, fmt)
+                except:
+                    raise Exception("Input '{0}' in line {1} is not of format {2}".format(
+                                    datestamp, i+2 , fmt))
+            raise
+
         # use manual start date (str or dto) or set to begining of first day on record
         if isinstance(start_date, str):
             start = datetime.strptime(start_date, fmt)
@@ -633,33 +1133,19 @@ class time_series():
             start = start_date
 
         else:
-            earliest = datetime.strptime(self.time[0], fmt)
+            earliest = time_us[0].astype(object)
             start = datetime(earliest.year, earliest.month, earliest.day, 0,0,0,0)
 
-        # convert datestamps into datetime objects
-        datestamp_list      = self.time
-        
-        self.time_dom       = []
-        self.time_dec_days  = []
-        self.time_seconds   = []
-
-        for i,datestamp in enumerate(datestamp_list):
-
-            # If error, give user information about the line on which the error occurs
-            try:
-                t = datetime.strptime(datestamp, fmt)
-            except:
-                raise Exception("Input '{0}' in line {1} is not of format {2}".format(
-                                datestamp, i+2 , fmt))
-            
-            # initial absolute time ordering to help with sorting.
-            self.time_dom.append(t)
-            delta = t - start
-            delta = float(delta.total_seconds())
-            self.time_seconds.append(float(delta))
-            self.time_dec_days.append(float(delta / 86400))
+        # initial absolute time ordering to help with sorting.
+        self.time_us        = time_us.astype("int64")
+        self.time_dom       = time_us.astype(object).tolist()
+
+        seconds = (self.time_us - numpy.datetime64(start, "us").astype("int64")) / 1e6
+        self.time_seconds   = seconds.tolist()
+        self.time_dec_days  = (seconds / 86400).tolist()
 
         self.start_dto = start
+        self.bin_keys  = {}
         return
 
         
@@ -681,20 +1167,32 @@ class time_series():
         :param start_date:  The date to count up from.
         """
 
+        # subset views take their time domain from the parent without parsing
+        if self._is_view() and (time_header, fmt) == (self.parent.time_header, self.parent.fmt):
+            self._view_time(start_date)
+
+            if self.subsetted:
+                for subset in self.subsets:
+                    subset.define_time(time_header, fmt)
+            return
+
+        self._detach()
+
         # build time vectors for the first time
         self._build_time(time_header, fmt, start_date)
         
         # sort data such that it is in ascending order by time.
-        sorted_rows = range(len(self.row_data))
-        indices     = range(len(self.row_data))
-        indices     = sorted(indices, key = self.time_seconds.__getitem__)
-        
-        for i,j in enumerate(indices):
-            sorted_rows[i] = self.row_data[j]
+        indices     = numpy.argsort(self.time_us, kind = "mergesort")
+        if (indices != numpy.arange(self._num_rows())).any():
+            self._select(indices)
+
+        # keep time vectors in the same order as the rows
+        self.time           = [self.time[j] for j in indices]
+        self.time_dom       = [self.time_dom[j] for j in indices]
+        self.time_seconds   = [self.time_seconds[j] for j in indices]
+        self.time_dec_days  = [self.time_dec_days[j] for j in indices]
+        self.time_us        = self.time_us[indices]
 
-        self.row_data = sorted_rows
-        self.build_col_data()
-        
         # recalculate time domain information now that rows are in proper order
         if min(self.time_seconds) < 0:
             self._build_time(time_header, fmt, start_date)
@@ -832,36 +1330,56 @@ class time_series():
                 uend    = self._center_datetime(time_f, subset_units) + timedelta(seconds = step_width)
 
 
-            # Iterate through entire dataset one time step unit at a time.
-            delta = uend - ustart
-            center_time = ustart
+            # find the center time and window half width of every subset
+            center_times = []
+            wind_us      = []
+            center_time  = ustart
 
             while center_time < uend:
-                
                 step_width   = self._units_to_seconds(subset_units, center_time)
                 wind_seconds = step_width * (overlap_width + 0.5)
 
-                temp_data = []
-                for j, current_time in enumerate(self.time_dom):
-                    dt = abs(center_time - current_time)
-                    
-                    if dt.total_seconds() < wind_seconds:
-                        temp_data.append(self.row_data[j])
+                center_times.append(center_time)
+                wind_us.append(int(round(wind_seconds * 1e6)))
+
+                center_time += timedelta(seconds = step_width)
+
+            # find rows within each window with range queries on the sorted time domain
+            center_us = numpy.array(center_times, dtype = "datetime64[us]").astype("int64")
+            wind_us   = numpy.array(wind_us, dtype = "int64")
+
+            starts = numpy.searchsorted(self.time_us, center_us - wind_us, side = "right")
+            stops  = numpy.searchsorted(self.time_us, center_us + wind_us, side = "left")
+
+            for center_time, start, stop in zip(center_times, starts, stops):
 
                 # create the subset only if some data was found to populate it
-                if len(temp_data) > 0:
-                    new_subset = time_series(units = subset_units, parent = self)
+                if stop > start:
+                    new_subset = self.__class__(units = subset_units, parent = self)
                     new_subset.center_time = center_time
-                    new_subset.from_list(temp_data, self.headers, self.time_header, self.fmt)
-                    new_subset.define_time(self.time_header, self.fmt)
+                    new_subset._view(self, slice(int(start), int(stop)))
                     new_subset._name_as_subset()
                     self.subsets.append(new_subset)
 
-                center_time += timedelta(seconds = step_width)
-
         return
 
 
+    def _bin_keys(self, fmt):
+        """
+        returns ``int(time_dom[i].strftime(fmt))`` for every row as a numpy array.
+        Keys are cached for each fmt, and subset views take them from their parent.
+        """
+
+        if fmt not in self.bin_keys:
+            if self._is_view():
+                rows = self._parent_rows(slice(0, self._num_rows()))
+                self.bin_keys[fmt] = self.parent._bin_keys(fmt)[rows]
+            else:
+                self.bin_keys[fmt] = time_keys(self.time_us, fmt)
+
+        return self.bin_keys[fmt]
+
+
     def group_bins(self, fmt_units, overlap_width = 0, cyclical = True):
         """
         Sorts the time series into time chunks by common bin_unit
@@ -910,32 +1428,30 @@ class time_series():
             if fmt == "%b": cylen = 12
 
             # initialize a grouping array to idenfity row indices for each subset
-            grouping  = [int(obj.strftime(fmt)) for obj in self.time_dom]
+            grouping  = self._bin_keys(fmt)
             
-            for i in xrange(min(grouping),max(grouping) + 1):
+            for i in xrange(grouping.min(), grouping.max() + 1):
 
                 subset_units    = self._fmt_to_units(fmt)
-                new_subset      = time_series( units = subset_units, parent = self)
+                new_subset      = self.__class__(units = subset_units, parent = self)
 
                 # only take rows whos grouping is within ow of i
-                subset_rows = [j for j,g in enumerate(grouping) if g <= i+ow and g >=i-ow]
+                in_bin = (grouping <= i+ow) & (grouping >= i-ow)
 
                 # fix endpoints
                 if cyclical:
                     if i <= ow:
-                        subset_rows = subset_rows + [j for j,g in enumerate(grouping) if g-cylen <= i+ow and g-cylen >=i-ow]
+                        in_bin |= (grouping-cylen <= i+ow) & (grouping-cylen >= i-ow)
                     elif i >= cylen - ow:
-                        subset_rows = subset_rows + [j for j,g in enumerate(grouping) if g+cylen <= i+ow and g+cylen >=i-ow]
+                        in_bin |= (grouping+cylen <= i+ow) & (grouping+cylen >= i-ow)
 
-                # grab row indeces from parent matrix to put in the subset
-                subset_data = [self.row_data[row] for row in subset_rows]
+                subset_rows = numpy.nonzero(in_bin)[0]
 
-                # run naming methods and definitions on the new subset
-                if not len(subset_data) == 0:
-                    new_subset.from_list(subset_data, self.headers, self.time_header, self.fmt)
-                    new_subset.define_time(self.time_header, self.fmt)
-                    
-                    new_subset.center_time = self.time_dom[grouping.index(i)]
+                # point the new subset at its rows of the parent, then name it
+                if not len(subset_rows) == 0:
+                    new_subset._view(self, subset_rows)
+
+                    new_subset.center_time = self.time_dom[numpy.nonzero(grouping == i)[0][0]]
                     new_subset._name_as_subset(binned = True)
 
                     self.subsets.append(new_subset)
@@ -967,7 +1483,10 @@ class time_series():
         import numpy as np
 
         self.clean(col_header)
-        col_data = map(float, self.col_data[col_header])
+        if self.columnar:
+            col_data = self.col_data[col_header].astype("float64").tolist()
+        else:
+            col_data = map(float, self.col_data[col_header])
 
         # build array of stats
         stats = [max(col_data),
@@ -1091,6 +1610,7 @@ class time_series():
         
         # make sure data is cleaned for numerical formatting
         self.clean(col_header)
+        self._detach()
         temp_col = self.col_data[col_header]
         temp_col = map(float, temp_col)
 
@@ -1099,8 +1619,12 @@ class time_series():
         maxval   = max(temp_col)
 
         c = self.headers.index(col_header)
-        for i,row in enumerate(self.row_data):
-            self.row_data[i][c] = (float(row[c]) - minval) / (maxval - minval)
+        if self.columnar:
+            temp_col = self.col_data[col_header].astype("float64")
+            self.col_data[col_header] = (temp_col - minval) / (maxval - minval)
+        else:
+            for i,row in enumerate(self.row_data):
+                self.row_data[i][c] = (float(row[c]) - minval) / (maxval - minval)
 
         print("data in column '{0}' has been normalized!".format(col_header))
 
@@ -1111,16 +1635,39 @@ class time_series():
 
 
     def add_mono_time(self):
-        """ Adds a monotonically increasing time column with units of decimal days """
+        """
+        Adds a monotonically increasing time column with units of decimal days. Days
+        are counted from the start of the top level time_series, so every subset has
+        the same values as its parent, even after rows are removed by ``clean``.
+        """
 
-        # add an entry to every row item in row_data, then rebuild column data
-        if "decimal_days" not in self.headers:
-            self.headers.append("decimal_days")
-            
-            for i, row in enumerate(self.row_data):
-                self.row_data[i].append(self.time_dec_days[i])
+        # subset views just pick up the new column from their parent
+        if self._is_view() and "decimal_days" in self.parent.col_data:
+            self._drop_cache()
 
-        self.build_col_data()
+        else:
+            self._detach()
+
+            start = numpy.datetime64(self._mono_start(), "us").astype("int64")
+            decimal_days = (self.time_us - start) / 86400e6
+
+            # in columnar mode, add a new array and validity column instead
+            if self.columnar:
+                if "decimal_days" not in self.col_data:
+                    self.col_data["decimal_days"] = decimal_days
+                    self.col_valid = numpy.column_stack(
+                        [self.col_valid, numpy.ones(self._num_rows(), dtype = "bool")])
+                    if "decimal_days" not in self.headers:
+                        self.headers.append("decimal_days")
+
+            # add an entry to every row item in row_data, then rebuild column data
+            elif "decimal_days" not in self.headers:
+                self.headers.append("decimal_days")
+
+                for i, row in enumerate(self.row_data):
+                    self.row_data[i].append(decimal_days[i].item())
+
+            self.build_col_data()
 
         if self.subsetted:
             for subset in self.subsets:
@@ -1147,6 +1694,9 @@ class time_series():
         y = self.col_data[col_header]
         x = self.time_seconds
 
+        if self.columnar:
+            y = y.astype("float64")
+
         if not isinstance(time_obj, datetime):
             time_obj = datetime.strptime(time_obj, self.fmt)
 